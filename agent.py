@@ -1,4 +1,6 @@
 from retriever import OllamaRetriever
+from utils.summarizer import summarize, summarize_chunks
+from metrics import span, log
 
 class ResearchAgent:
     def __init__(self):
@@ -6,25 +8,47 @@ class ResearchAgent:
         print("🤖 Research Agent initialized with Ollama embeddings")
 
     def run(self, query: str):
-        print(f"🔍 Processing query: {query}")
+        log(f"🔍 Processing query: {query}")
         
+        with span("agent_seconds", stage="total"):
+            return self._run(query)
+
+    def _run(self, query):
         # Get relevant documents
-        results = self.retriever.search(query, top_k=5)
-        
+        with span("agent_seconds", stage="retrieve"):
+            results = self.retriever.search(query, top_k=5)
+        return self.compose(query, results)
+
+    def compose(self, query, results):
+        """Build the research answer for `query` from retrieved results"""
         if not results:
             return "❌ No relevant documents found for your query."
         
         # Format the response
-        reasoning = f"📋 **Query**: {query}\n\n"
-        reasoning += f"🔍 **Found {len(results)} relevant document chunks:**\n\n"
-        
-        for i, result in enumerate(results, 1):
-            score = result['score']
-            text = result['text']
+        with span("agent_seconds", stage="format"):
+            reasoning = f"📋 **Query**: {query}\n\n"
+            reasoning += f"🔍 **Found {len(results)} relevant document chunks:**\n\n"
             
-            reasoning += f"**📄 Result {i}** (Relevance: {score:.3f})\n"
-            reasoning += f"{text}\n\n"
-            reasoning += "---\n\n"
+            for i, result in enumerate(results, 1):
+                score = result['score']
+                text = result['text']
+                
+                reasoning += f"**📄 Result {i}** (Relevance: {score:.3f})\n"
+                reasoning += f"{text}\n\n"
+                reasoning += "---\n\n"
+        
+        # Summarize from the term statistics stored at ingest time when available
+        with span("agent_seconds", stage="summarize"):
+            lexical = self.retriever.lexical_index()
+            summary = ""
+            if lexical is not None:
+                # Merged passages summarize every chunk they cover
+                ids = [i for result in results for i in result.get('ids', [result['id']])]
+                summary = summarize_chunks(lexical, ids)
+            if not summary:
+                summary = summarize([result['text'] for result in results])
+        if summary:
+            reasoning += f"📝 **Summary**: {summary}\n\n"
         
         # Add simple reasoning
         reasoning += "🧠 **Analysis**: "
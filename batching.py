@@ -0,0 +1,161 @@
+import time
+import threading
+from itertools import islice
+import numpy as np
+from config import (
+    EMBED_BATCH_SIZE, EMBED_MIN_BATCH_SIZE, EMBED_TARGET_SECONDS, EMBED_DIM,
+    INSERT_TARGET_BYTES, INSERT_MIN_BYTES, INSERT_TARGET_SECONDS, INSERT_MAX_DELAY,
+)
+from vector_store import METADATA_FIELDS
+from metrics import METRICS, log
+
+METADATA_BYTES = 64  # Rough per-row payload of the metadata columns and primary key
+
+
+class BatchSizer:
+    """
+    Embedding batch size from measured latency.
+    Keeps an exponential moving average of the seconds per text and sizes
+    batches so one request takes about `target_seconds`, between `minimum`
+    and `maximum` texts. Shared by the embedding workers, so it is locked.
+    """
+
+    def __init__(self, initial=EMBED_BATCH_SIZE, minimum=EMBED_MIN_BATCH_SIZE,
+                 maximum=EMBED_BATCH_SIZE, target_seconds=EMBED_TARGET_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.size = max(minimum, min(maximum, initial))
+        self.per_text = None
+        self.lock = threading.Lock()
+
+    def observe(self, texts, seconds):
+        if not texts:
+            return
+        with self.lock:
+            per_text = seconds / texts
+            self.per_text = per_text if self.per_text is None else 0.8 * self.per_text + 0.2 * per_text
+            if self.per_text > 0:
+                wanted = int(self.target_seconds / self.per_text)
+                self.size = max(self.minimum, min(self.maximum, wanted))
+
+
+def adaptive_batches(iterable, sizer):
+    """Lists of items from `iterable`, each as long as the sizer's current size"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, sizer.size))
+        if not batch:
+            return
+        yield batch
+
+
+class InsertBuffer:
+    """
+    Buffers embedded rows as NumPy columns and inserts them in bulk.
+    Flushes once the payload reaches `target_bytes` or the oldest buffered
+    row is `max_delay` seconds old. The byte target adapts to insert
+    latency: halved when an insert takes over INSERT_TARGET_SECONDS,
+    grown back toward the configured target when inserts are fast.
+    Inserted rows are added to the BM25 index (journaled to its delta, so
+    their texts are not held until the merge) and logged to the
+    IngestCheckpoint when given; rows of a failed insert go to the
+    DeadLetterQueue when given.
+    """
+
+    def __init__(self, store, lexical=None, target_bytes=INSERT_TARGET_BYTES,
+                 max_delay=INSERT_MAX_DELAY, dim=EMBED_DIM, checkpoint=None, dead_letters=None):
+        self.store = store
+        self.lexical = lexical
+        self.checkpoint = checkpoint
+        self.dead_letters = dead_letters
+        self.max_bytes = target_bytes
+        self.target_bytes = target_bytes
+        self.max_delay = max_delay
+        self.vectors = np.empty((1024, dim), dtype=np.float32)
+        self.columns = {field: np.empty(1024, dtype=np.int64) for field in METADATA_FIELDS if field != "source"}
+        self.sources = []
+        self.texts = []
+        self.rows = 0
+        self.bytes = 0
+        self.first_added = None
+        self.stats = {"inserted": 0, "insert_errors": 0, "inserts": 0}
+
+    def _reserve(self, rows):
+        """
+        Grow the column arrays to hold `rows` more rows, doubling their
+        capacity but not past the rows a full buffer can hold, so the
+        arrays stay within about `max_bytes`.
+        """
+        needed = self.rows + rows
+        if needed <= len(self.vectors):
+            return
+        full = self.max_bytes // (self.vectors.shape[1] * 4 + METADATA_BYTES) + 1
+        capacity = max(needed, min(2 * len(self.vectors), full))
+        vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:self.rows] = self.vectors[:self.rows]
+        self.vectors = vectors
+        for field, column in self.columns.items():
+            grown = np.empty(capacity, dtype=np.int64)
+            grown[:self.rows] = column[:self.rows]
+            self.columns[field] = grown
+
+    def add(self, embeddings, texts, metadata):
+        """Buffer rows, inserting when a size or time threshold is reached"""
+        count = len(texts)
+        if not count:
+            return
+        self._reserve(count)
+        end = self.rows + count
+        self.vectors[self.rows:end] = embeddings
+        for field, column in self.columns.items():
+            column[self.rows:end] = metadata[field]
+        self.sources.extend(metadata["source"])
+        self.texts.extend(texts)
+        self.rows = end
+        self.bytes += count * (self.vectors.shape[1] * 4 + METADATA_BYTES) + sum(len(text) for text in texts)
+        if self.first_added is None:
+            self.first_added = time.monotonic()
+        if self.bytes >= self.target_bytes or time.monotonic() - self.first_added >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        """Insert everything buffered; insert failures are counted and reported, not raised"""
+        if not self.rows:
+            return
+        rows, texts = self.rows, self.texts
+        metadata = {field: column[:rows] for field, column in self.columns.items()}
+        metadata["source"] = self.sources
+        started = time.perf_counter()
+        try:
+            ids = self.store.insert(self.vectors[:rows], texts, metadata)
+        except Exception as e:
+            ids = None
+            self.stats["insert_errors"] += 1
+            print(f"  ❌ Error inserting {rows} rows: {e}")
+            if self.dead_letters is not None:
+                self.dead_letters.add(texts, metadata, e)
+        if ids is not None:
+            if self.checkpoint is not None:
+                if self.store.flush_to_commit:
+                    self.store.flush()
+                self.checkpoint.commit(metadata, ids)
+            if self.lexical is not None:
+                self.lexical.add(ids, texts)
+                self.lexical.save(merge=False)
+            self.stats["inserted"] += rows
+            log(f"  ✅ Inserted {rows} rows ({self.stats['inserted']} total)")
+        seconds = time.perf_counter() - started
+        self.stats["inserts"] += 1
+        METRICS.inc("insert_rows_total", rows)
+        METRICS.inc("insert_bytes_total", self.bytes)
+        self._adapt(seconds)
+
+        self.rows, self.bytes, self.first_added = 0, 0, None
+        self.sources, self.texts = [], []
+
+    def _adapt(self, seconds):
+        if seconds > INSERT_TARGET_SECONDS:
+            self.target_bytes = max(INSERT_MIN_BYTES, self.target_bytes // 2)
+        elif seconds < INSERT_TARGET_SECONDS / 2:
+            self.target_bytes = min(self.max_bytes, self.target_bytes * 2)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Reproducible end-to-end benchmark
+Runs chunking, ingest throughput, single-query latency and batch-query
+throughput on a synthetic corpus against the deterministic fake Ollama
+server (fake_ollama.py) and, by default, the in-process local store.
+Results are written as JSON so runs from different commits can be diffed.
+Usage:
+    python3 benchmark.py --output bench.json
+    python3 benchmark.py --docs 200 --queries 500 --compare bench.json
+    python3 benchmark.py --store milvus --ollama-url http://localhost:11434
+    python3 benchmark.py --coarse-dim 256 --fake-embeddings 2
+    python3 benchmark.py --ollama-url http://localhost:11434 --local-model sentence-transformers/all-MiniLM-L6-v2
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import platform
+import argparse
+import subprocess
+import contextlib
+import numpy as np
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBED_BATCH_SIZE, EMBED_WORKERS, EMBED_DIM, VECTOR_DTYPE, COARSE_DIM,
+    COARSE_CANDIDATES, COARSE_MAX_RECALL_LOSS, LOCAL_EMBED_THREADS, LOCAL_EMBED_ONNX,
+)
+
+
+def make_corpus(directory, docs, doc_chars, seed=0):
+    """Write `docs` synthetic text files of about `doc_chars` characters"""
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+                  for _ in range(5000)]
+    sentences = []
+    paths = []
+    for d in range(docs):
+        parts, size = [], 0
+        while size < doc_chars:
+            sentence = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(6, 20))).capitalize() + "."
+            parts.append(sentence)
+            size += len(sentence) + 1
+            if rng.random() < 0.1:
+                parts.append("\n\n")
+        path = os.path.join(directory, f"doc_{d:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(" ".join(parts))
+        paths.append(path)
+        sentences.extend(p for p in parts if p != "\n\n")
+    return paths, sentences
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence progress prints so they do not end up in the timings"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_chunking(paths):
+    from utils.chunker import chunk_file
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    started = time.perf_counter()
+    chunks = sum(1 for path in paths for _ in chunk_file(path, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP))
+    seconds = time.perf_counter() - started
+    return {
+        "files": len(paths),
+        "chunks": chunks,
+        "seconds": seconds,
+        "mb_per_sec": total_bytes / 1e6 / seconds,
+        "chunks_per_sec": chunks / seconds,
+    }
+
+
+def make_store(kind, workdir, dtype, coarse_dim):
+    if kind == "local":
+        from local_store import LocalStore
+        return LocalStore(path=os.path.join(workdir, "local_store"), dtype=dtype, coarse_dim=coarse_dim)
+    from milvus_store import MilvusStore
+    return MilvusStore(collection_name="benchmark_docs")
+
+
+def bench_ingest(paths, store, ollama_url, workers):
+    from ingest import OllamaEmbedder
+    from pipeline import run_pipeline
+    with quiet():
+        embedder = OllamaEmbedder(use_cache=False, base_url=ollama_url, backend="ollama")
+        store.create()
+        stats = run_pipeline(paths, embedder, store, batch_size=EMBED_BATCH_SIZE, workers=workers)
+        store.flush()
+    return {
+        "workers": workers,
+        "chunks": stats["inserted"],
+        "seconds": stats["seconds"],
+        "chunks_per_sec": stats["chunks_per_sec"],
+        "embed_batch_size": stats["embed_batch_size"],
+        "inserts": stats["inserts"],
+    }
+
+
+def bench_storage(store):
+    """Estimated memory per million chunks before (float32, inline text) and after compaction"""
+    from vector_store import memory_per_million
+    storage = {
+        "vector_dtype": store.vector_dtype,
+        "text_out_of_line": store.text_out_of_line,
+        "baseline_mb_per_million": memory_per_million(EMBED_DIM) / 1e6,
+        "mb_per_million": store.memory_per_million() / 1e6,
+    }
+    if store.name == "local" and store.rows:
+        disk = sum(os.path.getsize(os.path.join(store.path, name)) for name in os.listdir(store.path))
+        storage["disk_bytes_per_chunk"] = disk / store.rows
+    return storage
+
+
+def held_out_queries(sentences, count, seed=0):
+    """Query texts that are not in the corpus: halves of two random corpus sentences, joined"""
+    rng = random.Random(seed + 1)
+    corpus = set(sentences)
+    queries = []
+    while len(queries) < count:
+        first, second = (rng.choice(sentences).rstrip(".").split() for _ in range(2))
+        text = " ".join(first[:len(first) // 2] + second[len(second) // 2:]).capitalize() + "."
+        if text not in corpus:
+            queries.append(text)
+    return queries
+
+
+def bench_rerank(store, ollama_url, texts, top_k):
+    """
+    Two-stage search against exact full-dimension search, with held-out
+    query texts: recall@k of the two-stage search, and the latency of both
+    (exact search latency on the local store only).
+    """
+    from embeddings import OllamaEmbeddingClient
+    from tune_index import exact_top_k
+    queries = OllamaEmbeddingClient(base_url=ollama_url).embed(texts)
+    truth = exact_top_k(store, queries, top_k)
+    exact_latencies = []
+    if store.name == "local":
+        for query in queries:
+            started = time.perf_counter()
+            scores = store.scores(query[None])[0]
+            np.argpartition(-scores, top_k - 1)[:top_k]
+            exact_latencies.append(time.perf_counter() - started)
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = store.search(query[None], top_k, with_text=False)[0]
+        latencies.append(time.perf_counter() - started)
+        hits += len(expected & {hit["id"] for hit in found})
+    rerank = {
+        "coarse_dim": store.coarse_dim,
+        "candidates": top_k * COARSE_CANDIDATES,
+        "queries": len(texts),
+        "recall_at_k": hits / max(1, sum(len(expected) for expected in truth)),
+        "two_stage": percentiles(latencies),
+    }
+    if exact_latencies:
+        rerank["full_dim"] = percentiles(exact_latencies)
+    return rerank
+
+
+def bench_queries(store, ollama_url, queries, top_k, batch_size):
+    from retriever import OllamaRetriever
+    with quiet():
+        retriever = OllamaRetriever(use_cache=False, use_result_cache=False, mode="vector",
+                                    base_url=ollama_url, store=store, backend="ollama")
+        # Warm up connections and any lazily loaded state before timing
+        for text in queries[:5]:
+            retriever.search(text, top_k=top_k)
+
+        latencies = []
+        for text in queries:
+            started = time.perf_counter()
+            retriever.search(text, top_k=top_k)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        retriever.search_many(queries, top_k=top_k, batch_size=batch_size)
+        batch_seconds = time.perf_counter() - started
+
+    return {
+        "single": percentiles(latencies),
+        "batch": {
+            "queries": len(queries),
+            "batch_size": batch_size,
+            "seconds": batch_seconds,
+            "queries_per_sec": len(queries) / batch_seconds,
+        },
+    }
+
+
+def bench_embedding(client, texts, queries):
+    """Bulk embedding throughput (texts/s) and single-query embedding latency of one backend"""
+    with quiet():
+        client.warm_up()
+    started = time.perf_counter()
+    client.embed(texts)
+    seconds = time.perf_counter() - started
+    latencies = []
+    for text in queries:
+        started = time.perf_counter()
+        client.embed_one(text)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "backend": client.name,
+        "texts": len(texts),
+        "seconds": seconds,
+        "texts_per_sec": len(texts) / seconds,
+        "query": percentiles(latencies),
+    }
+
+
+def bench_backends(paths, queries, ollama_url, args):
+    """The Ollama path against the in-process backend, on the same chunks and queries"""
+    from utils.chunker import chunk_file
+    from embeddings import OllamaEmbeddingClient
+    from local_embeddings import LocalEmbeddingClient
+    texts = []
+    for path in paths:
+        texts.extend(chunk_file(path, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP))
+        if len(texts) >= args.embed_texts:
+            break
+    texts = texts[:args.embed_texts]
+    local = LocalEmbeddingClient(args.local_model, dim=None, threads=args.local_threads, onnx=args.onnx)
+    return {
+        "ollama": bench_embedding(OllamaEmbeddingClient(base_url=ollama_url), texts, queries),
+        "local": {"model": args.local_model, "threads": args.local_threads, "onnx": args.onnx,
+                  **bench_embedding(local, texts, queries)},
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def compare(current, baseline_path):
+    """Print relative change of every numeric metric against a previous run"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def walk(new, old, prefix=""):
+        for key, value in new.items():
+            name = f"{prefix}{key}"
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], name + ".")
+            elif isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)) and old[key]:
+                change = (value - old[key]) / old[key] * 100
+                print(f"  {name:<40} {old[key]:>12.3f} -> {value:>12.3f}  ({change:+.1f}%)")
+
+    print(f"\n📊 Compared with {baseline_path} ({baseline.get('environment', {}).get('commit')})")
+    settings, old_settings = current["settings"], baseline.get("settings", {})
+    changed = sorted(key for key in set(settings) | set(old_settings) if settings.get(key) != old_settings.get(key))
+    if changed:
+        print(f"⚠️ Settings differ ({', '.join(changed)}), the runs are not like-for-like")
+    walk(current["results"], baseline.get("results", {}))
+
+
+def run(args):
+    server = None
+    ollama_url = args.ollama_url
+    if ollama_url is None:
+        from fake_ollama import start_server
+        server, ollama_url = start_server(latency_ms=args.latency_ms, per_text_ms=args.per_text_ms,
+                                          dim=EMBED_DIM, version=args.fake_embeddings)
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        corpus_dir = os.path.join(workdir, "data")
+        os.makedirs(corpus_dir)
+        paths, sentences = make_corpus(corpus_dir, args.docs, args.doc_chars, seed=args.seed)
+        queries = random.Random(args.seed).sample(sentences, min(args.queries, len(sentences)))
+
+        from metrics import METRICS
+        METRICS.enable()
+        METRICS.reset()
+        results, failures = {}, []
+        print("✂️ Chunking...")
+        results["chunking"] = bench_chunking(paths)
+        print(f"   {results['chunking']['chunks_per_sec']:.0f} chunks/s")
+
+        store = make_store(args.store, workdir, args.dtype, args.coarse_dim)
+        print(f"📥 Ingesting into the {args.store} store...")
+        results["ingest"] = bench_ingest(paths, store, ollama_url, args.workers)
+        print(f"   {results['ingest']['chunks_per_sec']:.1f} chunks/s")
+        results["storage"] = bench_storage(store)
+        print(f"   {results['storage']['baseline_mb_per_million']:.0f} MB -> "
+              f"{results['storage']['mb_per_million']:.0f} MB per million chunks")
+
+        print(f"🔍 Querying ({len(queries)} queries)...")
+        results["query"] = bench_queries(store, ollama_url, queries, args.top_k, args.batch_size)
+        single = results["query"]["single"]
+        print(f"   p50 {single['p50_ms']:.2f}ms  p95 {single['p95_ms']:.2f}ms  p99 {single['p99_ms']:.2f}ms")
+        print(f"   batch {results['query']['batch']['queries_per_sec']:.1f} queries/s")
+        if store.coarse_dim:
+            print(f"🪆 Two-stage search ({store.coarse_dim} of {EMBED_DIM} dims) against full-dimension search...")
+            texts = held_out_queries(sentences, args.queries, args.seed)
+            rerank = results["rerank"] = bench_rerank(store, ollama_url, texts, args.top_k)
+            exact = f"p50 {rerank['full_dim']['p50_ms']:.2f}ms -> " if "full_dim" in rerank else "p50 "
+            print(f"   recall@{args.top_k} {rerank['recall_at_k']:.3f}  "
+                  f"{exact}{rerank['two_stage']['p50_ms']:.2f}ms")
+            if rerank["recall_at_k"] < 1 - COARSE_MAX_RECALL_LOSS:
+                failures.append(f"Two-stage recall@{args.top_k} {rerank['recall_at_k']:.3f} is more than "
+                                f"{COARSE_MAX_RECALL_LOSS} below full-dimension search, "
+                                f"raise COARSE_DIM or COARSE_CANDIDATES")
+        if args.local_model:
+            print(f"🧠 Embedding {args.embed_texts} chunks: Ollama against in-process {args.local_model}...")
+            embedding = results["embedding"] = bench_backends(paths, queries, ollama_url, args)
+            for backend in ("ollama", "local"):
+                print(f"   {backend:<7} {embedding[backend]['texts_per_sec']:.1f} texts/s  "
+                      f"query p50 {embedding[backend]['query']['p50_ms']:.2f}ms")
+        results["stages"] = METRICS.snapshot()["histograms"]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        "environment": environment(),
+        "settings": {
+            "store": args.store, "fake_ollama": args.ollama_url is None,
+            "fake_embedding_version": args.fake_embeddings if args.ollama_url is None else None, "docs": args.docs,
+            "doc_chars": args.doc_chars, "queries": args.queries, "top_k": args.top_k,
+            "workers": args.workers, "batch_size": args.batch_size, "seed": args.seed, "dtype": args.dtype,
+            "coarse_dim": args.coarse_dim, "local_model": args.local_model,
+            "latency_ms": args.latency_ms, "per_text_ms": args.per_text_ms,
+            "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "embed_dim": EMBED_DIM,
+        },
+        "results": results,
+        "failures": failures,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        compare(report, args.compare)
+    for failure in failures:
+        print(f"❌ {failure}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end ingest and query benchmark")
+    parser.add_argument("--docs", type=int, default=50, help="Number of synthetic documents")
+    parser.add_argument("--doc-chars", type=int, default=20000, help="Approximate characters per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="Embedding workers for ingest")
+    parser.add_argument("--batch-size", type=int, default=64, help="Queries per batch in the batch test")
+    parser.add_argument("--store", choices=["local", "milvus"], default="local")
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default=VECTOR_DTYPE,
+                        help="Local store vector type (Milvus uses VECTOR_DTYPE from config.py)")
+    parser.add_argument("--coarse-dim", type=int, default=COARSE_DIM,
+                        help="Local store two-stage search dims, 0 for full-dimension search")
+    parser.add_argument("--ollama-url", default=None, help="Use a real Ollama server instead of the fake one")
+    parser.add_argument("--fake-embeddings", type=int, choices=(1, 2), default=1,
+                        help="Fake server embedding version (see fake_ollama.py), recorded in the settings")
+    parser.add_argument("--local-model", default=None,
+                        help="Also compare in-process embeddings with this Hugging Face model against Ollama")
+    parser.add_argument("--embed-texts", type=int, default=1000, help="Chunks embedded per backend")
+    parser.add_argument("--local-threads", type=int, default=LOCAL_EMBED_THREADS,
+                        help="Intra-op threads of the in-process backend, 0 for the default")
+    parser.add_argument("--onnx", action="store_true", default=LOCAL_EMBED_ONNX,
+                        help="Run the in-process backend with ONNX Runtime")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake server delay per request")
+    parser.add_argument("--per-text-ms", type=float, default=0.0, help="Fake server delay per embedded text")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    report = run(parser.parse_args())
+    sys.exit(1 if report["failures"] else 0)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Offline ingestion through Milvus bulk import
+`python3 ingest.py --export DIR` writes the embedded chunks as columnar .npy
+shards, one directory per partition shard, instead of inserting them row by
+row. Upload DIR to the bucket of the Milvus object storage under
+BULK_IMPORT_PREFIX, then load it with this script, which recreates the
+collection and imports every shard as one server-side task. The BM25
+index and the ingest manifest are then rebuilt from the imported rows.
+Usage:
+    python3 bulk_import.py DIR
+"""
+
+import os
+import json
+import time
+import shutil
+import struct
+import argparse
+import numpy as np
+from pymilvus import utility
+from pymilvus.client.types import BulkInsertState
+from config import (
+    BULK_SHARD_ROWS, BULK_IMPORT_PREFIX, BULK_IMPORT_TIMEOUT, CHUNK_TEXT_PATH, RERANK_VECTORS_PATH,
+    LEXICAL_INDEX_ENABLED,
+)
+from milvus_store import MilvusStore
+from vector_store import partition_name
+from chunk_store import ChunkTextStore, RerankVectors
+from manifest import IngestManifest, chunk_hash
+from lexical_index import BM25Index
+from result_cache import mark_collection_changed
+
+NPY_HEADER_BYTES = 128  # Fixed header size, so it can be rewritten once the row count is known
+STRING_BLOCK_ROWS = 10000  # Strings converted to fixed-width arrays this many at a time
+
+
+def npy_header(dtype, shape):
+    """Version 1.0 .npy header padded to NPY_HEADER_BYTES"""
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   "fortran_order": False, "shape": tuple(shape)})
+    header = header.ljust(NPY_HEADER_BYTES - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class ColumnFile:
+    """
+    One numeric column of a shard, streamed to disk as an .npy file.
+    Rows are appended as raw bytes and the header is rewritten with the
+    final shape on close.
+    """
+
+    def __init__(self, path, dtype, width=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.rows = 0
+        self.file = open(path, "wb")
+        self.file.write(npy_header(self.dtype, self.shape()))
+
+    def shape(self):
+        return (self.rows, self.width) if self.width else (self.rows,)
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(npy_header(self.dtype, self.shape()))
+        self.file.close()
+
+
+class StringColumnFile:
+    """
+    One VARCHAR column of a shard. Strings go to a JSON-lines spool file
+    while their widest length is tracked, and are converted to a fixed-width
+    .npy array block by block on close, so memory stays bounded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.spool_path = path + ".jsonl"
+        self.spool = open(self.spool_path, "w", encoding="utf-8")
+        self.rows = 0
+        self.width = 1
+
+    def append(self, values):
+        for value in values:
+            self.spool.write(json.dumps(value) + "\n")
+            self.width = max(self.width, len(value))
+        self.rows += len(values)
+
+    def close(self):
+        self.spool.close()
+        dtype = np.dtype(f"<U{self.width}")
+        with open(self.path, "wb") as out, open(self.spool_path, "r", encoding="utf-8") as spool:
+            out.write(npy_header(dtype, (self.rows,)))
+            block = []
+            for line in spool:
+                block.append(json.loads(line))
+                if len(block) == STRING_BLOCK_ROWS:
+                    out.write(np.array(block, dtype=dtype).tobytes())
+                    block = []
+            if block:
+                out.write(np.array(block, dtype=dtype).tobytes())
+        os.remove(self.spool_path)
+
+
+class ColumnarWriter:
+    """
+    Insert sink that writes rows as columnar shards for bulk import.
+    Takes the same insert() calls as a vector store, so run_pipeline can
+    feed it through an InsertBuffer. Columns are built exactly as
+    MilvusStore.insert builds them; chunk text and full rerank vectors of
+    out-of-line and two-stage layouts go to side files inside the export,
+    which bulk_import() moves into place.
+    """
+
+    name = "export"
+
+    def __init__(self, path, shard_rows=BULK_SHARD_ROWS, inputs=None):
+        self.path = path
+        self.shard_rows = shard_rows
+        self.inputs = inputs or {}  # [size, mtime] per exported file
+        self.layout = MilvusStore()
+        self.shards = {}
+        self.done = []
+
+    # The export reports its layout like the store it will become
+    @property
+    def vector_dtype(self):
+        return self.layout.vector_dtype
+
+    @property
+    def coarse_dim(self):
+        return self.layout.coarse_dim
+
+    @property
+    def text_out_of_line(self):
+        return self.layout.text_out_of_line
+
+    def create(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        self.layout.configure()
+        if self.layout.text_store is not None:
+            self.layout.text_store = ChunkTextStore(os.path.join(self.path, "chunk_text")).create()
+        if self.layout.rerank_vectors is not None:
+            self.layout.rerank_vectors = RerankVectors(os.path.join(self.path, "rerank_vectors"),
+                                                       self.layout.dim, self.layout.vector_dtype).create()
+        return self
+
+    def _shard(self, group, columns):
+        """Open shard of a source group, starting a new one when it is full"""
+        shard = self.shards.get(group)
+        if shard is not None and shard["rows"] >= self.shard_rows:
+            self._close(group)
+            shard = None
+        if shard is None:
+            number = sum(1 for done in self.done if done["group"] == group)
+            directory = f"{partition_name(group)}/{number:05d}"
+            os.makedirs(os.path.join(self.path, directory))
+            files = {}
+            for field, column in columns.items():
+                target = os.path.join(self.path, directory, f"{field}.npy")
+                if isinstance(column, np.ndarray):
+                    files[field] = ColumnFile(target, column.dtype, column.shape[1] if column.ndim == 2 else None)
+                else:
+                    files[field] = StringColumnFile(target)
+            shard = self.shards[group] = {"group": group, "path": directory, "rows": 0, "files": files}
+        return shard
+
+    def insert(self, embeddings, texts, metadata=None):
+        for group, (rows, columns) in self.layout.columns(embeddings, texts, metadata).items():
+            start = 0
+            while start < len(rows):
+                shard = self._shard(group, columns)
+                end = min(len(rows), start + self.shard_rows - shard["rows"])
+                for field, column in columns.items():
+                    shard["files"][field].append(column[start:end])
+                shard["rows"] += end - start
+                start = end
+        # Rows get their ids from Milvus at import time
+        return [None] * len(texts)
+
+    def _close(self, group):
+        shard = self.shards.pop(group)
+        for column in shard["files"].values():
+            column.close()
+        self.done.append({"group": group, "path": shard["path"], "rows": shard["rows"],
+                          "fields": list(shard["files"])})
+
+    def flush(self):
+        """Close open shards and write manifest.json"""
+        for group in list(self.shards):
+            self._close(group)
+        if self.layout.text_store is not None:
+            self.layout.text_store.flush()
+        if self.layout.rerank_vectors is not None:
+            self.layout.rerank_vectors.flush()
+        with open(os.path.join(self.path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"vector_dtype": self.vector_dtype, "coarse_dim": self.coarse_dim,
+                       "text_out_of_line": self.text_out_of_line, "inputs": self.inputs,
+                       "shards": self.done}, f, indent=2)
+
+    def optimize_index(self):
+        return False
+
+    def memory_per_million(self):
+        return self.layout.memory_per_million()
+
+
+def load_export(path):
+    """manifest.json of an export, checked against the configured layout"""
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    layout = MilvusStore().configure()
+    expected = {"vector_dtype": layout.vector_dtype, "coarse_dim": layout.coarse_dim,
+                "text_out_of_line": layout.text_out_of_line}
+    found = {key: manifest[key] for key in expected}
+    if found != expected:
+        raise ValueError(f"Export layout {found} does not match the configured layout {expected}")
+    return manifest
+
+
+def rebuild_ingest_state(store, inputs, data_dir="data", use_lexical=LEXICAL_INDEX_ENABLED):
+    """
+    Build the BM25 index and the ingest manifest from the imported rows, so
+    lexical and hybrid retrieval, precomputed summaries and incremental
+    ingest work as after a regular full ingest. Files that changed since
+    the export (per their `inputs` stats) are recorded as incomplete, so
+    the next incremental run diffs their chunks instead of skipping them.
+    """
+    IngestManifest.remove()
+    BM25Index.remove()
+    lexical = BM25Index() if use_lexical else None
+    chunks = {}
+    for rows in store.iter_chunks():
+        if lexical is not None:
+            lexical.add([row["id"] for row in rows], [row["text"] for row in rows])
+            lexical.save(merge=False)
+        for row in rows:
+            chunks.setdefault(row["source"], []).append([chunk_hash(row["text"]), row["id"], row["chunk_index"]])
+    if lexical is not None:
+        lexical.save()
+
+    manifest = IngestManifest.from_rows(store.collection_name, chunks, data_dir, inputs)
+    manifest.save()
+    indexed = f" and the BM25 index ({len(lexical)} chunks)" if lexical is not None else ""
+    print(f"📒 Rebuilt the ingest manifest ({len(manifest.files)} files){indexed}")
+
+
+def bulk_import(path, timeout=BULK_IMPORT_TIMEOUT):
+    """
+    Recreate the collection and load an export with one bulk insert task
+    per shard. The shard files are read by the server from
+    BULK_IMPORT_PREFIX/<shard> in its object storage bucket.
+    """
+    manifest = load_export(path)
+    for name, target in (("chunk_text", CHUNK_TEXT_PATH), ("rerank_vectors", RERANK_VECTORS_PATH)):
+        source = os.path.join(path, name)
+        if os.path.exists(source):
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            shutil.copytree(source, target)
+
+    store = MilvusStore().create(keep_side_files=True)
+    tasks = []
+    for shard in manifest["shards"]:
+        files = [f"{BULK_IMPORT_PREFIX}/{shard['path']}/{field}.npy" for field in shard["fields"]]
+        task = utility.do_bulk_insert(store.collection_name, files,
+                                      partition_name=store._partition(shard["group"]))
+        tasks.append((task, shard))
+    print(f"📦 Started {len(tasks)} bulk import tasks for "
+          f"{sum(shard['rows'] for shard in manifest['shards'])} rows")
+
+    deadline = time.monotonic() + timeout
+    pending = dict(tasks)
+    while pending:
+        for task, shard in list(pending.items()):
+            state = utility.get_bulk_insert_state(task)
+            if state.state in (BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned):
+                raise RuntimeError(f"Bulk import of {shard['path']} failed: {state.failed_reason}")
+            if state.state == BulkInsertState.ImportCompleted:
+                print(f"  ✅ Imported {shard['path']} ({state.row_count} rows)")
+                del pending[task]
+        if pending:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{len(pending)} bulk import tasks still running after {timeout}s")
+            time.sleep(2)
+
+    store.flush()
+    store.optimize_index()
+    # The old manifest and BM25 ids no longer match the collection
+    rebuild_ingest_state(store, manifest.get("inputs", {}))
+    mark_collection_changed()
+    print(f"🎉 Bulk import done: {store.count()} rows in '{store.collection_name}'")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load an ingest.py --export directory with Milvus bulk import")
+    parser.add_argument("path", help="export directory, uploaded to the bucket under BULK_IMPORT_PREFIX")
+    parser.add_argument("--timeout", type=float, default=BULK_IMPORT_TIMEOUT,
+                        help="seconds to wait for the import tasks")
+    args = parser.parse_args()
+    bulk_import(args.path, args.timeout)
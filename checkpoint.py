@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import threading
+from config import INGEST_CHECKPOINT_PATH, DEAD_LETTER_PATH, COLLECTION_NAME
+from vector_store import METADATA_FIELDS
+from metrics import inc
+
+
+def _append_lines(path, records):
+    """Append JSON lines and fsync, so a record is on disk once this returns"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_lines(path):
+    """Records of a JSON lines file; a line cut short by a crash ends the log"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+class IngestCheckpoint:
+    """
+    Durable log of the chunks a full ingest has committed.
+    The first line describes the run: collection, chunking and model
+    settings, the size and mtime of every input file and the run's
+    ingested_at. After each insert a line records the source, chunk
+    ordinals and primary keys of the new rows. A crashed run is resumed
+    only when all of that still matches; its chunks with logged ids are
+    skipped, so completed work is never embedded again. Rows committed by
+    the current run are only logged, so memory does not grow with the
+    run. The log is removed once a run completes.
+    """
+
+    def __init__(self, path=INGEST_CHECKPOINT_PATH):
+        self.path = path
+        self.header = None
+        self.committed = {}  # source -> {chunk ordinal: primary key} committed by the interrupted run
+        self.lock = threading.Lock()
+
+    @classmethod
+    def start(cls, header, path=INGEST_CHECKPOINT_PATH):
+        """Begin a new log for the run described by `header`"""
+        checkpoint = cls(path)
+        cls.remove(path)
+        checkpoint.header = header
+        _append_lines(path, [{"run": header}])
+        return checkpoint
+
+    @classmethod
+    def load(cls, header, path=INGEST_CHECKPOINT_PATH):
+        """
+        The log of an interrupted run with the same header (ignoring its
+        ingested_at), or None when there is none or the inputs changed.
+        """
+        if not os.path.exists(path):
+            return None
+        records = _read_lines(path)
+        if not records or "run" not in records[0]:
+            return None
+        previous = records[0]["run"]
+        if {**previous, "ingested_at": None} != {**header, "ingested_at": None}:
+            return None
+        checkpoint = cls(path)
+        checkpoint.header = previous
+        for record in records[1:]:
+            rows = checkpoint.committed.setdefault(record["source"], {})
+            rows.update(zip(record["chunks"], record["ids"]))
+        return checkpoint
+
+    @staticmethod
+    def remove(path=INGEST_CHECKPOINT_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def ids(self):
+        return [pk for rows in self.committed.values() for pk in rows.values()]
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.committed.values())
+
+    def retain(self, present):
+        """Forget logged rows whose ids are not in `present`, e.g. rows a crashed store never flushed"""
+        for source, rows in self.committed.items():
+            self.committed[source] = {i: pk for i, pk in rows.items() if pk in present}
+
+    def rewrite(self):
+        """Compact the log to the header and the rows currently committed"""
+        records = [{"run": self.header}]
+        records += [{"source": source, "chunks": list(rows), "ids": list(rows.values())}
+                    for source, rows in self.committed.items() if rows]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def rows(self, source):
+        """{chunk ordinal: id} of the committed chunks of a source"""
+        return self.committed.get(source, {})
+
+    def commit(self, metadata, ids):
+        """Log inserted rows, one line per source; `committed` is left to the rows loaded on resume"""
+        records = {}
+        for source, i, pk in zip(metadata["source"], metadata["chunk_index"], ids):
+            record = records.setdefault(source, {"source": source, "chunks": [], "ids": []})
+            record["chunks"].append(int(i))
+            record["ids"].append(int(pk))
+        with self.lock:
+            _append_lines(self.path, list(records.values()))
+
+
+class DeadLetterQueue:
+    """
+    Chunks that could not be embedded or inserted, one JSON line each with
+    their text, metadata and the error. Nothing is stored for them in the
+    collection (no placeholder vectors); `python3 ingest.py
+    --replay-dead-letters` embeds and inserts them later. Entries carry the
+    collection they were meant for; entries without one predate that field
+    and are taken to belong to the current collection.
+    """
+
+    def __init__(self, path=DEAD_LETTER_PATH, collection=COLLECTION_NAME):
+        self.path = path
+        self.collection = collection
+        self.added = 0
+        self.sources = set()  # Sources of the chunks added by this run
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def belongs(self, entry):
+        return entry.get("collection", self.collection) == self.collection
+
+    def discard(self):
+        """Drop the entries of this collection, keeping those of others; returns how many were dropped"""
+        entries = self.read()
+        kept = [entry for entry in entries if not self.belongs(entry)]
+        self.rewrite(kept)
+        return len(entries) - len(kept)
+
+    def add(self, texts, metadata, errors):
+        """Record chunks with their metadata columns and why they failed (one error, or one per text)"""
+        if not isinstance(errors, list):
+            errors = [errors] * len(texts)
+        failed_at = int(time.time())
+        entries = []
+        for i, (text, error) in enumerate(zip(texts, errors)):
+            entry = {"text": text, "source": metadata["source"][i], "collection": self.collection}
+            entry.update({field: int(metadata[field][i]) for field in METADATA_FIELDS if field != "source"})
+            entries.append({**entry, "error": str(error), "failed_at": failed_at})
+        with self.lock:
+            _append_lines(self.path, entries)
+            self.added += len(entries)
+            self.sources.update(entry["source"] for entry in entries)
+        inc("ingest_dead_letters_total", len(entries))
+        print(f"  ☠️ {len(entries)} chunks written to {self.path}: {errors[0]}")
+
+    def read(self):
+        return _read_lines(self.path) if self.exists() else []
+
+    def rewrite(self, entries):
+        """Replace the file with `entries`, removing it when none are left"""
+        if not entries:
+            self.clear()
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        os.replace(tmp, self.path)
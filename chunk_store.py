@@ -0,0 +1,120 @@
+import os
+import shutil
+import numpy as np
+from config import CHUNK_TEXT_PATH, RERANK_VECTORS_PATH, EMBED_DIM
+from vector_store import quantize, INT8_SCALE
+
+
+class ChunkTextStore:
+    """
+    Append-only chunk text file shared by reference.
+    Vector store rows keep only the (offset, length) of their text, and
+    texts are read back through a memory map when a result needs them.
+    Bytes of deleted rows are left in place until the next full rebuild.
+    """
+
+    def __init__(self, path=CHUNK_TEXT_PATH):
+        self.path = path
+        self.file = os.path.join(path, "text.bin")
+        self.map = None
+        self.mapped_size = 0
+
+    def exists(self):
+        return os.path.exists(self.file)
+
+    def create(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        open(self.file, "wb").close()
+        self.map, self.mapped_size = None, 0
+        return self
+
+    def append(self, texts):
+        """Append texts, returns their (offsets, lengths) in bytes"""
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = [len(data) for data in encoded]
+        with open(self.file, "ab") as f:
+            start = f.tell()
+            f.write(b"".join(encoded))
+        offsets = (start + np.cumsum([0] + lengths[:-1])).tolist() if lengths else []
+        return offsets, lengths
+
+    def flush(self):
+        with open(self.file, "ab") as f:
+            os.fsync(f.fileno())
+
+    def size(self):
+        return os.path.getsize(self.file) if self.exists() else 0
+
+    def get(self, offset, length):
+        end = offset + length
+        if end > self.mapped_size:
+            size = self.size()
+            if end > size:
+                raise ValueError(f"Chunk text at {offset}+{length} is past the end of {self.file}")
+            self.map = np.memmap(self.file, dtype=np.uint8, mode="r", shape=(size,))
+            self.mapped_size = size
+        return bytes(self.map[offset:end]).decode("utf-8")
+
+    def get_many(self, refs):
+        """Texts for a list of (offset, length) pairs"""
+        return [self.get(offset, length) for offset, length in refs]
+
+
+class RerankVectors:
+    """
+    Append-only full-dimension vectors for two-stage search.
+    The vector index only holds the first COARSE_DIM dimensions; rows keep
+    their position in this memory-mapped file, and the coarse candidates
+    are reranked exactly against these vectors.
+    """
+
+    def __init__(self, path=RERANK_VECTORS_PATH, dim=EMBED_DIM, dtype="float32"):
+        self.path = path
+        self.file = os.path.join(path, "vectors.bin")
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.map = None
+        self.mapped_rows = 0
+
+    def exists(self):
+        return os.path.exists(self.file)
+
+    def create(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        open(self.file, "wb").close()
+        self.map, self.mapped_rows = None, 0
+        return self
+
+    def rows(self):
+        return os.path.getsize(self.file) // (self.dim * self.dtype.itemsize) if self.exists() else 0
+
+    def append(self, vectors):
+        """Append unit-normalized vectors, returns their row numbers"""
+        vectors = quantize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim), self.dtype.name)
+        with open(self.file, "ab") as f:
+            start = f.tell() // (self.dim * self.dtype.itemsize)
+            f.write(vectors.tobytes())
+        return list(range(start, start + len(vectors)))
+
+    def flush(self):
+        with open(self.file, "ab") as f:
+            os.fsync(f.fileno())
+
+    def get(self, rows):
+        """float32 unit vectors for `rows`, shape (len(rows), dim)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and rows.max() >= self.mapped_rows:
+            self.mapped_rows = self.rows()
+            if rows.max() >= self.mapped_rows:
+                raise ValueError(f"Vector row {rows.max()} is past the end of {self.file}")
+            self.map = np.memmap(self.file, dtype=self.dtype, mode="r", shape=(self.mapped_rows, self.dim))
+        if not len(rows):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = self.map[rows].astype(np.float32)
+        if self.dtype == np.int8:
+            vectors /= INT8_SCALE
+        return vectors
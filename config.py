@@ -1,8 +1,165 @@
-from pymilvus import connections
+# Vector store backend: "milvus" (server) or "local" (in-process, memory-mapped)
+VECTOR_STORE = "milvus"
 
-# Connect to Milvus (local docker: localhost:19530)
-connections.connect("default", host="127.0.0.1", port="19530")
+# Milvus (local docker: localhost:19530), connected when the Milvus store is opened
+MILVUS_HOST = "127.0.0.1"
+MILVUS_PORT = "19530"
+
+# Milvus index selection and tuned search params
+AUTO_INDEX = True  # Pick the index type and parameters from the row count after ingestion
+SEARCH_PARAMS_PATH = ".cache/search_params.json"  # Written by tune_index.py
+TUNE_TARGET_RECALL = 0.95  # tune_index.py picks the cheapest params reaching this recall@k
+
+# Documents in a subdirectory of data/ form a source group, stored in their own
+# Milvus partition; files directly in data/ belong to this group
+DEFAULT_SOURCE_GROUP = "default"
+
+# Local store: vectors in a memory-mapped matrix, chunk text in a side file
+LOCAL_STORE_PATH = ".cache/local_store"
+
+# Compact storage, used by both stores for newly created collections
+VECTOR_DTYPE = "float32"  # "float16" halves vector memory, "int8" quarters it (unit vectors scaled by 127)
+CHUNK_TEXT_OUT_OF_LINE = False  # Keep chunk text out of Milvus, rows store its offset in CHUNK_TEXT_PATH
+CHUNK_TEXT_PATH = ".cache/chunk_text"  # Append-only, memory-mapped chunk text file
+
+# Two-stage (Matryoshka) search for newly created collections: the vector index holds
+# only the first COARSE_DIM dimensions, renormalized, and the top_k * COARSE_CANDIDATES
+# coarse hits are reranked exactly against the full vectors. Within COARSE_MAX_RECALL_LOSS on
+# `benchmark.py --fake-embeddings 2` (recall@5): 256 dims with 8 candidates (0.983-0.986 over seeds
+# 0-2), 128 dims only with 32 (0.983; 0.901 with 8, 0.953 with 16). Recheck with a real model.
+COARSE_DIM = 0  # e.g. 256 for nomic-embed-text; 0 indexes full vectors
+COARSE_CANDIDATES = 8
+COARSE_MAX_RECALL_LOSS = 0.02  # benchmark.py warns when recall@k drops more than this below full-dim
+RERANK_VECTORS_PATH = ".cache/rerank_vectors"  # Full vectors for the Milvus store's rerank
+
+# Embedding backend: "ollama" (HTTP API) or "local" (in-process CPU inference, local_embeddings.py).
+# The local backend loads EMBED_MODEL from Hugging Face instead, e.g.
+# "sentence-transformers/all-MiniLM-L6-v2" with EMBED_DIM = 384; a new model needs a full re-ingest
+EMBED_BACKEND = "ollama"
 
 # Ollama embedding model
 EMBED_MODEL = "nomic-embed-text"  # Using Ollama Nomic embeddings
+EMBED_DIM = 768  # Nomic-embed-text is 768 dimensions
+OLLAMA_BASE_URL = "http://localhost:11434"
 COLLECTION_NAME = "research_docs"
+
+# Chunking
+CHUNK_SIZE = 400  # Characters per chunk
+CHUNK_OVERLAP = 50  # Characters shared by neighbouring chunks
+MAX_CHUNK_CHARS = 900  # Stored text is truncated to stay under the VARCHAR limit
+
+# Duplicate chunk detection (full rebuilds)
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.9  # Estimated Jaccard similarity of shingles that counts as a near duplicate
+DEDUP_NUM_PERM = 128  # MinHash permutations per chunk
+
+# Embedding HTTP client
+EMBED_BATCH_SIZE = 64  # Max texts sent in a single /api/embed request
+EMBED_TIMEOUT = 60  # Seconds per embedding request
+EMBED_POOL_SIZE = 8  # Keep-alive connections kept open to Ollama
+OLLAMA_KEEP_ALIVE = "30m"  # How long Ollama keeps the model loaded after a request
+EMBED_RETRIES = 4  # Retries per request after connection errors, timeouts, 429 and 5xx responses
+EMBED_RETRY_BASE_DELAY = 0.5  # Seconds before the first retry, doubled per attempt (with jitter)
+EMBED_RETRY_MAX_DELAY = 30.0  # Cap on the delay between retries
+EMBED_BREAKER_THRESHOLD = 5  # Consecutive requests failing all retries that open the circuit breaker
+EMBED_BREAKER_COOLDOWN = 30.0  # Seconds the breaker fails fast before letting a trial request through
+
+# In-process embedding backend (EMBED_BACKEND = "local")
+LOCAL_EMBED_THREADS = 0  # Intra-op CPU threads for torch / ONNX Runtime, 0 keeps their default
+LOCAL_EMBED_BATCH_SIZE = 64  # Max texts per forward pass
+LOCAL_EMBED_MAX_BATCH_TOKENS = 8192  # Max padded tokens per forward pass; texts are batched by length
+LOCAL_EMBED_MAX_LENGTH = 256  # Tokens per text, longer texts are truncated
+LOCAL_EMBED_POOLING = "mean"  # "mean" over tokens (sentence-transformers models) or "cls"
+LOCAL_EMBED_ONNX = False  # Run the model with ONNX Runtime, exported on first use
+LOCAL_EMBED_ONNX_PATH = ".cache/onnx"
+
+# Document loaders: .pdf and .docx files are parsed in a process pool
+LOADER_WORKERS = 4  # Parser processes, 0 parses in the ingest process
+LOADER_MAX_IN_FLIGHT = 8  # Documents parsed or buffered ahead of the chunk consumer
+
+# Pipelined ingestion
+EMBED_WORKERS = 4  # Parallel embedding requests in flight
+PIPELINE_QUEUE_DEPTH = 8  # Max batches buffered between stages (backpressure)
+
+# Adaptive ingest batching (batching.py): embedding batches are sized from measured
+# latency, inserts from payload bytes, and shrink when the server slows down
+EMBED_MIN_BATCH_SIZE = 8  # Smallest embedding batch; EMBED_BATCH_SIZE is the largest
+EMBED_TARGET_SECONDS = 2.0  # Aim for embedding requests of about this long
+INSERT_TARGET_BYTES = 16 * 1024 * 1024  # Insert once this much vector + text payload is buffered
+INSERT_MIN_BYTES = 1024 * 1024  # Floor for the target when inserts are slow
+INSERT_TARGET_SECONDS = 2.0  # Halve the insert target when an insert takes longer
+INSERT_MAX_DELAY = 10.0  # Insert buffered rows at least this often (seconds)
+
+# Offline ingestion: ingest.py --export writes columnar .npy shards, bulk_import.py loads
+# them with Milvus bulk import from the object storage bucket they were uploaded to
+BULK_SHARD_ROWS = 1_000_000  # Rows per partition shard
+BULK_IMPORT_PREFIX = "bulk"  # Path of the uploaded export directory inside the bucket
+BULK_IMPORT_TIMEOUT = 3600  # Seconds to wait for the import tasks
+
+# Batch search
+SEARCH_BATCH_SIZE = 64  # Queries per multi-vector search request
+
+# Retrieval modes: "vector", "lexical" (BM25 only, no embedding call) or "hybrid" (RRF fusion)
+RETRIEVAL_MODE = "vector"
+LEXICAL_INDEX_ENABLED = True  # Build the BM25 index at ingest time
+LEXICAL_INDEX_PATH = ".cache/lexical_index"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant
+HYBRID_CANDIDATES = 4  # Each ranking contributes top_k * HYBRID_CANDIDATES candidates
+
+# Result diversification (diversify.py): vector and hybrid searches over-fetch
+# top_k * MMR_CANDIDATES candidates, order them by Maximal Marginal Relevance and
+# merge overlapping chunks of the same source into one passage per result
+DIVERSIFY_RESULTS = True
+MMR_CANDIDATES = 4
+MMR_LAMBDA = 0.7  # Weight of query relevance against similarity to results already picked
+MERGE_MAX_CHARS = 1200  # Longest merged passage; a chunk that would exceed it stays a result of its own
+
+# Query result cache (exact + semantic tiers in front of the vector store)
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_SIZE = 1024  # Entries per tier
+RESULT_CACHE_TTL = 600  # Seconds before a cached result expires
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Cosine similarity needed to reuse a paraphrase's results
+COLLECTION_VERSION_PATH = ".cache/collection_version"  # Touched by ingest to invalidate caches
+
+# Embedding cache (shared by ingest and retrieval)
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_PATH = ".cache/embeddings.sqlite"
+EMBED_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Evict least recently used above 1 GB
+EMBED_CACHE_MEMORY_ITEMS = 10000  # In-memory LRU tier in front of SQLite
+
+# Incremental ingestion
+INGEST_MANIFEST_PATH = ".cache/ingest_manifest.json"  # Per-file and per-chunk content hashes
+
+# Resumable full ingestion: committed chunks are logged after every insert, so a crashed
+# run continues where it stopped; chunks that still fail go to the dead-letter file
+INGEST_CHECKPOINT_PATH = ".cache/ingest_checkpoint.jsonl"  # Removed when a run completes
+DEAD_LETTER_PATH = ".cache/dead_letters.jsonl"  # Replay with: python3 ingest.py --replay-dead-letters
+EMBED_OUTAGE_TIMEOUT = 600  # Seconds ingest waits for an open breaker before stopping (resumable)
+
+# Instrumentation (metrics.py): timing spans, histograms and counters
+METRICS_ENABLED = False  # Near-zero overhead when off
+METRICS_EXPORT_PATH = ".cache/metrics.json"  # Use a .prom extension for Prometheus text
+VERBOSE = False  # Print per-batch and per-query progress lines
+
+# Memory budgets (memory_budget.py): a full ingest and queries run on synthetic corpora of
+# increasing size against the fake Ollama server and the local store; a stage fails when its
+# peak traced allocations exceed its budget or grow faster than (corpus size) ** MEMORY_MAX_GROWTH.
+# Budgets are (fixed MB, MB per million characters of corpus text). Ingest holds at most one
+# insert buffer plus its copy on the way into the store, whatever the corpus size
+MEMORY_BUDGET_SIZES = (25, 50, 100)  # Documents per run, about 20k characters each
+MEMORY_BUDGET_MB = {
+    "chunk": (4, 2), "dedup": (4, 12), "ingest": (2 * INSERT_TARGET_BYTES / (1024 * 1024) + 16, 0),
+    "index": (8, 16), "search": (8, 0), "summarize": (4, 4),
+}
+MEMORY_RSS_BUDGET_MB = (256, 192)  # Peak resident memory of one whole run
+MEMORY_MAX_GROWTH = 1.25  # Largest allowed log-log slope of a stage's peak against corpus size
+MEMORY_GROWTH_FLOOR_MB = 1.0  # Stages peaking below this are too small to judge growth
+
+# Query server (server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_BATCH_WINDOW_MS = 5  # How long the first query of a batch waits for others to join
+SERVER_MAX_BATCH = 64  # Queries per batched embed + multi-vector search
+SERVER_MAX_QUEUE = 4096  # Requests waiting beyond this are rejected with 503
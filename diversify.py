@@ -0,0 +1,97 @@
+import numpy as np
+from config import MMR_LAMBDA, MERGE_MAX_CHARS
+
+
+def mmr_order(query, vectors, limit, weight=MMR_LAMBDA):
+    """
+    Maximal Marginal Relevance order of candidate rows, up to `limit` positions.
+    Each step picks the candidate maximizing
+    weight * sim(query, c) - (1 - weight) * max sim(c, picked so far),
+    with all similarities taken from one candidate-by-candidate matrix.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+    query = np.asarray(query, dtype=np.float32).ravel()
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    redundancy = np.full(len(vectors), -1.0, dtype=np.float32)  # Cosine floor: nothing picked yet
+    picked = np.zeros(len(vectors), dtype=bool)
+    order = []
+    for _ in range(min(limit, len(vectors))):
+        scores = weight * relevance - (1 - weight) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        picked[best] = True
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return order
+
+
+def _char_range(hit):
+    """(source, char_start, char_end) of a hit, None for rows stored without offsets"""
+    start = hit.get("char_start")
+    if not hit.get("source") or start is None or start < 0:
+        return None
+    return hit["source"], start, hit["char_end"]
+
+
+def _merged_length(passage, start, end):
+    return max(passage["end"], end) - min(passage["start"], start)
+
+
+def group_adjacent(hits, limit, max_chars=MERGE_MAX_CHARS):
+    """
+    Group ranked hits into at most `limit` passages. A hit whose character
+    range overlaps or touches a passage of the same source joins it (and
+    may bridge two passages) as long as the passage stays within
+    `max_chars`; any other hit starts a new passage while there is room.
+    Returns the hits of each passage, in rank order. Only metadata is
+    read, so texts can be fetched for the kept hits alone.
+    """
+    passages = []
+    for hit in hits:
+        span = _char_range(hit)
+        touching = [] if span is None else [
+            passage for passage in passages
+            if passage["source"] == span[0] and span[1] <= passage["end"] and span[2] >= passage["start"]
+            and _merged_length(passage, span[1], span[2]) <= max_chars
+        ]
+        if not touching:
+            if len(passages) == limit:
+                break
+            source, start, end = span or (None, 0, 0)
+            passages.append({"source": source, "start": start, "end": end, "hits": [hit]})
+            continue
+        first = touching[0]
+        first["hits"].append(hit)
+        first["start"], first["end"] = min(first["start"], span[1]), max(first["end"], span[2])
+        for other in touching[1:]:
+            if _merged_length(first, other["start"], other["end"]) > max_chars:
+                continue
+            first["hits"] += other["hits"]
+            first["start"], first["end"] = min(first["start"], other["start"]), max(first["end"], other["end"])
+            passages.remove(other)
+    return [passage["hits"] for passage in passages]
+
+
+def join_passage(hits):
+    """
+    One result for a group of overlapping hits of a source: their texts
+    joined in document order without the overlap, the score and id of the
+    best hit, and "ids" listing every merged chunk.
+    """
+    best = max(hits, key=lambda hit: hit["score"])
+    if len(hits) == 1:
+        return {**best, "ids": [best["id"]]}
+    parts = sorted(hits, key=lambda hit: hit["char_start"])
+    text, end = parts[0]["text"], parts[0]["char_end"]
+    for hit in parts[1:]:
+        if hit["char_end"] > end:
+            text += hit["text"][end - hit["char_start"]:]
+            end = hit["char_end"]
+    return {**best, "text": text, "chunk_index": parts[0]["chunk_index"],
+            "char_start": parts[0]["char_start"], "char_end": end, "ids": [hit["id"] for hit in parts]}
@@ -0,0 +1,170 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import (
+    EMBED_DIM, EMBED_CACHE_PATH, EMBED_CACHE_MAX_BYTES, EMBED_CACHE_MEMORY_ITEMS,
+)
+
+
+def cache_key(model_name, text):
+    """Content address of an embedding: hash of (model name, text)"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache.
+    A bounded in-memory LRU sits in front of a SQLite file; the SQLite tier
+    evicts least recently used vectors once it grows past `max_bytes`.
+    """
+
+    def __init__(self, path=EMBED_CACHE_PATH, max_bytes=EMBED_CACHE_MAX_BYTES,
+                 memory_items=EMBED_CACHE_MEMORY_ITEMS, dim=EMBED_DIM):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.dim = dim
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self.db.commit()
+        row = self.db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self.disk_bytes = row[0]
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get_many(self, model_name, texts):
+        """
+        Look up embeddings for texts.
+        Returns (vectors, missing) where vectors is a float32 array with
+        cached rows filled in and `missing` lists the indices still to embed.
+        """
+        keys = [cache_key(model_name, text) for text in texts]
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        with self.lock:
+            pending = {}
+            for i, key in enumerate(keys):
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    vectors[i] = vector
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+
+            if pending:
+                found = []
+                key_list = list(pending)
+                for start in range(0, len(key_list), 500):
+                    part = key_list[start:start + 500]
+                    marks = ",".join("?" * len(part))
+                    found.extend(self.db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                    ).fetchall())
+                now = time.time()
+                for key, blob in found:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vector)
+                    for i in pending.pop(key):
+                        vectors[i] = vector
+                        self.disk_hits += 1
+                if found:
+                    self.db.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in found],
+                    )
+                    self.db.commit()
+                for indices in pending.values():
+                    missing.extend(indices)
+                    self.misses += len(indices)
+
+        missing.sort()
+        return vectors, missing
+
+    def get(self, model_name, text):
+        """Return the cached embedding for one text, or None"""
+        vectors, missing = self.get_many(model_name, [text])
+        return None if missing else vectors[0]
+
+    def put_many(self, model_name, texts, vectors):
+        """Store embeddings for texts (rows of `vectors`)"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        now = time.time()
+        rows = []
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model_name, text)
+                if key in self.memory:
+                    continue
+                self._remember(key, vector.copy())
+                rows.append((key, vector.tobytes(), now))
+            if not rows:
+                return
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            added = self.db.total_changes - before
+            self.disk_bytes += added * vectors.shape[1] * 4
+            if self.disk_bytes > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def put(self, model_name, text, vector):
+        self.put_many(model_name, [text], np.asarray(vector)[None, :])
+
+    def _evict(self):
+        """Drop least recently used rows until the file is back under 90% of max_bytes"""
+        row_bytes = self.dim * 4
+        excess = self.disk_bytes - int(self.max_bytes * 0.9)
+        count = max(1, -(-excess // row_bytes))
+        self.db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (count,)
+        )
+        self.evictions += count
+        self.disk_bytes = self.db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters and current size of both tiers"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_items": len(self.memory),
+            "disk_bytes": self.disk_bytes,
+        }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,223 @@
+import time
+import random
+import threading
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    EMBED_BACKEND, EMBED_MODEL, EMBED_DIM, OLLAMA_BASE_URL,
+    EMBED_BATCH_SIZE, EMBED_TIMEOUT, EMBED_POOL_SIZE, OLLAMA_KEEP_ALIVE,
+    EMBED_RETRIES, EMBED_RETRY_BASE_DELAY, EMBED_RETRY_MAX_DELAY,
+    EMBED_BREAKER_THRESHOLD, EMBED_BREAKER_COOLDOWN,
+)
+from metrics import span, inc
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without contacting the server while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Embedding server circuit breaker is open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive failed requests (after retries).
+    While open, calls raise CircuitOpenError for `cooldown` seconds; then
+    one trial request is let through, and its outcome closes the breaker
+    or opens it again. Shared by all threads using one client.
+    """
+
+    def __init__(self, threshold=EMBED_BREAKER_THRESHOLD, cooldown=EMBED_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def before(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpenError(max(remaining, 0.1))
+            self.trial = True
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    inc("embed_breaker_opened_total")
+                    print(f"⚠️ Embedding server failed {self.failures} times in a row, "
+                          f"pausing requests for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+
+
+def retryable(error):
+    """Connection errors, timeouts, 429 and 5xx are worth retrying; other 4xx are not"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class EmbeddingClient:
+    """
+    Interface shared by the embedding backends.
+    embed() returns a C-contiguous float32 array of shape (len(texts), dim)
+    for the texts in order; get_embedding_client() builds the backend
+    selected by EMBED_BACKEND.
+    """
+
+    name = "base"
+    label = "base"  # Shown in progress messages
+
+    def ping(self):
+        """True if the backend can embed"""
+        raise NotImplementedError
+
+    def check(self):
+        """Make sure the backend can embed before a long run, with a hint when it cannot"""
+        raise NotImplementedError
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+    def embed_one(self, text):
+        """Embed a single text, returns a 1-D float32 array"""
+        return self.embed([text])[0]
+
+    def warm_up(self):
+        """Load the model so the first real request does not pay for it"""
+        self.embed_one("warm up")
+
+    def close(self):
+        pass
+
+
+class OllamaEmbeddingClient(EmbeddingClient):
+    """
+    Batched client for the Ollama embeddings API.
+    Sends a whole batch of texts per request to /api/embed over a pooled
+    keep-alive session and returns a contiguous float32 array. Transient
+    failures are retried `retries` times with exponential backoff, behind
+    a circuit breaker that fails fast while the server is down.
+    """
+
+    name = "ollama"
+    label = "Ollama"
+
+    def __init__(self, model_name=EMBED_MODEL, base_url=OLLAMA_BASE_URL,
+                 batch_size=EMBED_BATCH_SIZE, timeout=EMBED_TIMEOUT,
+                 pool_size=EMBED_POOL_SIZE, dim=EMBED_DIM, keep_alive=OLLAMA_KEEP_ALIVE,
+                 retries=EMBED_RETRIES, breaker=None):
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.dim = dim
+        self.keep_alive = keep_alive
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def ping(self):
+        """Check that the Ollama server is reachable"""
+        response = self.session.get(f"{self.base_url}/api/tags", timeout=self.timeout)
+        return response.status_code == 200
+
+    def check(self):
+        try:
+            if not self.ping():
+                raise Exception("Cannot connect to Ollama")
+            print("✅ Connected to Ollama successfully!")
+        except Exception as e:
+            print(f"❌ Error connecting to Ollama: {e}")
+            print("Make sure Ollama is running: ollama serve")
+            raise
+
+    def _embed_batch(self, texts):
+        """
+        One /api/embed request, retried with exponential backoff and jitter.
+        The breaker counts requests that still fail after their retries.
+        """
+        self.breaker.before()
+        attempt = 0
+        while True:
+            try:
+                embeddings = self._request(texts)
+            except Exception as e:
+                if not retryable(e):
+                    # The server answered, so it is up; the request itself is bad
+                    self.breaker.success()
+                    raise
+                if attempt >= self.retries:
+                    self.breaker.failure()
+                    raise
+                delay = min(EMBED_RETRY_MAX_DELAY, EMBED_RETRY_BASE_DELAY * 2 ** attempt)
+                inc("embed_retries_total")
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                continue
+            self.breaker.success()
+            return embeddings
+
+    def _request(self, texts):
+        with span("embed_request_seconds"):
+            response = self.session.post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model_name, "input": texts, "keep_alive": self.keep_alive},
+                timeout=self.timeout,
+            )
+        inc("embed_requests_total")
+        inc("embed_texts_total", len(texts))
+        response.raise_for_status()
+        embeddings = response.json()["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"Expected {len(texts)} embeddings from Ollama, got {len(embeddings)}"
+            )
+        return embeddings
+
+    def embed(self, texts):
+        """
+        Embed a list of texts.
+        Returns a C-contiguous float32 array of shape (len(texts), dim).
+        """
+        texts = list(texts)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            out[start:start + len(batch)] = self._embed_batch(batch)
+        return out
+
+    def warm_up(self):
+        """Load the model into Ollama so the first real request does not pay for it"""
+        self.embed_one("warm up")
+
+    def close(self):
+        self.session.close()
+
+
+def get_embedding_client(backend=None, model_name=EMBED_MODEL, base_url=OLLAMA_BASE_URL):
+    """Build the embedding backend, EMBED_BACKEND from config.py by default"""
+    backend = backend or EMBED_BACKEND
+    if backend == "ollama":
+        return OllamaEmbeddingClient(model_name, base_url=base_url)
+    if backend == "local":
+        from local_embeddings import LocalEmbeddingClient
+        return LocalEmbeddingClient(model_name)
+    raise ValueError(f"Unknown embedding backend: {backend!r}")
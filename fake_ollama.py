@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for the Ollama embeddings API, used by benchmark.py
+Each text maps to a fixed unit vector, so runs are reproducible without a
+model. Embedding version 1 (the default) derives the vector from the text's
+hash; version 2 sums hashed word vectors whose variance decays along the
+dimensions, so texts sharing words land close together. Benchmarks record
+the version, since results are only comparable within one.
+Serves /api/embed, /api/embeddings and /api/tags.
+Usage:
+    python3 fake_ollama.py [--port 11434] [--latency-ms 0] [--embedding-version 1]
+"""
+
+import json
+import time
+import hashlib
+import functools
+import argparse
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import EMBED_DIM
+
+EMBEDDING_VERSIONS = (1, 2)
+
+
+@functools.lru_cache(maxsize=65536)
+def word_vector(word, dim=EMBED_DIM):
+    """
+    Random vector seeded by the word's hash. Its variance falls off along
+    the dimensions, as in Matryoshka-trained models, so that truncated
+    prefixes keep most of the similarity structure.
+    """
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.sqrt(1 + np.arange(dim, dtype=np.float32) / 16)
+
+
+def fake_embedding(text, dim=EMBED_DIM, version=1):
+    """
+    Version 1: unit vector seeded by the text's hash.
+    Version 2: unit-normalized sum of word vectors, so texts sharing words are similar.
+    """
+    if version == 1:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    elif version == 2:
+        words = text.lower().split() or [""]
+        vector = np.sum([word_vector(word, dim) for word in words], axis=0)
+    else:
+        raise ValueError(f"Unknown fake embedding version {version}, expected one of {EMBEDDING_VERSIONS}")
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment, otherwise delayed ACKs add ~40ms per request
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+    dim = EMBED_DIM
+    latency = 0.0  # Seconds added per request, plus per_text for each input
+    per_text = 0.0
+    embedding_version = 1
+    fail_marker = None  # Requests with a text containing it get fail_status, to exercise failure handling
+    fail_status = 500
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send({"models": [{"name": "fake"}]})
+        else:
+            self._send({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/embed":
+            texts = payload.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+        elif self.path == "/api/embeddings":
+            texts = [payload.get("prompt", "")]
+        else:
+            self._send({"error": "not found"}, status=404)
+            return
+
+        if self.fail_marker is not None and any(self.fail_marker in text for text in texts):
+            self._send({"error": "injected failure"}, status=self.fail_status)
+            return
+        if self.latency or self.per_text:
+            time.sleep(self.latency + self.per_text * len(texts))
+        vectors = [fake_embedding(text, self.dim, self.embedding_version).tolist() for text in texts]
+        if self.path == "/api/embed":
+            self._send({"model": payload.get("model"), "embeddings": vectors})
+        else:
+            self._send({"embedding": vectors[0]})
+
+
+def start_server(host="127.0.0.1", port=0, latency_ms=0.0, per_text_ms=0.0, dim=EMBED_DIM, version=1,
+                 fail_marker=None, fail_status=500):
+    """
+    Start the fake server on a background thread, serving embeddings of `version`.
+    Requests with a text containing `fail_marker` are answered with
+    `fail_status`; set server.RequestHandlerClass.fail_marker to change it.
+    Port 0 picks a free port; returns (server, base_url), stop with server.shutdown().
+    """
+    if version not in EMBEDDING_VERSIONS:
+        raise ValueError(f"Unknown fake embedding version {version}, expected one of {EMBEDDING_VERSIONS}")
+    handler = type("Handler", (FakeOllamaHandler,), {
+        "latency": latency_ms / 1000, "per_text": per_text_ms / 1000, "dim": dim, "embedding_version": version,
+        "fail_marker": fail_marker, "fail_status": fail_status,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama embeddings server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay per request")
+    parser.add_argument("--per-text-ms", type=float, default=0.0, help="Extra delay per embedded text")
+    parser.add_argument("--embedding-version", type=int, choices=EMBEDDING_VERSIONS, default=1,
+                        help="1: vectors from text hashes, 2: sums of word vectors with decaying variance")
+    args = parser.parse_args()
+    server, url = start_server(args.host, args.port, args.latency_ms, args.per_text_ms,
+                               version=args.embedding_version)
+    print(f"🧪 Fake Ollama serving at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
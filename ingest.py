@@ -1,158 +1,642 @@
 import os
-import gc
-import requests
-import json
-from pymilvus import Collection, CollectionSchema, FieldSchema, DataType, utility
-from config import COLLECTION_NAME, EMBED_MODEL
-from utils.chunker import chunk_text
-
-BATCH_SIZE = 8  # Process multiple chunks at once
+import time
+import argparse
+import numpy as np
+from config import (
+    COLLECTION_NAME, EMBED_MODEL, EMBED_DIM, OLLAMA_BASE_URL, EMBED_WORKERS,
+    EMBED_CACHE_ENABLED, DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_NUM_PERM,
+    LEXICAL_INDEX_ENABLED, BULK_IMPORT_PREFIX, CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNK_CHARS,
+    EMBED_OUTAGE_TIMEOUT,
+)
+from embeddings import get_embedding_client, CircuitOpenError
+from embedding_cache import EmbeddingCache
+from pipeline import run_pipeline, iter_stored_chunks, iter_stored_documents, chunk_metadata
+from manifest import IngestManifest, file_hash, chunk_hash
+from vector_store import get_vector_store, memory_per_million, take_metadata, METADATA_FIELDS
+from checkpoint import IngestCheckpoint, DeadLetterQueue
+from result_cache import mark_collection_changed
+from lexical_index import BM25Index
+from batching import BatchSizer, InsertBuffer, adaptive_batches
+from utils.loaders import SUPPORTED_EXTENSIONS, LoaderStats
+from utils.dedup import ChunkDeduplicator
+from metrics import METRICS, inc, timed_iter, log
 
 class OllamaEmbedder:
-    def __init__(self, model_name="nomic-embed-text"):
+    def __init__(self, model_name=EMBED_MODEL, use_cache=EMBED_CACHE_ENABLED, base_url=OLLAMA_BASE_URL,
+                 backend=None):
         self.model_name = model_name
-        self.base_url = "http://localhost:11434"
-        print(f"� Using Ollama model: {model_name}")
+        self.client = get_embedding_client(backend, model_name, base_url=base_url)
+        self.cache = EmbeddingCache() if use_cache else None
+        print(f"🧠 Using {self.client.label} model: {model_name}")
         
-        # Test connection
+        # Test connection (or load the in-process model)
+        self.client.check()
+    
+    def _embed(self, texts):
+        """
+        Embed texts with one request per batch.
+        Returns (embeddings, failed): embeddings of the texts that succeeded,
+        in order, and {index: error} for the rest. If the batch request
+        fails, texts are retried one by one so one bad text does not fail
+        its neighbours. CircuitOpenError is raised instead of being counted
+        as a failure, since the server is down rather than the texts bad.
+        """
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            if response.status_code == 200:
-                print("✅ Connected to Ollama successfully!")
-            else:
-                raise Exception("Cannot connect to Ollama")
-        except Exception as e:
-            print(f"❌ Error connecting to Ollama: {e}")
-            print("Make sure Ollama is running: ollama serve")
+            return self.client.embed(texts), {}
+        except CircuitOpenError:
             raise
-    
-    def encode(self, texts):
-        """Encode texts using Ollama API"""
-        embeddings = []
-        
+        except Exception as e:
+            inc("embed_batch_failures_total")
+            print(f"❌ Batch embedding failed ({e}), retrying texts one by one")
+
+        embeddings = np.empty((len(texts), EMBED_DIM), dtype=np.float32)
+        failed = {}
         for i, text in enumerate(texts):
             try:
-                # Prepare the request
-                payload = {
-                    "model": self.model_name,
-                    "prompt": text
-                }
-                
-                # Make request to Ollama
-                response = requests.post(
-                    f"{self.base_url}/api/embeddings",
-                    json=payload,
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    embedding = result["embedding"]
-                    embeddings.append(embedding)
-                    
-                    if (i + 1) % 5 == 0:  # Progress every 5 items
-                        print(f"    🔄 Processed {i+1}/{len(texts)} embeddings")
-                else:
-                    print(f"❌ Error getting embedding for text {i+1}: {response.text}")
-                    # Use zero vector as fallback
-                    embeddings.append([0.0] * 768)  # Nomic-embed-text is 768 dimensions
-                    
+                embeddings[i] = self.client.embed_one(text)
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 print(f"❌ Error processing text {i+1}: {e}")
-                # Use zero vector as fallback
-                embeddings.append([0.0] * 768)
-        
-        return embeddings
-
-def create_collection():
-    # Drop existing collection to avoid conflicts
-    if utility.has_collection(COLLECTION_NAME):
-        print(f"🗑️ Dropping existing collection '{COLLECTION_NAME}'...")
-        utility.drop_collection(COLLECTION_NAME)
-
-    fields = [
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=768),  # Nomic-embed-text is 768 dimensions
-        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=1024)
-    ]
-    schema = CollectionSchema(fields, description="Research documents")
-    collection = Collection(COLLECTION_NAME, schema)
-    
-    # Create index for better search performance
-    index_params = {
-        "metric_type": "COSINE",
-        "index_type": "IVF_FLAT", 
-        "params": {"nlist": 64}  # Smaller nlist for small datasets
-    }
-    collection.create_index("embedding", index_params)
-    collection.load()
-    print(f"✅ Created collection: {COLLECTION_NAME}")
-    return collection
-
-def ingest_docs():
+                inc("embed_failures_total")
+                failed[i] = e
+        keep = [i for i in range(len(texts)) if i not in failed]
+        return embeddings[keep], failed
+
+    def _embed_waiting(self, texts, outage_timeout=EMBED_OUTAGE_TIMEOUT):
+        """_embed, waiting out an open circuit breaker for up to `outage_timeout` seconds"""
+        deadline = time.monotonic() + outage_timeout
+        while True:
+            try:
+                return self._embed(texts)
+            except CircuitOpenError as e:
+                if time.monotonic() + e.retry_after > deadline:
+                    raise
+                time.sleep(e.retry_after)
+
+    def encode(self, texts):
+        """
+        Encode texts using the embedding cache first, then the embedding backend.
+        Returns (embeddings, failed) like _embed: rows only for the texts
+        that were embedded, and {index: error} for those that were not.
+        Raises CircuitOpenError when the server stays down.
+        """
+        if self.cache is None:
+            return self._embed_waiting(texts)
+
+        embeddings, missing = self.cache.get_many(self.model_name, texts)
+        failed = {}
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh, missing_failed = self._embed_waiting(missing_texts)
+            fetched = [j for j in range(len(missing)) if j not in missing_failed]
+            embeddings[[missing[j] for j in fetched]] = fresh
+            self.cache.put_many(self.model_name, [missing_texts[j] for j in fetched], fresh)
+            failed = {missing[j]: error for j, error in missing_failed.items()}
+        if failed:
+            embeddings = embeddings[[i for i in range(len(texts)) if i not in failed]]
+        return embeddings, failed
+
+def list_documents(data_dir):
+    """Text, Markdown, PDF and DOCX files under data_dir, as sorted paths relative to it"""
+    found = []
+    for root, dirs, names in os.walk(data_dir):
+        dirs.sort()
+        for name in names:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, name), data_dir).replace(os.sep, "/"))
+    return sorted(found)
+
+def open_incremental(store, use_lexical=LEXICAL_INDEX_ENABLED):
+    """
+    Open the store and its manifest without dropping anything.
+    Falls back to a fresh collection when there is no usable manifest,
+    since rows without a manifest entry could never be cleaned up.
+    The journal of an interrupted run is checked against the store, so
+    rows it never flushed are embedded again and its deletes reapplied.
+    """
+    manifest = IngestManifest.load(COLLECTION_NAME)
+    if manifest is None or not store.exists():
+        print("📒 No ingest manifest found, building the collection from scratch")
+        BM25Index.remove()
+        lexical = BM25Index() if use_lexical else None
+        manifest = IngestManifest(COLLECTION_NAME)
+        # Written up front, so the journal of this run is never applied to an older manifest
+        manifest.save()
+        return store.create(), manifest, lexical
+
+    lexical = None
+    if use_lexical and BM25Index.exists():
+        lexical = BM25Index.load()
+    elif use_lexical:
+        # Send every file through the chunk diff so its kept rows get indexed
+        print("📒 No lexical index found, indexing existing chunks")
+        lexical = BM25Index()
+        for entry in manifest.files.values():
+            entry["hash"] = None
+
+    store.open()
+    print(f"📒 Loaded manifest with {len(manifest.files)} files")
+    if manifest.journaled:
+        # An interrupted run may have crashed before flushing the store: deletes
+        # it journaled are applied again and rows it journaled but never stored
+        # are embedded again
+        store.delete(manifest.dropped)
+        ids = manifest.journaled_ids()
+        present = set()
+        for start in range(0, len(ids), 1000):
+            present.update(store.select(ids[start:start + 1000]))
+        lost = manifest.retain(present)
+        if lost:
+            print(f"♻️ {len(lost)} journaled chunks were never stored, re-ingesting them")
+        if lexical is not None:
+            # Merged now, since the ids of lost rows are reused by the next inserts
+            lexical.delete(manifest.dropped + lost)
+            lexical.save()
+        store.flush()
+        manifest.save()
+    return store, manifest, lexical
+
+def ingest_incremental(embedder, store, manifest, data_dir, files, lexical=None):
+    """
+    Insert only new chunks and delete chunks of changed or removed files.
+    A file with chunks that failed to embed stays marked incomplete in the
+    manifest, so the next incremental run embeds just those chunks.
+    Progress is journaled per batch and the manifest rewritten once at the end.
+    """
+    stats = {"unchanged": 0, "changed": 0, "removed": 0, "inserted": 0, "deleted": 0, "failed": 0}
+    ingested_at = int(time.time())
+    sizer = BatchSizer()
+
+    for name in sorted(set(manifest.files) - set(files)):
+        stale = [entry[1] for entry in manifest.files[name]["chunks"]]
+        store.delete(stale)
+        if lexical is not None:
+            lexical.delete(stale)
+        del manifest.files[name]
+        manifest.record(name)
+        stats["removed"] += 1
+        stats["deleted"] += len(stale)
+        print(f"🗑️ Removed {name}: deleted {len(stale)} chunks")
+
+    for fname in files:
+        try:
+            path = os.path.join(data_dir, fname)
+            unchanged, digest = manifest.is_unchanged(fname, path)
+            if unchanged:
+                stats["unchanged"] += 1
+                continue
+            if digest is None:
+                digest = file_hash(path)
+
+            # First pass hashes the chunks, the second streams only the new ones
+            hashes = [chunk_hash(chunk) for chunk in timed_iter("chunk_seconds", iter_stored_chunks(path))]
+            keep, new, stale = manifest.diff_chunks(fname, hashes)
+            # Delete first and journal progress after every batch, so a failure
+            # part-way through leaves the manifest matching the collection
+            store.delete(stale)
+            if lexical is not None:
+                lexical.delete(stale)
+            manifest.set_file(fname, path, None, keep)
+            manifest.record(fname)
+
+            # Kept rows missing from the lexical index (e.g. after an interrupted
+            # run) are re-indexed from the second pass as well
+            repair = {}
+            if lexical is not None:
+                unindexed = set(lexical.missing([entry[1] for entry in keep]))
+                repair = {entry[2]: entry[1] for entry in keep if entry[1] in unindexed}
+            new_set = set(new)
+
+            def new_chunks():
+                for i, chunk in enumerate(iter_stored_chunks(path)):
+                    if i in new_set:
+                        yield i, chunk
+                    elif repair:
+                        pk = repair.pop(i, None)
+                        if pk is not None:
+                            lexical.add([pk], [chunk])
+
+            failed = 0
+            for records in timed_iter("chunk_batch_seconds", adaptive_batches(new_chunks(), sizer)):
+                batch = [text for _, text in records]
+                started = time.perf_counter()
+                embeddings, errors = embedder.encode(batch)
+                sizer.observe(len(batch), time.perf_counter() - started)
+                if errors:
+                    failed += len(errors)
+                    records = [record for i, record in enumerate(records) if i not in errors]
+                    batch = [text for _, text in records]
+                    if not batch:
+                        continue
+                metadata = chunk_metadata(fname, [i for i, _ in records], batch, ingested_at)
+                ids = store.insert(embeddings, batch, metadata)
+                if lexical is not None:
+                    lexical.add(ids, batch)
+                added = [[chunk_hash(text), pk, i] for (i, text), pk in zip(records, ids)]
+                keep.extend(added)
+                manifest.record(fname, added)
+
+            manifest.set_file(fname, path, None if failed else digest, keep)
+            manifest.record(fname)
+            if lexical is not None:
+                # Journaled per file, merged into the index once at the end of the run
+                lexical.save(merge=False)
+            stats["changed"] += 1
+            stats["inserted"] += len(new) - failed
+            stats["deleted"] += len(stale)
+            stats["failed"] += failed
+            if failed:
+                print(f"📄 {fname}: +{len(new) - failed} / -{len(stale)} chunks, "
+                      f"{failed} failed (retried by the next incremental run)")
+            else:
+                print(f"📄 {fname}: +{len(new)} / -{len(stale)} chunks")
+        except CircuitOpenError:
+            # Progress is in the journals; the next incremental run continues from it.
+            # The rows they list are flushed first, or reopening the store drops them
+            store.flush()
+            manifest.save()
+            if lexical is not None:
+                lexical.save()
+            raise
+        except Exception as e:
+            print(f"❌ Error processing file {fname}: {e}")
+            continue
+
+    manifest.save()
+    if lexical is not None:
+        lexical.save()
+    return stats
+
+def report_cache(embedder):
+    if embedder.cache is None:
+        return
+    stats = embedder.cache.stats()
+    print(f"💾 Embedding cache: {stats['memory_hits'] + stats['disk_hits']} hits, "
+          f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
+def report_storage(store):
+    """Estimated memory per million chunks, full-precision inline storage vs this store's layout"""
+    before = memory_per_million(EMBED_DIM)
+    after = store.memory_per_million()
+    text = "out-of-line" if store.text_out_of_line else "inline"
+    index = f", {store.coarse_dim}-dim index" if store.coarse_dim else ""
+    print(f"💾 Memory per 1M chunks: {before / 1e9:.2f} GB (float32, inline text) -> "
+          f"{after / 1e9:.2f} GB ({store.vector_dtype}{index}, {text} text)")
+
+def report_formats(formats):
+    """Extraction throughput per input format"""
+    for fmt, entry in formats.items():
+        print(f"📑 {fmt}: {entry['files']} files, {entry['bytes'] / 1e6:.1f} MB in {entry['seconds']:.1f}s "
+              f"({entry['mb_per_sec']:.2f} MB/s, {entry['files_per_sec']:.1f} files/s, "
+              f"{entry['chunks']} chunks)")
+
+def report_dedup(dedup):
+    if dedup is None:
+        return
+    stats = dedup.stats()
+    print(f"🧹 Dedup: skipped {stats['exact_duplicates']} exact and {stats['near_duplicates']} "
+          f"near duplicates, saving {stats['embedding_calls_saved']} embedding calls and "
+          f"{stats['rows_saved']} rows")
+
+def input_stats(data_dir, files):
+    """[size, mtime] of each input file"""
+    inputs = {}
+    for fname in files:
+        stat = os.stat(os.path.join(data_dir, fname))
+        inputs[fname] = [stat.st_size, stat.st_mtime]
+    return inputs
+
+def checkpoint_header(store, data_dir, files, ingested_at, use_dedup=DEDUP_ENABLED):
+    """Everything a resumed full ingest must share with the interrupted one"""
+    inputs = input_stats(data_dir, files)
+    return {"collection": COLLECTION_NAME, "backend": store.name, "model": EMBED_MODEL,
+            "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "max_chunk_chars": MAX_CHUNK_CHARS,
+            "dedup": use_dedup, "files": inputs, "ingested_at": ingested_at}
+
+def restore_lexical(store, lexical, ids, block=1000):
+    """Index stored rows in the BM25 index, reading their text back from the store"""
+    for start in range(0, len(ids), block):
+        hits = store.attach_text([{"id": pk, "text": None} for pk in ids[start:start + block]])
+        lexical.add([hit["id"] for hit in hits], [hit["text"] for hit in hits])
+
+def open_full_ingest(store, header, use_lexical=LEXICAL_INDEX_ENABLED, fresh=False):
+    """
+    Resume an interrupted full ingest of the same inputs, or start over.
+    Returns (store, checkpoint, lexical, dead_letters). On resume, logged
+    rows missing from the store (e.g. never flushed before the crash) are
+    dropped from the checkpoint and the BM25 index is rebuilt from the
+    committed rows. Starting over drops the collection, the manifest and
+    the BM25 index.
+    """
+    # Dead-lettered chunks of this collection are embedded again by the
+    # resumed or restarted run; entries of other collections are kept
+    dead_letters = DeadLetterQueue()
+    discarded = dead_letters.discard()
+    if discarded:
+        print(f"☠️ Discarded {discarded} dead-lettered chunks of {COLLECTION_NAME} from {dead_letters.path}; "
+              f"this run embeds them again")
+    checkpoint = None if fresh else IngestCheckpoint.load(header)
+    if checkpoint is not None and store.exists():
+        store.open()
+        ids = checkpoint.ids()
+        present = set()
+        for start in range(0, len(ids), 1000):
+            present.update(store.select(ids[start:start + 1000]))
+        checkpoint.retain(present)
+        checkpoint.rewrite()
+        lexical = None
+        if use_lexical:
+            lexical = BM25Index()
+            restore_lexical(store, lexical, checkpoint.ids())
+        print(f"♻️ Resuming interrupted ingest: {len(checkpoint)} chunks already committed")
+        return store, checkpoint, lexical, dead_letters
+
+    store.create()
+    # A full rebuild replaces any manifest of earlier runs; its own is written once it completes
+    IngestManifest.remove()
+    BM25Index.remove()
+    lexical = BM25Index() if use_lexical else None
+    return store, IngestCheckpoint.start(header), lexical, dead_letters
+
+def write_full_manifest(store, checkpoint, data_dir, incomplete, block=1000):
+    """
+    Record the rows logged by a completed full ingest in a new manifest, so
+    the next incremental run starts from them. Files with dead-lettered
+    chunks are marked incomplete.
+    """
+    logged = IngestCheckpoint.load(checkpoint.header, checkpoint.path)
+    rows = [(source, i, pk) for source, chunks in logged.committed.items() for i, pk in chunks.items()]
+    chunks = {}
+    for start in range(0, len(rows), block):
+        hits = store.attach_text([{"id": pk, "text": None} for _, _, pk in rows[start:start + block]])
+        for (source, i, pk), hit in zip(rows[start:start + block], hits):
+            chunks.setdefault(source, []).append([chunk_hash(hit["text"]), pk, i])
+    manifest = IngestManifest.from_rows(COLLECTION_NAME, chunks, data_dir, checkpoint.header["files"], incomplete)
+    manifest.save()
+    print(f"📒 Wrote the ingest manifest ({len(manifest.files)} files)")
+
+def finish_full_ingest(store, lexical, checkpoint, dead_letters, data_dir):
+    """Persist a completed full ingest, record it in the manifest and drop its checkpoint"""
+    store.flush()
+    store.optimize_index()
+    if lexical is not None:
+        lexical.save()
+    write_full_manifest(store, checkpoint, data_dir, dead_letters.sources)
+    IngestCheckpoint.remove()
+    mark_collection_changed()
+    if dead_letters.added:
+        print(f"☠️ {dead_letters.added} chunks failed and were written to {dead_letters.path}; "
+              f"replay them with: python3 ingest.py --replay-dead-letters")
+
+def replay_dead_letters(embedder):
+    """
+    Embed and insert the chunks in the dead-letter file into the current
+    collection. Chunks that fail again stay in the file with their new error;
+    entries of other collections are left as they are. Inserted rows are
+    added to the manifest, so incremental runs keep and later replace them.
+    """
+    dead_letters = DeadLetterQueue()
+    entries = dead_letters.read()
+    others = [entry for entry in entries if not dead_letters.belongs(entry)]
+    entries = [entry for entry in entries if dead_letters.belongs(entry)]
+    if not entries:
+        print(f"✅ No dead letters for {COLLECTION_NAME} in {dead_letters.path}")
+        return
+    print(f"☠️ Replaying {len(entries)} dead-lettered chunks")
+    store = get_vector_store().open()
+    lexical = BM25Index.load() if LEXICAL_INDEX_ENABLED and BM25Index.exists() else None
+    manifest = IngestManifest.load(COLLECTION_NAME)
+    sizer = BatchSizer()
+    remaining, inserted = [], 0
+    batches = adaptive_batches(entries, sizer)
+    try:
+        for batch in batches:
+            texts = [entry["text"] for entry in batch]
+            started = time.perf_counter()
+            embeddings, failed = embedder.encode(texts)
+            sizer.observe(len(texts), time.perf_counter() - started)
+            remaining.extend({**batch[i], "error": str(error), "failed_at": int(time.time())}
+                             for i, error in failed.items())
+            ok = [entry for i, entry in enumerate(batch) if i not in failed]
+            if not ok:
+                continue
+            texts = [entry["text"] for entry in ok]
+            try:
+                ids = store.insert(embeddings, texts, {field: [entry[field] for entry in ok]
+                                                       for field in METADATA_FIELDS})
+            except Exception as e:
+                print(f"  ❌ Error inserting {len(ok)} rows: {e}")
+                remaining.extend({**entry, "error": str(e), "failed_at": int(time.time())} for entry in ok)
+                continue
+            if lexical is not None:
+                lexical.add(ids, texts)
+            if manifest is not None:
+                for entry, pk in zip(ok, ids):
+                    if entry["source"] in manifest.files:
+                        row = [chunk_hash(entry["text"]), pk, entry["chunk_index"]]
+                        manifest.files[entry["source"]]["chunks"].append(row)
+                        manifest.record(entry["source"], [row])
+            inserted += len(ok)
+    except CircuitOpenError as e:
+        print(f"❌ Embedding server unavailable: {e}")
+        remaining.extend(batch)
+        remaining.extend(entry for rest in batches for entry in rest)
+    finally:
+        store.flush()
+        if lexical is not None:
+            lexical.save()
+        if manifest is not None:
+            manifest.save()
+        dead_letters.rewrite(others + remaining)
+        if inserted:
+            mark_collection_changed()
+    print(f"🎉 Replayed {inserted} chunks, {len(remaining)} still failing")
+
+def export_docs(embedder, data_dir, files, export, workers=EMBED_WORKERS, use_dedup=DEDUP_ENABLED):
+    """Embed all documents into columnar shards for bulk_import.py instead of inserting them"""
+    from bulk_import import ColumnarWriter
+    # Input stats let bulk_import.py tell which files changed after the export
+    writer = ColumnarWriter(export, inputs=input_stats(data_dir, files)).create()
+    print(f"📚 Found {len(files)} files to export to {export}")
+    dedup = ChunkDeduplicator(DEDUP_THRESHOLD, DEDUP_NUM_PERM) if use_dedup else None
+    paths = [os.path.join(data_dir, fname) for fname in files]
+    stats = run_pipeline(paths, embedder, writer, workers=workers, dedup=dedup, root=data_dir)
+    writer.flush()
+    print(f"\n📦 Exported {stats['inserted']} chunks from {stats['files']} files in {len(writer.done)} shards "
+          f"in {stats['seconds']:.1f}s ({stats['chunks_per_sec']:.1f} chunks/s)")
+    print(f"   Upload {export} to the Milvus bucket under '{BULK_IMPORT_PREFIX}/', "
+          f"then run: python3 bulk_import.py {export}")
+    report_formats(stats["formats"])
+    report_cache(embedder)
+    report_dedup(dedup)
+    report_storage(writer)
+
+def ingest_docs(pipelined=False, workers=EMBED_WORKERS, incremental=False, use_dedup=DEDUP_ENABLED,
+                export=None, fresh=False):
     try:
-        print("🚀 Starting document ingestion with Ollama...")
+        print("🚀 Starting document ingestion...")
         embedder = OllamaEmbedder()
-        collection = create_collection()
 
         data_dir = "data"
         if not os.path.exists(data_dir):
             print(f"❌ Data directory '{data_dir}' not found!")
             return
 
-        files = [f for f in os.listdir(data_dir) if f.endswith(('.txt', '.md'))]
+        files = list_documents(data_dir)
+
+        store = get_vector_store()
+        if incremental:
+            store, manifest, lexical = open_incremental(store)
+            print(f"📚 Found {len(files)} files, checking for changes")
+            try:
+                stats = ingest_incremental(embedder, store, manifest, data_dir, files, lexical)
+            finally:
+                store.flush()
+            store.optimize_index()
+            mark_collection_changed()
+            print(f"\n🎉 Incremental ingest done: {stats['changed']} changed, "
+                  f"{stats['unchanged']} unchanged, {stats['removed']} removed files "
+                  f"(+{stats['inserted']} / -{stats['deleted']} chunks)")
+            report_cache(embedder)
+            report_storage(store)
+            return
+
         if not files:
             print(f"❌ No text files found in '{data_dir}'")
             return
 
+        if export:
+            export_docs(embedder, data_dir, files, export, workers, use_dedup)
+            return
+
+        ingested_at = int(time.time())
+        header = checkpoint_header(store, data_dir, files, ingested_at, use_dedup)
+        store, checkpoint, lexical, dead_letters = open_full_ingest(store, header, fresh=fresh)
+        ingested_at = checkpoint.header["ingested_at"]
         print(f"📚 Found {len(files)} files to process")
+        dedup = ChunkDeduplicator(DEDUP_THRESHOLD, DEDUP_NUM_PERM) if use_dedup else None
 
-        for fname in files:
-            try:
-                path = os.path.join(data_dir, fname)
-                print(f"\n📄 Processing: {fname}")
-                
-                with open(path, "r", encoding='utf-8') as f:
-                    raw_text = f.read()
-
-                if len(raw_text.strip()) == 0:
-                    print(f"⚠️ Skipping empty file: {fname}")
-                    continue
+        if pipelined:
+            print(f"⚡ Pipelined mode: {workers} embedding workers")
+            paths = [os.path.join(data_dir, fname) for fname in files]
+            stats = run_pipeline(paths, embedder, store, workers=workers, dedup=dedup,
+                                 lexical=lexical, root=data_dir, checkpoint=checkpoint,
+                                 dead_letters=dead_letters, ingested_at=ingested_at)
+            finish_full_ingest(store, lexical, checkpoint, dead_letters, data_dir)
+            print(f"\n🎉 Ingested {stats['inserted']} chunks from {stats['files']} files "
+                  f"in {stats['seconds']:.1f}s ({stats['chunks_per_sec']:.1f} chunks/s)")
+            if stats["resumed"]:
+                print(f"♻️ {stats['resumed']} chunks were committed by the interrupted run")
+            report_formats(stats["formats"])
+            report_cache(embedder)
+            report_dedup(dedup)
+            report_storage(store)
+            return
 
-                chunks = chunk_text(raw_text, chunk_size=400, overlap=50)
-                print(f"📝 Split into {len(chunks)} chunks")
-
-                # Process in batches
-                for i in range(0, len(chunks), BATCH_SIZE):
-                    try:
-                        batch = chunks[i:i+BATCH_SIZE]
-                        # Truncate chunks for VARCHAR limit
-                        batch = [chunk[:900] for chunk in batch]  # Leave some buffer
-                        
-                        print(f"  🔄 Processing batch {i//BATCH_SIZE+1}/{(len(chunks)-1)//BATCH_SIZE+1}")
-                        embeddings = embedder.encode(batch)
-                        
-                        collection.insert([embeddings, batch])
-                        
-                        print(f"  ✅ Inserted batch {i//BATCH_SIZE+1}")
-                        
-                        # Light garbage collection
-                        gc.collect()
-                        
-                    except Exception as e:
-                        print(f"  ❌ Error processing batch {i//BATCH_SIZE+1}: {e}")
-                        continue
+        loader_stats = LoaderStats()
+        sizer = BatchSizer()
+        buffer = InsertBuffer(store, lexical, checkpoint=checkpoint, dead_letters=dead_letters)
+        documents = iter_stored_documents([os.path.join(data_dir, fname) for fname in files], loader_stats)
+        try:
+            for fname, (path, document) in zip(files, documents):
+                try:
+                    print(f"\n📄 Processing: {fname}")
+                    
+                    # Chunks are streamed from the file, embedded in latency-sized
+                    # batches and buffered for byte-sized inserts; chunks committed
+                    # by an interrupted run are only shown to the deduplicator
+                    chunk_count = 0
+                    committed = checkpoint.rows(fname)
+                    batches = timed_iter("chunk_batch_seconds", adaptive_batches(enumerate(document), sizer))
+                    for batch_no, records in enumerate(batches, 1):
+                        chunk_count += len(records)
+                        if dedup is not None:
+                            records = [(i, text) for i, text in records
+                                       if dedup.check(text) is None and i not in committed]
+                        elif committed:
+                            records = [(i, text) for i, text in records if i not in committed]
+                        if not records:
+                            continue
+                        batch = [text for _, text in records]
+                        metadata = chunk_metadata(fname, [i for i, _ in records], batch, ingested_at)
+                        try:
+                            log(f"  🔄 Processing batch {batch_no} ({len(batch)} chunks)")
+                            started = time.perf_counter()
+                            embeddings, failed = embedder.encode(batch)
+                            sizer.observe(len(batch), time.perf_counter() - started)
+                        except CircuitOpenError:
+                            raise
+                        except Exception as e:
+                            embeddings, failed = None, dict.fromkeys(range(len(batch)), e)
+                        if failed:
+                            rows = sorted(failed)
+                            dead_letters.add([batch[i] for i in rows], take_metadata(metadata, rows),
+                                             [failed[i] for i in rows])
+                            keep = [i for i in range(len(batch)) if i not in failed]
+                            if not keep:
+                                continue
+                            batch, metadata = [batch[i] for i in keep], take_metadata(metadata, keep)
+                        buffer.add(embeddings, batch, metadata)
 
-            except Exception as e:
-                print(f"❌ Error processing file {fname}: {e}")
-                continue
+                    if chunk_count == 0:
+                        print(f"⚠️ Skipping empty file: {fname}")
+                    else:
+                        print(f"📝 Split into {chunk_count} chunks")
+
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    print(f"❌ Error processing file {fname}: {e}")
+                    continue
+        finally:
+            # Whatever was embedded is committed, so a resumed run starts after it
+            buffer.flush()
 
-        collection.flush()
+        finish_full_ingest(store, lexical, checkpoint, dead_letters, data_dir)
         print("\n🎉 All documents ingested successfully!")
+        report_formats(loader_stats.summary())
+        report_cache(embedder)
+        report_dedup(dedup)
+        report_storage(store)
         
+    except CircuitOpenError as e:
+        print(f"❌ Embedding server unavailable: {e}")
+        print("   Progress is checkpointed; run the same command again to resume")
+        raise
     except Exception as e:
         print(f"❌ Fatal error during ingestion: {e}")
         raise
 
 if __name__ == "__main__":
-    ingest_docs()
+    parser = argparse.ArgumentParser(description="Ingest documents from data/ into the vector store")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="overlap chunking, embedding and inserts")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS,
+                        help="parallel embedding workers in pipelined mode")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ingest what changed since the last run, keep the collection loaded")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="embed and store duplicate chunks too")
+    parser.add_argument("--export", metavar="DIR",
+                        help="write embedded chunks as columnar shards for bulk_import.py instead of inserting")
+    parser.add_argument("--fresh", action="store_true",
+                        help="start a full ingest over instead of resuming an interrupted one")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                        help="embed and insert the chunks that failed in earlier runs")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record per-stage timings and write them to METRICS_EXPORT_PATH")
+    args = parser.parse_args()
+    if args.incremental and args.pipelined:
+        parser.error("--incremental and --pipelined cannot be combined")
+    if args.incremental and args.export:
+        parser.error("--incremental and --export cannot be combined")
+    if args.metrics:
+        METRICS.enable()
+    if args.replay_dead_letters:
+        replay_dead_letters(OllamaEmbedder())
+    else:
+        ingest_docs(pipelined=args.pipelined, workers=args.workers, incremental=args.incremental,
+                    use_dedup=DEDUP_ENABLED and not args.no_dedup, export=args.export, fresh=args.fresh)
+    if METRICS.enabled:
+        print(f"📈 Metrics written to {METRICS.export()}")
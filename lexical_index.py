@@ -0,0 +1,365 @@
+import os
+import re
+import json
+import shutil
+from array import array
+from collections import Counter
+import numpy as np
+from config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B
+from chunk_store import ChunkTextStore
+from utils.summarizer import sentence_stats
+
+_TOKEN = re.compile(r"\w+")
+_ARRAYS = (
+    "term_offsets", "post_docs", "post_tf", "doc_ids", "doc_len", "text_offset", "text_length",
+    "doc_sent_start", "sent_bounds", "sent_term_start", "sent_terms", "sent_counts",
+)
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _ranges(starts, ends):
+    """Concatenation of arange(start, end) for each pair, without a Python loop"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+class BM25Index:
+    """
+    BM25 inverted index over the stored chunks, keyed by vector store ids.
+    The compiled index is a set of flat NumPy arrays (per-term posting
+    slices of doc positions and term frequencies) that are memory-mapped
+    for querying; chunk texts sit in an append-only ChunkTextStore and are
+    read by (offset, length) only when a hit or a summary needs them.
+
+    Ingestion adds and deletes documents. save(merge=False) appends them
+    to a delta journal, at the cost of the changes alone, and keeps only
+    their ids in memory; merge() tokenizes the journaled chunks and folds
+    them into the arrays without re-tokenizing unchanged ones, once per
+    run. load() merges the delta left by an interrupted run.
+
+    Alongside the postings it keeps a forward index of each chunk's sentence
+    boundaries and per-sentence term counts, used by the summarizer.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.terms = []
+        self.vocab = {}
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.int32)
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        self.text_offset = np.zeros(0, dtype=np.int64)
+        self.text_length = np.zeros(0, dtype=np.int64)
+        self.doc_sent_start = np.zeros(1, dtype=np.int64)
+        self.sent_bounds = np.zeros((0, 2), dtype=np.int32)
+        self.sent_term_start = np.zeros(1, dtype=np.int64)
+        self.sent_terms = np.zeros(0, dtype=np.int32)
+        self.sent_counts = np.zeros(0, dtype=np.int32)
+        self.text_store = ChunkTextStore(os.path.join(path, "text"))
+        self.on_disk = False  # Whether `path` holds this index rather than an older one
+        self.positions = None
+        self.pending = []  # (id, text) added since the last save
+        self.deleted = set()  # Deleted since the last merge
+        self.journaled_ids = array("q")  # Adds in the delta journal, not merged yet
+        self.unjournaled_deletes = []
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @classmethod
+    def exists(cls, path=LEXICAL_INDEX_PATH):
+        return all(os.path.exists(os.path.join(path, name))
+                   for name in ("terms.json", "sent_terms.npy", "text_length.npy"))
+
+    @classmethod
+    def load(cls, path=LEXICAL_INDEX_PATH):
+        index = cls(path)
+        with open(index._file("terms.json"), "r", encoding="utf-8") as f:
+            index.terms = json.load(f)
+        index.vocab = {term: i for i, term in enumerate(index.terms)}
+        for name in _ARRAYS:
+            setattr(index, name, np.load(index._file(f"{name}.npy"), mmap_mode="r"))
+        index.on_disk = True
+        index._replay()
+        return index
+
+    @classmethod
+    def remove(cls, path=LEXICAL_INDEX_PATH):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def add(self, ids, texts):
+        self.pending.extend((int(pk), text) for pk, text in zip(ids, texts))
+
+    def missing(self, ids):
+        """Ids that are neither indexed nor pending"""
+        known = np.concatenate([np.asarray(self.doc_ids), np.frombuffer(self.journaled_ids, dtype=np.int64),
+                                np.array([pk for pk, _ in self.pending], dtype=np.int64)])
+        ids = np.asarray(ids, dtype=np.int64)
+        return ids[~np.isin(ids, known)].tolist()
+
+    def delete(self, ids):
+        ids = [int(pk) for pk in ids]
+        self.deleted.update(ids)
+        self.unjournaled_deletes.extend(ids)
+
+    def save(self, merge=True):
+        """
+        Persist pending adds and deletes: merged into the compiled arrays, or
+        with merge=False appended to the delta journal and dropped from memory.
+        """
+        if merge:
+            self.merge()
+            return
+        if not self.on_disk:
+            self._replace_files()
+        if self.pending or self.unjournaled_deletes:
+            added = [[pk, text] for pk, text in self.pending]
+            with open(self._file("delta.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"add": added, "delete": self.unjournaled_deletes}) + "\n")
+            self.journaled_ids.extend(pk for pk, _ in self.pending)
+        self.pending = []
+        self.unjournaled_deletes = []
+
+    def _replay(self):
+        """Merge the delta journal of an interrupted run"""
+        if os.path.exists(self._file("delta.jsonl")):
+            self.merge()
+
+    def _delta(self):
+        """Records of the delta journal; a torn last line ends it"""
+        path = self._file("delta.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+
+    def _added(self):
+        """
+        (id, text) of the adds to merge, streamed from the delta journal and
+        then the pending adds. Deleted ids are skipped, as are adds that
+        reached the arrays before the journal was dropped.
+        """
+        merged = np.sort(np.asarray(self.doc_ids))
+        for record in self._delta():
+            ids = np.array([pk for pk, _ in record["add"]], dtype=np.int64)
+            done = np.zeros(len(ids), dtype=bool)
+            if len(merged):
+                done = merged[np.minimum(np.searchsorted(merged, ids), len(merged) - 1)] == ids
+            for (pk, text), skip in zip(record["add"], done):
+                if not skip and pk not in self.deleted:
+                    yield pk, text
+        for pk, text in self.pending:
+            if pk not in self.deleted:
+                yield pk, text
+
+    def _tokenize(self, added, block=1000):
+        """
+        Tokenize chunks into flat columns, with term ids provisional (in
+        order of first use), and append their texts to the text store a
+        block at a time. Returns (terms by provisional id, columns), so no
+        per-chunk counters outlive the chunk.
+        """
+        vocab = {}
+        columns = {name: array("q") for name in ("doc_ids", "text_offset", "text_length")}
+        columns.update({name: array("i") for name in (
+            "doc_len", "doc_terms", "post_terms", "post_tf",
+            "doc_sentences", "sent_bounds", "sent_term_count", "sent_terms", "sent_counts",
+        )})
+        texts = []
+
+        def store_texts():
+            offsets, lengths = self.text_store.append(texts)
+            columns["text_offset"].extend(offsets)
+            columns["text_length"].extend(lengths)
+            texts.clear()
+
+        for pk, text in added:
+            sentences = sentence_stats(text)
+            counts = Counter()
+            for start, end, sentence_counts in sentences:
+                counts.update(sentence_counts)
+                columns["sent_bounds"].extend((start, end))
+                columns["sent_term_count"].append(len(sentence_counts))
+                columns["sent_terms"].extend(vocab.setdefault(term, len(vocab)) for term in sentence_counts)
+                columns["sent_counts"].extend(sentence_counts.values())
+            columns["doc_ids"].append(pk)
+            columns["doc_len"].append(sum(counts.values()))
+            columns["doc_terms"].append(len(counts))
+            columns["doc_sentences"].append(len(sentences))
+            columns["post_terms"].extend(vocab.setdefault(term, len(vocab)) for term in counts)
+            columns["post_tf"].extend(counts.values())
+            texts.append(text)
+            if len(texts) == block:
+                store_texts()
+        store_texts()
+        return list(vocab), {name: np.frombuffer(column, dtype=np.int64 if column.typecode == "q" else np.int32)
+                             for name, column in columns.items()}
+
+    def merge(self):
+        """
+        Merge the delta journal and pending adds and deletes into the
+        compiled arrays, write them and drop the journal. Journaled chunks
+        are streamed from the journal rather than loaded at once.
+        """
+        if not self.on_disk:
+            self._replace_files()
+        for record in self._delta():
+            self.deleted.update(record["delete"])
+        new_terms, new = self._tokenize(self._added())
+        deleted = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+        keep = ~np.isin(self.doc_ids, deleted)
+        remap = np.cumsum(keep, dtype=np.int64) - 1
+        base = int(keep.sum())
+
+        # Postings of kept chunks as flat (term, doc, tf) columns
+        old_offsets = np.asarray(self.term_offsets)
+        post_terms = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(old_offsets))
+        post_docs = np.asarray(self.post_docs)
+        mask = keep[post_docs]
+        post_terms, post_docs, post_tf = post_terms[mask], remap[post_docs[mask]], np.asarray(self.post_tf)[mask]
+
+        old_terms = self.terms
+        used = set(old_terms[i] for i in np.unique(post_terms).tolist())
+        used.update(new_terms)
+        self.terms = sorted(used)
+        self.vocab = {term: i for i, term in enumerate(self.terms)}
+        old_to_new = np.array([self.vocab.get(term, -1) for term in old_terms], dtype=np.int64)
+        provisional = np.array([self.vocab[term] for term in new_terms], dtype=np.int64)
+
+        terms = np.concatenate([old_to_new[post_terms], provisional[new["post_terms"]]])
+        docs = np.concatenate([post_docs, np.repeat(np.arange(base, base + len(new["doc_ids"]), dtype=np.int64),
+                                                    new["doc_terms"])])
+        tfs = np.concatenate([post_tf, new["post_tf"]])
+        order = np.lexsort((docs, terms))
+        counts = np.bincount(terms, minlength=len(self.terms))
+        self.term_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.post_docs = docs[order].astype(np.int32)
+        self.post_tf = tfs[order].astype(np.int32)
+
+        self._merge_sentences(keep, new, old_to_new, provisional)
+        self.text_offset = np.concatenate([np.asarray(self.text_offset)[keep], new["text_offset"]])
+        self.text_length = np.concatenate([np.asarray(self.text_length)[keep], new["text_length"]])
+        self.doc_ids = np.concatenate([np.asarray(self.doc_ids)[keep], new["doc_ids"]])
+        self.doc_len = np.concatenate([np.asarray(self.doc_len)[keep], new["doc_len"]]).astype(np.int32)
+        self.positions = None
+        self.pending = []
+        self.deleted = set()
+        self.journaled_ids = array("q")
+        self.unjournaled_deletes = []
+        self._write()
+        if os.path.exists(self._file("delta.jsonl")):
+            os.remove(self._file("delta.jsonl"))
+
+    def _replace_files(self):
+        """Replace whatever index is at `path` (e.g. of an interrupted run) with this one"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.text_store.create()
+        self._write()
+        self.on_disk = True
+
+    def _write(self):
+        # Files are replaced rather than rewritten so readers that have the
+        # old arrays memory-mapped keep a valid view
+        os.makedirs(self.path, exist_ok=True)
+        for name in _ARRAYS:
+            with open(self._file(f"{name}.npy.tmp"), "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(self._file(f"{name}.npy.tmp"), self._file(f"{name}.npy"))
+        # terms.json is written last and marks the index as complete
+        self._write_json("terms.json", self.terms)
+
+    def _merge_sentences(self, keep, new, old_to_new, provisional):
+        """Carry the forward index of kept chunks over to the new vocabulary and append the new chunks'"""
+        doc_sentences = np.diff(np.asarray(self.doc_sent_start))
+        sent_keep = np.repeat(keep, doc_sentences)
+        entry_keep = np.repeat(sent_keep, np.diff(np.asarray(self.sent_term_start)))
+
+        doc_lengths = np.concatenate([doc_sentences[keep], new["doc_sentences"]])
+        term_lengths = np.concatenate([np.diff(np.asarray(self.sent_term_start))[sent_keep], new["sent_term_count"]])
+        self.doc_sent_start = np.concatenate([[0], np.cumsum(doc_lengths)]).astype(np.int64)
+        self.sent_bounds = np.concatenate([np.asarray(self.sent_bounds)[sent_keep],
+                                           new["sent_bounds"].reshape(-1, 2)]).astype(np.int32)
+        self.sent_term_start = np.concatenate([[0], np.cumsum(term_lengths)]).astype(np.int64)
+        self.sent_terms = np.concatenate([old_to_new[np.asarray(self.sent_terms)[entry_keep]],
+                                          provisional[new["sent_terms"]]]).astype(np.int32)
+        self.sent_counts = np.concatenate([np.asarray(self.sent_counts)[entry_keep],
+                                           new["sent_counts"]]).astype(np.int32)
+
+    def text(self, position):
+        """Text of the chunk at `position` in the compiled arrays"""
+        return self.text_store.get(int(self.text_offset[position]), int(self.text_length[position]))
+
+    def sentences_for(self, ids):
+        """
+        Forward index rows of the given chunks, for the summarizer.
+        Returns (sentence doc positions, sentence bounds, per-entry sentence
+        index, term ids, counts); ids that are not indexed are skipped.
+        """
+        if self.positions is None:
+            self.positions = {int(pk): i for i, pk in enumerate(self.doc_ids)}
+        docs = np.array([self.positions[pk] for pk in ids if pk in self.positions], dtype=np.int64)
+        doc_sent_start = np.asarray(self.doc_sent_start)
+        sentences = _ranges(doc_sent_start[docs], doc_sent_start[docs + 1])
+        sentence_doc = np.repeat(docs, doc_sent_start[docs + 1] - doc_sent_start[docs])
+
+        sent_term_start = np.asarray(self.sent_term_start)
+        entries = _ranges(sent_term_start[sentences], sent_term_start[sentences + 1])
+        entry_sentence = np.repeat(np.arange(len(sentences)),
+                                   sent_term_start[sentences + 1] - sent_term_start[sentences])
+        return (
+            sentence_doc, np.asarray(self.sent_bounds)[sentences], entry_sentence,
+            np.asarray(self.sent_terms)[entries], np.asarray(self.sent_counts)[entries],
+        )
+
+    def _write_json(self, name, data):
+        with open(self._file(f"{name}.tmp"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(self._file(f"{name}.tmp"), self._file(name))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query, top_k=5):
+        """Top-k BM25 matches as {"text", "score", "id"} dicts"""
+        n_docs = len(self.doc_ids)
+        if n_docs == 0:
+            return []
+        avgdl = float(np.mean(self.doc_len)) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len, dtype=np.float32) / avgdl)
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.vocab.get(term)
+            if i is None:
+                continue
+            start, end = self.term_offsets[i], self.term_offsets[i + 1]
+            docs = self.post_docs[start:end]
+            tf = np.asarray(self.post_tf[start:end], dtype=np.float32)
+            idf = np.log(1.0 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"text": self.text(i), "score": float(scores[i]), "id": int(self.doc_ids[i])}
+            for i in top
+        ]
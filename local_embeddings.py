@@ -0,0 +1,181 @@
+import os
+import threading
+import numpy as np
+from config import (
+    EMBED_MODEL, EMBED_DIM, LOCAL_EMBED_THREADS, LOCAL_EMBED_BATCH_SIZE, LOCAL_EMBED_MAX_BATCH_TOKENS,
+    LOCAL_EMBED_MAX_LENGTH, LOCAL_EMBED_POOLING, LOCAL_EMBED_ONNX, LOCAL_EMBED_ONNX_PATH,
+)
+from embeddings import EmbeddingClient
+from metrics import span, inc
+
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def length_batches(lengths, max_texts, max_tokens):
+    """
+    Positions of texts grouped into batches, shortest first. A batch holds
+    at most `max_texts` texts and pads to at most `max_tokens` tokens (its
+    longest text times its size), so texts of similar length share a
+    batch and little compute is spent on padding.
+    """
+    batches, batch = [], []
+    for i in np.argsort(lengths, kind="stable").tolist():
+        if batch and (len(batch) == max_texts or lengths[i] * (len(batch) + 1) > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def pool(hidden, attention_mask, pooling="mean"):
+    """Unit sentence vectors from token states of shape (texts, tokens, dim)"""
+    if pooling == "cls":
+        vectors = hidden[:, 0]
+    else:
+        mask = attention_mask[:, :, None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class LocalEmbeddingClient(EmbeddingClient):
+    """
+    In-process CPU embeddings with a Hugging Face model, without the HTTP hop.
+    Texts are tokenized once, sorted by token count and grouped into
+    batches bounded by texts and padded tokens, so each forward pass only
+    pads to its own longest text. Inference runs under torch.inference_mode
+    with `threads` intra-op threads, or with ONNX Runtime when `onnx` is
+    set (the model is exported to `onnx_path` on first use). Forward
+    passes are serialized: their intra-op threads already use the cores.
+    """
+
+    name = "local"
+    label = "in-process"
+
+    def __init__(self, model_name=EMBED_MODEL, dim=EMBED_DIM, batch_size=LOCAL_EMBED_BATCH_SIZE,
+                 max_batch_tokens=LOCAL_EMBED_MAX_BATCH_TOKENS, max_length=LOCAL_EMBED_MAX_LENGTH,
+                 threads=LOCAL_EMBED_THREADS, pooling=LOCAL_EMBED_POOLING, onnx=LOCAL_EMBED_ONNX,
+                 onnx_path=LOCAL_EMBED_ONNX_PATH):
+        self.model_name = model_name
+        self.dim = dim  # None takes the model's hidden size
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = max_length
+        self.threads = threads
+        self.pooling = pooling
+        self.onnx = onnx
+        self.onnx_path = onnx_path
+        self.tokenizer = None
+        self.model = None
+        self.session = None
+        self.input_names = None
+        self.load_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load the tokenizer and the model (or ONNX Runtime session) once"""
+        with self.load_lock:
+            if self.input_names is not None:
+                return self
+            try:
+                import torch
+                from transformers import AutoConfig, AutoTokenizer, AutoModel
+            except ImportError:
+                raise ImportError("The local embedding backend needs torch and transformers: "
+                                  "pip install sentence-transformers")
+            hidden_size = AutoConfig.from_pretrained(self.model_name).hidden_size
+            if self.dim is None:
+                self.dim = hidden_size
+            elif self.dim != hidden_size:
+                raise ValueError(f"{self.model_name} returns {hidden_size}-dimensional embeddings, "
+                                 f"set EMBED_DIM = {hidden_size} in config.py and re-ingest")
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            if self.onnx:
+                self.session = self._onnx_session()
+            else:
+                self.model = AutoModel.from_pretrained(self.model_name).eval()
+            self.input_names = [name for name in INPUT_NAMES if name in self.tokenizer.model_input_names]
+        return self
+
+    def onnx_file(self):
+        return os.path.join(self.onnx_path, self.model_name.replace("/", "__") + ".onnx")
+
+    def _onnx_session(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("LOCAL_EMBED_ONNX needs ONNX Runtime: pip install onnxruntime")
+        path = self.onnx_file()
+        if not os.path.exists(path):
+            self._export_onnx(path)
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def _export_onnx(self, path):
+        """Export the model's token states with dynamic batch and sequence axes"""
+        import torch
+        from transformers import AutoModel
+        print(f"📦 Exporting {self.model_name} to {path}")
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        names = [name for name in INPUT_NAMES if name in self.tokenizer.model_input_names]
+        sample = self.tokenizer(["warm up"], return_tensors="pt")
+        axes = {0: "batch", 1: "tokens"}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model, ({name: sample[name] for name in names},), tmp,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes={name: axes for name in names + ["last_hidden_state"]}, opset_version=17,
+            )
+        os.replace(tmp, path)
+
+    def ping(self):
+        self.load()
+        return True
+
+    def check(self):
+        self.load()
+        runtime = "ONNX Runtime" if self.session is not None else "PyTorch"
+        threads = self.threads or "default"
+        print(f"✅ Loaded {self.model_name} on CPU ({runtime}, {threads} threads)")
+
+    def _forward(self, features):
+        """Token states (texts, tokens, dim) for padded NumPy inputs"""
+        if self.session is not None:
+            return self.session.run(["last_hidden_state"], {name: features[name] for name in self.input_names})[0]
+        import torch
+        with torch.inference_mode():
+            output = self.model(**{name: torch.from_numpy(features[name]) for name in self.input_names})
+            return output.last_hidden_state.float().numpy()
+
+    def embed(self, texts):
+        """
+        Embed a list of texts.
+        Returns a C-contiguous float32 array of shape (len(texts), dim).
+        """
+        texts = list(texts)
+        self.load()
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        for batch in length_batches(lengths, self.batch_size, self.max_batch_tokens):
+            features = self.tokenizer.pad({name: [encoded[name][i] for i in batch] for name in self.input_names},
+                                          return_tensors="np")
+            with self.lock, span("embed_forward_seconds"):
+                hidden = self._forward(features)
+            out[batch] = pool(hidden, features["attention_mask"], self.pooling)
+            inc("embed_forward_passes_total")
+            inc("embed_texts_total", len(batch))
+            inc("embed_tokens_total", sum(lengths[i] for i in batch))
+            inc("embed_padded_tokens_total", hidden.shape[0] * hidden.shape[1])
+        return out
@@ -0,0 +1,393 @@
+import os
+import json
+import shutil
+import numpy as np
+from config import EMBED_DIM, LOCAL_STORE_PATH, VECTOR_DTYPE, COARSE_DIM, COARSE_CANDIDATES
+from vector_store import (
+    VectorStore, source_group, empty_metadata, check_filters, quantize, truncate, INT8_SCALE,
+)
+from metrics import span
+
+SEARCH_BLOCK_ROWS = 65536  # Rows scored per matrix product, bounds temporary memory
+# Integer metadata columns in chunk_meta.bin, one int64 row per chunk
+META_COLUMNS = ("source_id", "chunk_index", "char_start", "char_end", "ingested_at")
+
+
+class LocalStore(VectorStore):
+    """
+    In-process vector store for corpora that fit in RAM.
+    Unit-normalized embeddings live in a memory-mapped float32, float16 or
+    int8 matrix (see VECTOR_DTYPE), chunk text in an append-only side file
+    indexed by end offsets and read only for returned hits. Top-k
+    cosine search is a NumPy matrix product plus argpartition. The primary
+    key of a row is its position in the matrix; deletes are tombstones.
+    Chunk metadata is an int64 matrix with source paths interned in
+    sources.json; scoped searches only score the rows of the selected
+    partitions, so their cost follows the share of rows they touch.
+    With a coarse_dim, a second matrix holds the first coarse_dim
+    dimensions of each row; searches scan it and rerank the best
+    top_k * COARSE_CANDIDATES rows against the full vectors.
+    In memory, metadata and tombstones sit in buffers that double in
+    capacity as rows are appended; `meta` and `deleted` are views of their
+    first `rows` rows, so an insert never copies the rows before it.
+    """
+
+    name = "local"
+    text_out_of_line = True
+    flush_to_commit = True
+
+    def __init__(self, path=LOCAL_STORE_PATH, dim=EMBED_DIM, dtype=VECTOR_DTYPE, coarse_dim=COARSE_DIM):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.coarse_dim = coarse_dim if coarse_dim and coarse_dim < dim else 0
+        self.rows = 0
+        self.text_end = 0
+        self.deleted_buffer = np.zeros(0, dtype=bool)
+        self.vectors = None
+        self.coarse = None
+        self.offsets = None
+        self.text = None
+        self.mapped_rows = -1
+        self.sources = []  # Source path per source id
+        self.source_ids = {}
+        self.meta_buffer = np.zeros((0, len(META_COLUMNS)), dtype=np.int64)
+        self.scope_rows = {}  # Cached candidate rows per (partitions, filters)
+
+    @property
+    def vector_dtype(self):
+        return self.dtype.name
+
+    @property
+    def meta(self):
+        return self.meta_buffer[:self.rows]
+
+    @property
+    def deleted(self):
+        return self.deleted_buffer[:self.rows]
+
+    def _reserve(self, rows):
+        """Grow the metadata and tombstone buffers to hold `rows` rows, doubling their capacity"""
+        capacity = len(self.deleted_buffer)
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, 1024)
+        meta = np.zeros((capacity, len(META_COLUMNS)), dtype=np.int64)
+        meta[:self.rows] = self.meta
+        deleted = np.zeros(capacity, dtype=bool)
+        deleted[:self.rows] = self.deleted
+        self.meta_buffer, self.deleted_buffer = meta, deleted
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self):
+        return os.path.exists(self._file("meta.json"))
+
+    def create(self):
+        if os.path.exists(self.path):
+            print(f"🗑️ Dropping existing local store '{self.path}'...")
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        for name in ("vectors.bin", "coarse.bin", "offsets.bin", "text.bin", "deleted.bin", "chunk_meta.bin"):
+            open(self._file(name), "wb").close()
+        self.rows = 0
+        self.text_end = 0
+        self.deleted_buffer = np.zeros(0, dtype=bool)
+        self.sources, self.source_ids = [], {}
+        self.meta_buffer = np.zeros((0, len(META_COLUMNS)), dtype=np.int64)
+        self.scope_rows = {}
+        self.flush()
+        print(f"✅ Created local store: {self.path}")
+        return self
+
+    def open(self):
+        with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Local store has dim {meta['dim']}, expected {self.dim}")
+        self.dtype = np.dtype(meta["dtype"])
+        self.coarse_dim = meta.get("coarse_dim", 0)
+        self.rows = meta["rows"]
+
+        # Drop anything appended after the last flush (e.g. by a crashed run)
+        os.truncate(self._file("vectors.bin"), self.rows * self.dim * self.dtype.itemsize)
+        if self.coarse_dim:
+            os.truncate(self._file("coarse.bin"), self.rows * self.coarse_dim * self.dtype.itemsize)
+        os.truncate(self._file("offsets.bin"), self.rows * 8)
+        offsets = np.fromfile(self._file("offsets.bin"), dtype=np.int64)
+        self.text_end = int(offsets[-1]) if self.rows else 0
+        os.truncate(self._file("text.bin"), self.text_end)
+
+        deleted = np.fromfile(self._file("deleted.bin"), dtype=np.uint8).astype(bool)
+        self.deleted_buffer = np.zeros(self.rows, dtype=bool)
+        self.deleted_buffer[:min(len(deleted), self.rows)] = deleted[:self.rows]
+
+        # Stores written before chunk metadata existed get empty metadata
+        if not os.path.exists(self._file("chunk_meta.bin")):
+            missing = np.tile(np.array([-1, -1, -1, -1, 0], dtype=np.int64), (self.rows, 1))
+            missing.tofile(self._file("chunk_meta.bin"))
+        os.truncate(self._file("chunk_meta.bin"), self.rows * len(META_COLUMNS) * 8)
+        self.meta_buffer = np.fromfile(self._file("chunk_meta.bin"), dtype=np.int64).reshape(-1, len(META_COLUMNS))
+        self.sources = meta.get("sources", [])
+        self.source_ids = {source: i for i, source in enumerate(self.sources)}
+        self.scope_rows = {}
+        self._map()
+        return self
+
+    def _map(self):
+        """Memory-map the data files; this is the whole cold-start cost"""
+        if self.rows == 0:
+            self.vectors = np.zeros((0, self.dim), dtype=self.dtype)
+            self.coarse = np.zeros((0, self.coarse_dim), dtype=self.dtype)
+            self.offsets = np.zeros(0, dtype=np.int64)
+            self.text = np.zeros(0, dtype=np.uint8)
+        else:
+            self.vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype,
+                                     mode="r", shape=(self.rows, self.dim))
+            self.coarse = (np.memmap(self._file("coarse.bin"), dtype=self.dtype,
+                                     mode="r", shape=(self.rows, self.coarse_dim))
+                           if self.coarse_dim else None)
+            self.offsets = np.memmap(self._file("offsets.bin"), dtype=np.int64,
+                                     mode="r", shape=(self.rows,))
+            self.text = (np.memmap(self._file("text.bin"), dtype=np.uint8, mode="r")
+                         if self.text_end else np.zeros(0, dtype=np.uint8))
+        self.mapped_rows = self.rows
+
+    def insert(self, embeddings, texts, metadata=None):
+        with span("store_seconds", backend=self.name, op="insert"):
+            return self._insert(embeddings, texts, metadata or empty_metadata(len(texts)))
+
+    def _source_id(self, source):
+        source_id = self.source_ids.get(source)
+        if source_id is None:
+            source_id = self.source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return source_id
+
+    def _insert(self, embeddings, texts, metadata):
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        vectors = quantize(embeddings, self.dtype.name)
+
+        encoded = [text.encode("utf-8") for text in texts]
+        ends = self.text_end + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+
+        with open(self._file("vectors.bin"), "ab") as f:
+            vectors.tofile(f)
+        if self.coarse_dim:
+            with open(self._file("coarse.bin"), "ab") as f:
+                quantize(truncate(embeddings, self.coarse_dim), self.dtype.name).tofile(f)
+        with open(self._file("text.bin"), "ab") as f:
+            f.write(b"".join(encoded))
+        with open(self._file("offsets.bin"), "ab") as f:
+            f.write(ends.tobytes())
+        meta = np.column_stack([
+            [self._source_id(source) for source in metadata["source"]],
+            metadata["chunk_index"], metadata["char_start"], metadata["char_end"], metadata["ingested_at"],
+        ]).astype(np.int64).reshape(-1, len(META_COLUMNS))
+        with open(self._file("chunk_meta.bin"), "ab") as f:
+            f.write(meta.tobytes())
+        self._reserve(self.rows + len(encoded))
+        self.meta_buffer[self.rows:self.rows + len(encoded)] = meta
+        self.deleted_buffer[self.rows:self.rows + len(encoded)] = False
+
+        ids = list(range(self.rows, self.rows + len(encoded)))
+        self.rows += len(encoded)
+        if len(encoded):
+            self.text_end = int(ends[-1])
+        self.scope_rows = {}
+        return ids
+
+    def delete(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.deleted[ids[(ids >= 0) & (ids < self.rows)]] = True
+        self.scope_rows = {}
+
+    def flush(self):
+        """Persist tombstones and the row count; rows past the count are discarded on open"""
+        with span("store_seconds", backend=self.name, op="flush"):
+            self._flush()
+
+    def _flush(self):
+        self.deleted.astype(np.uint8).tofile(self._file("deleted.bin"))
+        meta = {"dim": self.dim, "dtype": self.dtype.name, "coarse_dim": self.coarse_dim,
+                "rows": self.rows, "sources": self.sources}
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+
+    def warm_up(self):
+        """Map the files and run one search so the first query starts from a warm page cache"""
+        if self.count():
+            self.search(np.ones((1, self.dim), dtype=np.float32), 1)
+
+    def count(self):
+        return int(self.rows - self.deleted.sum())
+
+    def get_text(self, row):
+        start = int(self.offsets[row - 1]) if row else 0
+        return bytes(self.text[start:int(self.offsets[row])]).decode("utf-8")
+
+    def scope(self, partitions=None, filters=None):
+        """
+        Live rows inside `partitions` (source groups) that match `filters`,
+        or None for the whole store.
+        """
+        filters = check_filters(filters)
+        if not partitions and not filters:
+            return None
+        key = (tuple(sorted(partitions or ())), repr(sorted((filters or {}).items())))
+        rows = self.scope_rows.get(key)
+        if rows is not None:
+            return rows
+
+        allowed = range(len(self.sources))
+        if partitions:
+            partitions = set(partitions)
+            allowed = [i for i in allowed if source_group(self.sources[i]) in partitions]
+        if filters and "source" in filters:
+            wanted = set(filters["source"])
+            allowed = [i for i in allowed if self.sources[i] in wanted]
+        mask = np.isin(self.meta[:, 0], np.asarray(list(allowed), dtype=np.int64)) & ~self.deleted
+        if filters and "ingested_after" in filters:
+            mask &= self.meta[:, 4] >= filters["ingested_after"]
+        if filters and "ingested_before" in filters:
+            mask &= self.meta[:, 4] < filters["ingested_before"]
+        rows = self.scope_rows[key] = np.flatnonzero(mask)
+        return rows
+
+    def queries(self, vectors, dim=None):
+        """Unit-normalized queries truncated to `dim`, scaled to match int8 rows"""
+        queries = truncate(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim), dim or self.dim)
+        if self.dtype == np.int8:
+            queries /= INT8_SCALE  # Undo the int8 scale of the rows
+        return queries
+
+    def scores(self, vectors, rows=None, coarse=False):
+        """
+        Cosine similarity of each query against every row, or only against
+        `rows` when given; shape (queries, rows). With `coarse`, against the
+        coarse_dim matrix.
+        """
+        if self.mapped_rows != self.rows:
+            self._map()
+        matrix = self.coarse if coarse else self.vectors
+        queries = self.queries(vectors, self.coarse_dim if coarse else self.dim)
+
+        total = self.rows if rows is None else len(rows)
+        scores = np.empty((len(queries), total), dtype=np.float32)
+        for position, block in self._blocks(matrix, rows):
+            scores[:, position:position + len(block)] = queries @ block.astype(np.float32, copy=False).T
+        if rows is None and self.deleted.any():
+            scores[:, self.deleted] = -np.inf
+        return scores
+
+    def _blocks(self, matrix, rows=None):
+        """
+        Yield (position in `rows`, block of `matrix`) covering `rows` or the whole matrix.
+        Chunks of one file are stored contiguously, so selected rows are
+        read as slices of the memory map, without copying, whenever they
+        form long runs; scattered rows are gathered instead.
+        """
+        if rows is None:
+            for start in range(0, self.rows, SEARCH_BLOCK_ROWS):
+                yield start, matrix[start:start + SEARCH_BLOCK_ROWS]
+            return
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        if len(breaks) > len(rows) // 256:
+            for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                yield start, matrix[rows[start:start + SEARCH_BLOCK_ROWS]]
+            return
+        position = 0
+        for run in np.split(rows, breaks):
+            if not len(run):
+                continue
+            for start in range(int(run[0]), int(run[-1]) + 1, SEARCH_BLOCK_ROWS):
+                block = matrix[start:min(start + SEARCH_BLOCK_ROWS, int(run[-1]) + 1)]
+                yield position, block
+                position += len(block)
+
+    def search(self, vectors, top_k, partitions=None, filters=None, with_text=True):
+        with span("store_seconds", backend=self.name, op="search"):
+            return self._search(vectors, top_k, partitions, filters, with_text)
+
+    def _search(self, vectors, top_k, partitions=None, filters=None, with_text=True):
+        rows = self.scope(partitions, filters)
+        available = self.count() if rows is None else len(rows)
+        k = min(top_k, available)
+        if k <= 0:
+            return [[] for _ in range(len(np.asarray(vectors).reshape(-1, self.dim)))]
+
+        if self.coarse_dim:
+            top, top_scores = self.rerank(vectors, rows, k, min(top_k * COARSE_CANDIDATES, available))
+        else:
+            scores = self.scores(vectors, rows)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            if rows is not None:
+                top = rows[top]
+        return [
+            [self.hit(int(row), float(score), with_text) for row, score in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+
+    def rerank(self, vectors, rows, k, candidates):
+        """
+        Two-stage search: the best `candidates` rows in coarse_dim
+        dimensions, reranked exactly against their full vectors.
+        Returns (row ids, scores) of the top `k`, best first.
+        """
+        coarse_scores = self.scores(vectors, rows, coarse=True)
+        top = np.argpartition(-coarse_scores, candidates - 1, axis=1)[:, :candidates]
+        if rows is not None:
+            top = rows[top]
+        full = self.vectors[top.ravel()].reshape(*top.shape, self.dim).astype(np.float32, copy=False)
+        exact = np.einsum("qcd,qd->qc", full, self.queries(vectors))
+        order = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(exact, order, axis=1)
+
+    def hit(self, row, score, with_text=True):
+        source_id, chunk_index, char_start, char_end, _ = self.meta[row].tolist()
+        return {
+            "text": self.get_text(row) if with_text else None, "score": score, "id": row,
+            "source": self.sources[source_id] if source_id >= 0 else "",
+            "chunk_index": chunk_index, "char_start": char_start, "char_end": char_end,
+        }
+
+    def fetch_text(self, hits):
+        if self.mapped_rows != self.rows:
+            self._map()
+        return [self.get_text(hit["id"]) for hit in hits]
+
+    def fetch_vectors(self, hits):
+        if self.mapped_rows != self.rows:
+            self._map()
+        vectors = self.vectors[[hit["id"] for hit in hits]].astype(np.float32).reshape(-1, self.dim)
+        if self.dtype == np.int8:
+            vectors /= INT8_SCALE
+        return vectors
+
+    def iter_embeddings(self, batch_size=SEARCH_BLOCK_ROWS):
+        """Yield (ids, full-dimension float32 vectors) of the live rows, used for exact ground truth"""
+        if self.mapped_rows != self.rows:
+            self._map()
+        for start in range(0, self.rows, batch_size):
+            ids = np.arange(start, min(start + batch_size, self.rows))
+            ids = ids[~self.deleted[ids]]
+            vectors = self.vectors[ids].astype(np.float32)
+            if self.dtype == np.int8:
+                vectors /= INT8_SCALE
+            yield ids.tolist(), vectors
+
+    def select(self, ids, partitions=None, filters=None):
+        rows = self.scope(partitions, filters)
+        ids = np.asarray(ids, dtype=np.int64)
+        if rows is None:
+            keep = (ids >= 0) & (ids < self.rows)
+            keep[keep] = ~self.deleted[ids[keep]]
+            return ids[keep].tolist()
+        return ids[np.isin(ids, rows)].tolist()
@@ -1,12 +1,32 @@
+import time
+STARTED = time.perf_counter()
+
 from agent import ResearchAgent
+from metrics import METRICS
 
 if __name__ == "__main__":
     agent = ResearchAgent()
-    print("🔎 Deep Researcher Agent Ready")
+    # Load the collection and the model while the user types the first question
+    agent.retriever.warm_up(background=True)
+    print(f"🔎 Deep Researcher Agent Ready ({(time.perf_counter() - STARTED) * 1000:.0f} ms)")
+    first_query = True
 
     while True:
         query = input("\nEnter your query (or 'exit'): ")
         if query.lower() == "exit":
             break
+        started = time.perf_counter()
         response = agent.run(query)
         print("\n📑 Research Result:\n", response)
+        if first_query:
+            print(f"⏱️ Time to first result: {(time.perf_counter() - started) * 1000:.0f} ms")
+            first_query = False
+
+    result_cache = agent.retriever.result_cache
+    if result_cache is not None:
+        stats = result_cache.stats()
+        print(f"💾 Result cache: {stats['exact_hit_rate']:.0%} exact hits, "
+              f"{stats['semantic_hit_rate']:.0%} semantic hits, {stats['misses']} misses")
+
+    if METRICS.enabled:
+        print(f"📈 Metrics written to {METRICS.export()}")
@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+from config import INGEST_MANIFEST_PATH
+
+# Bumped when the stored row layout changes, so older collections are rebuilt
+SCHEMA_VERSION = 2
+
+
+def file_hash(path):
+    """sha256 of a file's bytes, read in blocks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Record of what is currently stored in the collection.
+    For every ingested file it keeps the file's size, mtime and content hash
+    plus the (chunk hash, primary key, chunk position) of its rows, so a later run can
+    insert only new chunks and delete stale ones by primary key.
+    Progress within a run is appended to a journal next to the manifest
+    (record()), which save() folds back into it, so checkpointing a batch
+    costs the size of the batch rather than of the whole manifest.
+    """
+
+    def __init__(self, collection_name, path=INGEST_MANIFEST_PATH):
+        self.collection_name = collection_name
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.files = {}
+        self.journaled = set()  # Files changed by the replayed journal
+        self.dropped = []  # Rows of the manifest on disk the replayed journal deleted
+
+    @classmethod
+    def load(cls, collection_name, path=INGEST_MANIFEST_PATH):
+        """Load the manifest, or None if it is missing, belongs to another collection or schema"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable manifest {path}: {e}")
+            return None
+        if data.get("collection") != collection_name or data.get("schema") != SCHEMA_VERSION:
+            return None
+        manifest = cls(collection_name, path)
+        manifest.files = data.get("files", {})
+        manifest._replay()
+        return manifest
+
+    @classmethod
+    def from_rows(cls, collection_name, chunks, data_dir, inputs, incomplete=(), path=INGEST_MANIFEST_PATH):
+        """
+        A manifest of stored rows, `chunks` mapping each source to its
+        [chunk hash, id, position] rows. Files that changed since their rows
+        were made (per their `inputs` [size, mtime]) or are listed in
+        `incomplete` get no hash, so the next incremental run diffs their
+        chunks; files gone from `data_dir` are kept so it deletes their rows.
+        """
+        manifest = cls(collection_name, path)
+        for name in sorted(set(chunks) | set(inputs)):
+            entries = sorted(chunks.get(name, []), key=lambda entry: entry[2])
+            file = os.path.join(data_dir, name)
+            if not os.path.exists(file):
+                if entries:
+                    manifest.files[name] = {"size": None, "mtime": None, "hash": None, "chunks": entries}
+                continue
+            stat = os.stat(file)
+            unchanged = name not in incomplete and inputs.get(name) == [stat.st_size, stat.st_mtime]
+            manifest.set_file(name, file, file_hash(file) if unchanged else None, entries)
+        return manifest
+
+    def _replay(self):
+        """Apply the journal of an interrupted run; a torn last line is ignored"""
+        if not os.path.exists(self.journal_path):
+            return
+        before = {name: [chunk[1] for chunk in entry["chunks"]] for name, entry in self.files.items()}
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                name = record["name"]
+                self.journaled.add(name)
+                if "entry" in record:
+                    self.files[name] = record["entry"]
+                elif "chunks" in record:
+                    self.files[name]["chunks"].extend(record["chunks"])
+                else:
+                    self.files.pop(name, None)
+        for name in self.journaled:
+            kept = {chunk[1] for chunk in self.files.get(name, {"chunks": []})["chunks"]}
+            self.dropped += [pk for pk in before.get(name, []) if pk not in kept]
+
+    def record(self, name, chunks=None):
+        """
+        Append a change of file `name` to the journal: `chunks` added to its
+        entry, or else its whole entry (its removal if it is no longer in files).
+        """
+        if chunks is not None:
+            record = {"name": name, "chunks": chunks}
+        elif name in self.files:
+            record = {"name": name, "entry": self.files[name]}
+        else:
+            record = {"name": name}
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def save(self):
+        """Atomically write the manifest and drop the journal it now contains"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"collection": self.collection_name, "schema": SCHEMA_VERSION, "files": self.files}, f)
+        os.replace(tmp, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def journaled_ids(self):
+        return [pk for name in self.journaled if name in self.files for _, pk, _ in self.files[name]["chunks"]]
+
+    def retain(self, present):
+        """
+        Drop journaled rows whose ids are not in `present`, e.g. rows a crashed
+        store never flushed, and mark their files changed. Returns the dropped ids.
+        """
+        dropped = []
+        for name in self.journaled:
+            entry = self.files.get(name)
+            if entry is None:
+                continue
+            kept = [chunk for chunk in entry["chunks"] if chunk[1] in present]
+            if len(kept) < len(entry["chunks"]):
+                dropped += [chunk[1] for chunk in entry["chunks"] if chunk[1] not in present]
+                entry["chunks"] = kept
+                entry["hash"] = None
+        return dropped
+
+    @staticmethod
+    def remove(path=INGEST_MANIFEST_PATH):
+        for name in (path, f"{path}.journal"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def is_unchanged(self, name, path):
+        """
+        Check a file against its manifest entry, returns (unchanged, hash).
+        Size and mtime are checked first so unchanged files are not re-hashed.
+        """
+        entry = self.files.get(name)
+        if entry is None or entry["hash"] is None:
+            return False, None
+        stat = os.stat(path)
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True, entry["hash"]
+        digest = file_hash(path)
+        if digest == entry["hash"]:
+            # Touched but not modified: refresh the fast-path fields
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            return True, digest
+        return False, digest
+
+    def diff_chunks(self, name, hashes):
+        """
+        Compare the hashes of a file's new chunks against its stored rows.
+        A row is kept only for the same hash at the same position, so the
+        chunk_index and character offsets of kept rows stay exact; a chunk
+        that moved is inserted again (its embedding usually cached).
+        Returns (keep, new, stale): `keep` are [hash, id, position] entries
+        still valid, `new` are indices of chunks to insert, `stale` are ids
+        to delete.
+        """
+        previous = {}
+        for entry in self.files.get(name, {}).get("chunks", []):
+            # Entries written before positions were recorded never match
+            position = entry[2] if len(entry) > 2 else None
+            previous.setdefault((entry[0], position), []).append(entry[1])
+
+        keep, new = [], []
+        for i, digest in enumerate(hashes):
+            ids = previous.get((digest, i))
+            if ids:
+                keep.append([digest, ids.pop(), i])
+            else:
+                new.append(i)
+        stale = [pk for ids in previous.values() for pk in ids]
+        return keep, new, stale
+
+    def set_file(self, name, path, digest, chunks):
+        """Record a file's rows; digest None marks a file whose ingest is incomplete"""
+        stat = os.stat(path)
+        self.files[name] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": digest,
+            "chunks": chunks,
+        }
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Memory budget regression suite
+Runs a real full ingest (the calls of `ingest.py --pipelined`) and then
+searches and summarizes, on synthetic corpora of increasing size, against
+the fake Ollama server and the local store. Records per stage (chunking,
+deduplication, ingest, the BM25 merge that finishes it, search,
+summarization) the peak traced allocations (tracemalloc) and the peak RSS
+(sampled on a thread). Every corpus size runs in a fresh process. Exits
+non-zero when a stage goes over its budget in MEMORY_BUDGET_MB, a run over
+MEMORY_RSS_BUDGET_MB (both scaled to the corpus size), or a stage's peak
+grows super-linearly with the corpus.
+Usage:
+    python3 memory_budget.py
+    python3 memory_budget.py --sizes 50 100 200 --output memory.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import shutil
+import tempfile
+import argparse
+import threading
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import (
+    EMBED_DIM, DEDUP_THRESHOLD, DEDUP_NUM_PERM, MEMORY_BUDGET_SIZES, MEMORY_BUDGET_MB, MEMORY_RSS_BUDGET_MB,
+    MEMORY_MAX_GROWTH, MEMORY_GROWTH_FLOOR_MB,
+)
+from benchmark import quiet
+
+MB = 1024 * 1024
+STAGES = ("chunk", "dedup", "ingest", "index", "search", "summarize")
+
+
+class RssSampler:
+    """Samples the process RSS on a thread; peak() is the highest RSS since reset()"""
+
+    def __init__(self, interval=0.005):
+        try:
+            import psutil
+        except ImportError:
+            raise ImportError("Sampling RSS needs psutil: pip install psutil")
+        self.process = psutil.Process()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.highest = self.rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self.thread.start()
+
+    def rss(self):
+        return self.process.memory_info().rss
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            rss = self.rss()
+            with self.lock:
+                self.highest = max(self.highest, rss)
+
+    def reset(self):
+        """Start a new measurement, returns the current RSS"""
+        rss = self.rss()
+        with self.lock:
+            self.highest = rss
+        return rss
+
+    def peak(self):
+        rss = self.rss()
+        with self.lock:
+            self.highest = max(self.highest, rss)
+            return self.highest
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def measure(sampler, fn):
+    """Run `fn`, returns its result and its traced and RSS memory in MB and seconds"""
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    rss_before = sampler.reset()
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    rss_peak = sampler.peak()
+    return result, {
+        "traced_peak_mb": (peak - before) / MB,
+        "traced_retained_mb": (current - before) / MB,
+        "rss_peak_mb": rss_peak / MB,
+        "rss_growth_mb": (rss_peak - rss_before) / MB,
+        "seconds": seconds,
+    }
+
+
+def write_corpus(directory, docs, doc_chars, seed=0):
+    """
+    Write `docs` synthetic text files of about `doc_chars` characters,
+    one sentence at a time, so nothing proportional to the corpus is kept.
+    Returns the file paths and the vocabulary, for queries.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+                  for _ in range(5000)]
+    paths = []
+    for d in range(docs):
+        path = os.path.join(directory, f"doc_{d:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for sentence in iter_sentences(rng, vocabulary, doc_chars):
+                f.write(sentence)
+        paths.append(path)
+    return paths, vocabulary
+
+
+def iter_sentences(rng, vocabulary, chars):
+    """Random sentences (and paragraph breaks) up to about `chars` characters"""
+    size = 0
+    while size < chars:
+        sentence = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(6, 20))).capitalize() + ". "
+        size += len(sentence)
+        yield sentence
+        if rng.random() < 0.1:
+            yield "\n\n"
+
+
+def run_size(docs, doc_chars, ollama_url, queries, top_k, seed):
+    """
+    A full ingest and the queries after it on a corpus of `docs` documents,
+    in this (fresh) process. Ingest goes through the same calls as
+    `ingest.py --pipelined --no-dedup` (open_full_ingest, run_pipeline,
+    finish_full_ingest), with the checkpoint, dead-letter and BM25 files in
+    a temporary directory and the local store as the backend. The
+    deduplicator's index grows with the corpus by design, so it is
+    measured as a stage of its own over the same chunks.
+    """
+    from pipeline import iter_stored_documents, run_pipeline
+    from ingest import OllamaEmbedder, checkpoint_header, open_full_ingest, finish_full_ingest
+    from local_store import LocalStore
+    from lexical_index import BM25Index
+    from retriever import OllamaRetriever
+    from utils.dedup import ChunkDeduplicator
+    from utils.summarizer import summarize_chunks
+
+    workdir = tempfile.mkdtemp(prefix="rag_memory_")
+    cwd = os.getcwd()
+    try:
+        # The ingest state paths in config.py are relative
+        os.chdir(workdir)
+        os.makedirs("data")
+        paths, vocabulary = write_corpus("data", docs, doc_chars, seed=seed)
+        files = sorted(os.path.relpath(path, "data") for path in paths)
+        rng = random.Random(seed + 1)
+        queries = ["".join(iter_sentences(rng, vocabulary, 1)).strip() for _ in range(queries)]
+        with quiet():
+            embedder = OllamaEmbedder(use_cache=False, base_url=ollama_url, backend="ollama")
+            store = LocalStore()
+        counts = {"chars": sum(os.path.getsize(path) for path in paths)}
+
+        def chunk():
+            counts["chunks"] = sum(1 for _, document in iter_stored_documents(paths) for _ in document)
+
+        def dedup():
+            dedup = ChunkDeduplicator(DEDUP_THRESHOLD, DEDUP_NUM_PERM)
+            for _, document in iter_stored_documents(paths):
+                for text in document:
+                    dedup.check(text)
+            return dedup
+
+        def ingest():
+            header = checkpoint_header(store, "data", files, int(time.time()))
+            _, checkpoint, lexical, dead_letters = open_full_ingest(store, header, fresh=True)
+            stats = run_pipeline(paths, embedder, store, lexical=lexical, root="data",
+                                 checkpoint=checkpoint, dead_letters=dead_letters,
+                                 ingested_at=header["ingested_at"])
+            if stats["inserted"] == 0 or dead_letters.added:
+                raise RuntimeError(f"Ingest inserted {stats['inserted']} chunks, "
+                                   f"{dead_letters.added} dead-lettered")
+            return lexical, dead_letters
+
+        def index():
+            finish_full_ingest(store, *state)
+
+        def search():
+            retriever = OllamaRetriever(use_cache=False, use_result_cache=False, mode="vector",
+                                        base_url=ollama_url, store=store, backend="ollama")
+            return [retriever.search(query, top_k=top_k) for query in queries]
+
+        def summarize():
+            lexical = BM25Index.load()
+            return [summarize_chunks(lexical, [i for hit in hits for i in hit.get("ids", [hit["id"]])])
+                    for hits in results]
+
+        tracemalloc.start()
+        sampler = RssSampler()
+        stages = {}
+        try:
+            with quiet():
+                _, stages["chunk"] = measure(sampler, chunk)
+                _, stages["dedup"] = measure(sampler, dedup)
+                state, stages["ingest"] = measure(sampler, ingest)
+                _, stages["index"] = measure(sampler, index)
+                results, stages["search"] = measure(sampler, search)
+                _, stages["summarize"] = measure(sampler, summarize)
+        finally:
+            sampler.stop()
+            tracemalloc.stop()
+        return {
+            "docs": docs,
+            "chars": counts["chars"],
+            "chunks": counts["chunks"],
+            "rows": store.count(),
+            "queries": len(queries),
+            "rss_peak_mb": max(stage["rss_peak_mb"] for stage in stages.values()),
+            "stages": stages,
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def growth_exponent(sizes, peaks):
+    """Slope of log(peak) against log(size), 1.0 for linear growth"""
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(peaks, 1e-9)), 1)[0])
+
+
+def budget_mb(budget, chars):
+    """MB allowed for a corpus of `chars` characters by a (fixed MB, MB per million characters) budget"""
+    fixed, per_million = budget
+    return fixed + per_million * chars / 1e6
+
+
+def check(runs, budgets=MEMORY_BUDGET_MB, rss_budget=MEMORY_RSS_BUDGET_MB,
+          max_growth=MEMORY_MAX_GROWTH, floor=MEMORY_GROWTH_FLOOR_MB):
+    """Budget and growth failures of a suite, as (growth per stage, list of messages)"""
+    failures = []
+    for run in runs:
+        for stage, measured in run["stages"].items():
+            if stage not in budgets:
+                continue
+            allowed = budget_mb(budgets[stage], run["chars"])
+            if measured["traced_peak_mb"] > allowed:
+                failures.append(f"{stage} peaked at {measured['traced_peak_mb']:.1f} MB on {run['docs']} docs, "
+                                f"over its {allowed:.1f} MB budget")
+        allowed = budget_mb(rss_budget, run["chars"])
+        if run["rss_peak_mb"] > allowed:
+            failures.append(f"RSS peaked at {run['rss_peak_mb']:.0f} MB on {run['docs']} docs, "
+                            f"over its {allowed:.0f} MB budget")
+
+    growth = {}
+    if len(runs) > 1:
+        sizes = [run["chars"] for run in runs]
+        for stage in STAGES:
+            peaks = [run["stages"][stage]["traced_peak_mb"] for run in runs]
+            if max(peaks) < floor:
+                continue
+            growth[stage] = growth_exponent(sizes, peaks)
+            if growth[stage] > max_growth:
+                failures.append(f"{stage} grows super-linearly: peak ~ size^{growth[stage]:.2f} "
+                                f"(limit {max_growth})")
+    return growth, failures
+
+
+def run(args):
+    from fake_ollama import start_server
+    server, ollama_url = start_server(dim=EMBED_DIM)
+    runs = []
+    try:
+        for docs in sorted(args.sizes):
+            print(f"📏 {docs} documents...")
+            # A fresh process per size, so earlier runs do not leave their RSS behind
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(run_size, docs, args.doc_chars, ollama_url, args.queries,
+                                     args.top_k, args.seed).result()
+            runs.append(result)
+            print(f"   {result['chunks']} chunks, RSS peak {result['rss_peak_mb']:.0f} MB")
+            for stage, measured in result["stages"].items():
+                print(f"   {stage:<10} traced peak {measured['traced_peak_mb']:8.2f} MB  "
+                      f"RSS growth {measured['rss_growth_mb']:8.2f} MB  {measured['seconds']:6.2f}s")
+    finally:
+        server.shutdown()
+
+    growth, failures = check(runs)
+    if growth:
+        print("📈 Growth exponents (1.0 = linear): " +
+              ", ".join(f"{stage} {exponent:.2f}" for stage, exponent in growth.items()))
+    report = {
+        "settings": {"sizes": sorted(args.sizes), "doc_chars": args.doc_chars, "queries": args.queries,
+                     "top_k": args.top_k, "seed": args.seed, "budgets_mb": MEMORY_BUDGET_MB,
+                     "rss_budget_mb": MEMORY_RSS_BUDGET_MB, "max_growth": MEMORY_MAX_GROWTH},
+        "runs": runs,
+        "growth": growth,
+        "failures": failures,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ All stages within their memory budgets")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage memory budgets for ingestion and retrieval")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(MEMORY_BUDGET_SIZES),
+                        help="Synthetic documents per run, one run per size")
+    parser.add_argument("--doc-chars", type=int, default=20000, help="Approximate characters per document")
+    parser.add_argument("--queries", type=int, default=50, help="Queries in the search and summarize stages")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here")
+    report = run(parser.parse_args())
+    sys.exit(1 if report["failures"] else 0)
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import bisect
+import threading
+from config import METRICS_ENABLED, METRICS_EXPORT_PATH, VERBOSE
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def log(message):
+    """Progress line for the hot path, only printed with VERBOSE in config.py"""
+    if VERBOSE:
+        print(message)
+
+
+class _NoopSpan:
+    """Shared span returned while metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "key", "started")
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.key, time.perf_counter() - self.started)
+        return False
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Approximate quantile, the upper bound of the bucket holding it"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Timing spans, histograms and counters for the ingest and query paths.
+    While disabled, span() returns a shared no-op context manager and inc()
+    returns immediately, so instrumented code costs one attribute check.
+    Labels are keyword arguments, e.g. span("store_seconds", op="search").
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, (name, tuple(sorted(labels.items()))))
+
+    def observe(self, name, seconds, **labels):
+        if self.enabled:
+            self._observe((name, tuple(sorted(labels.items()))), seconds)
+
+    def _observe(self, key, seconds):
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timed_iter(self, name, iterable, **labels):
+        """Yield from `iterable`, observing the time spent producing each item"""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter((name, tuple(sorted(labels.items()))), iterable)
+
+    def _timed_iter(self, key, iterable):
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self._observe(key, time.perf_counter() - started)
+            yield item
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """JSON-friendly view of all counters and histograms"""
+        def name_of(key):
+            name, labels = key
+            if not labels:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+        with self.lock:
+            return {
+                "counters": {name_of(key): value for key, value in sorted(self.counters.items())},
+                "histograms": {
+                    name_of(key): {
+                        "count": h.count,
+                        "sum_seconds": h.sum,
+                        "mean_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                        "p50_ms": h.quantile(0.5) * 1000,
+                        "p95_ms": h.quantile(0.95) * 1000,
+                        "p99_ms": h.quantile(0.99) * 1000,
+                    }
+                    for key, h in sorted(self.histograms.items())
+                },
+            }
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        def labels_of(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                lines.append(f"{name}{labels_of(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{labels_of(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{labels_of(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{name}_sum{labels_of(labels)} {h.sum}")
+                lines.append(f"{name}_count{labels_of(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=METRICS_EXPORT_PATH):
+        """Write metrics to `path`, Prometheus text for .prom files and JSON otherwise"""
+        if not self.enabled:
+            return None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+        return path
+
+
+METRICS = Metrics()
+span = METRICS.span
+inc = METRICS.inc
+timed_iter = METRICS.timed_iter
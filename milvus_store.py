@@ -0,0 +1,510 @@
+import os
+import json
+import math
+import numpy as np
+from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType, utility
+from pymilvus.client.types import LoadState
+from config import (
+    COLLECTION_NAME, EMBED_DIM, MILVUS_HOST, MILVUS_PORT, AUTO_INDEX, SEARCH_PARAMS_PATH,
+    VECTOR_DTYPE, CHUNK_TEXT_OUT_OF_LINE, COARSE_DIM, COARSE_CANDIDATES,
+)
+from vector_store import (
+    VectorStore, METADATA_FIELDS, source_group, partition_name, empty_metadata, check_filters, quantize,
+    truncate,
+)
+from chunk_store import ChunkTextStore, RerankVectors
+from metrics import span
+
+VECTOR_FIELD_TYPES = {
+    "float32": DataType.FLOAT_VECTOR, "float16": DataType.FLOAT16_VECTOR, "int8": DataType.INT8_VECTOR,
+}
+
+
+def choose_index(num_rows, dim=EMBED_DIM, dtype="float32"):
+    """
+    Index type and build parameters sized for a collection of `num_rows`.
+    Small collections use IVF_FLAT, mid-sized ones HNSW, and large ones
+    trade accuracy for memory with IVF_SQ8 and then IVF_PQ. Milvus only
+    indexes int8 vectors with HNSW.
+    """
+    nlist = int(min(65536, max(16, 2 ** round(math.log2(4 * math.sqrt(max(num_rows, 1)))))))
+    if dtype == "int8":
+        return {"metric_type": "COSINE", "index_type": "HNSW",
+                "params": {"M": 16 if num_rows < 500_000 else 32, "efConstruction": 200}}
+    if num_rows < 50_000:
+        index_type, params = "IVF_FLAT", {"nlist": nlist}
+    elif num_rows < 2_000_000:
+        index_type, params = "HNSW", {"M": 16 if num_rows < 500_000 else 32, "efConstruction": 200}
+    elif num_rows < 20_000_000:
+        index_type, params = "IVF_SQ8", {"nlist": nlist}
+    else:
+        m = next(m for m in (96, 64, 48, 32, 24, 16, 8) if dim % m == 0)
+        index_type, params = "IVF_PQ", {"nlist": nlist, "m": m, "nbits": 8}
+    return {"metric_type": "COSINE", "index_type": index_type, "params": params}
+
+
+def default_search_params(index_params, top_k=5):
+    """Search parameters for an index when no tuned values are stored"""
+    params = index_params.get("params", {})
+    if isinstance(params, str):
+        params = json.loads(params)
+    if index_params["index_type"] == "HNSW":
+        return {"metric_type": "COSINE", "params": {"ef": max(64, 2 * top_k)}}
+    nlist = int(params.get("nlist", 64))
+    return {"metric_type": "COSINE", "params": {"nprobe": max(8, nlist // 16)}}
+
+
+def load_search_params(collection_name, index_type, path=SEARCH_PARAMS_PATH):
+    """Tuned search params for this collection and index type, or None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("collection") != collection_name or saved.get("index_type") != index_type:
+        return None
+    return {"metric_type": "COSINE", "params": saved["params"]}
+
+
+def save_search_params(collection_name, index_type, params, report, path=SEARCH_PARAMS_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"collection": collection_name, "index_type": index_type,
+                   "params": params, "report": report}, f, indent=2)
+
+
+def filter_expression(filters):
+    """Milvus boolean expression for a filter dict (see vector_store.check_filters)"""
+    filters = check_filters(filters)
+    if not filters:
+        return ""
+    clauses = []
+    if "source" in filters:
+        clauses.append(f"source in {json.dumps(list(filters['source']))}")
+    if "ingested_after" in filters:
+        clauses.append(f"ingested_at >= {int(filters['ingested_after'])}")
+    if "ingested_before" in filters:
+        clauses.append(f"ingested_at < {int(filters['ingested_before'])}")
+    return " and ".join(clauses)
+
+
+class MilvusStore(VectorStore):
+    """
+    Vector store backed by a Milvus server collection.
+    The connection is opened on first use and the collection is loaded on
+    the first search (or by warm_up()), once per process. Collections
+    created with CHUNK_TEXT_OUT_OF_LINE keep (text_offset, text_length)
+    into a ChunkTextStore instead of a text column, and vectors are stored
+    as VECTOR_DTYPE. With COARSE_DIM the indexed field only holds the first
+    COARSE_DIM dimensions and rows point (vector_row) into RerankVectors
+    for the exact full-dimension rerank. All of this is read back from the
+    schema when the collection is opened.
+    """
+
+    name = "milvus"
+
+    def __init__(self, collection_name=COLLECTION_NAME, host=MILVUS_HOST, port=MILVUS_PORT):
+        self.collection_name = collection_name
+        self.host = host
+        self.port = port
+        self.dim = EMBED_DIM
+        self.collection = None
+        self.loaded = False
+        self.search_index = None  # (index params, tuned search params or None), read on first search
+        self.vector_dtype = VECTOR_DTYPE
+        self.text_store = None
+        self.coarse_dim = 0
+        self.rerank_vectors = None
+
+    @property
+    def text_out_of_line(self):
+        return self.text_store is not None
+
+    def _read_schema(self):
+        """Vector type and text placement of the opened collection"""
+        fields = {field.name: field for field in self.collection.schema.fields}
+        types = {field_type: name for name, field_type in VECTOR_FIELD_TYPES.items()}
+        self.vector_dtype = types.get(fields["embedding"].dtype, "float32")
+        self.text_store = ChunkTextStore() if "text_offset" in fields else None
+        self.coarse_dim = 0
+        self.rerank_vectors = None
+        if "vector_row" in fields:
+            self.coarse_dim = int(fields["embedding"].params["dim"])
+            self.rerank_vectors = RerankVectors(dim=self.dim, dtype=self.vector_dtype)
+
+    def index_dim(self):
+        return self.coarse_dim or self.dim
+
+    def search_limit(self, top_k):
+        """Hits requested from the index for `top_k` results"""
+        return top_k * COARSE_CANDIDATES if self.coarse_dim else top_k
+
+    def _connect(self):
+        if not connections.has_connection("default"):
+            connections.connect("default", host=self.host, port=self.port)
+
+    def exists(self):
+        self._connect()
+        return utility.has_collection(self.collection_name)
+
+    def configure(self):
+        """Take the vector type and layout for a new collection from config"""
+        if VECTOR_DTYPE not in VECTOR_FIELD_TYPES:
+            raise ValueError(f"Unsupported VECTOR_DTYPE {VECTOR_DTYPE!r}")
+        self.vector_dtype = VECTOR_DTYPE
+        self.coarse_dim = COARSE_DIM if 0 < COARSE_DIM < EMBED_DIM else 0
+        self.text_store = ChunkTextStore() if CHUNK_TEXT_OUT_OF_LINE else None
+        self.rerank_vectors = RerankVectors(dim=self.dim, dtype=self.vector_dtype) if self.coarse_dim else None
+        return self
+
+    def schema(self):
+        """Collection schema for the configured layout"""
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="embedding", dtype=VECTOR_FIELD_TYPES[self.vector_dtype], dim=self.index_dim()),
+        ]
+        if self.coarse_dim:
+            fields.append(FieldSchema(name="vector_row", dtype=DataType.INT64))
+        if self.text_store is not None:
+            fields += [FieldSchema(name="text_offset", dtype=DataType.INT64),
+                       FieldSchema(name="text_length", dtype=DataType.INT64)]
+        else:
+            fields.append(FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=1024))
+        fields += [
+            FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=512),
+            FieldSchema(name="chunk_index", dtype=DataType.INT64),
+            FieldSchema(name="char_start", dtype=DataType.INT64),
+            FieldSchema(name="char_end", dtype=DataType.INT64),
+            FieldSchema(name="ingested_at", dtype=DataType.INT64),
+        ]
+        return CollectionSchema(fields, description="Research documents")
+
+    def create(self, keep_side_files=False):
+        """
+        Create an empty collection with the configured layout. The chunk
+        text and rerank vector files are wiped unless `keep_side_files`,
+        which bulk_import.py uses for rows that already point into them.
+        """
+        self._connect()
+        # Drop existing collection to avoid conflicts
+        if utility.has_collection(self.collection_name):
+            print(f"🗑️ Dropping existing collection '{self.collection_name}'...")
+            utility.drop_collection(self.collection_name)
+
+        self.configure()
+        self.collection = Collection(self.collection_name, self.schema())
+        if not keep_side_files:
+            if self.text_store is not None:
+                self.text_store.create()
+            if self.rerank_vectors is not None:
+                self.rerank_vectors.create()
+
+        # Start with an index for a small collection; optimize_index() resizes it after ingestion
+        self.collection.create_index("embedding", choose_index(0, self.index_dim(), self.vector_dtype))
+        self.collection.load()
+        self.loaded = True
+        print(f"✅ Created collection: {self.collection_name}")
+        return self
+
+    def open(self):
+        self._connect()
+        self.collection = Collection(self.collection_name)
+        self._read_schema()
+        return self
+
+    def load(self):
+        """Load the collection into memory unless the server already has it loaded"""
+        if self.loaded:
+            return
+        if utility.load_state(self.collection_name) != LoadState.Loaded:
+            self.collection.load()
+        self.loaded = True
+
+    def warm_up(self):
+        self.load()
+
+    def index_params(self):
+        """Parameters of the collection's current vector index"""
+        for index in self.collection.indexes:
+            if index.field_name == "embedding":
+                return index.params
+        return None
+
+    def optimize_index(self):
+        """
+        Rebuild the vector index if the row count calls for a different one.
+        The nlist of IVF indexes is only changed when it is off by more than 2x.
+        """
+        if not AUTO_INDEX:
+            return False
+        wanted = choose_index(self.count(), self.index_dim(), self.vector_dtype)
+        current = self.index_params()
+        if current is not None and current.get("index_type") == wanted["index_type"]:
+            params = current.get("params", {})
+            if isinstance(params, str):
+                params = json.loads(params)
+            nlist = int(params.get("nlist", 0))
+            if "nlist" not in wanted["params"] or wanted["params"]["nlist"] / 2 <= nlist <= wanted["params"]["nlist"] * 2:
+                return False
+
+        print(f"🔧 Rebuilding index as {wanted['index_type']} {wanted['params']} for {self.count()} rows")
+        self.collection.release()
+        self.collection.drop_index()
+        self.collection.create_index("embedding", wanted)
+        self.collection.load()
+        self.loaded = True
+        self.search_index = None
+        return True
+
+    def get_search_params(self, top_k):
+        """
+        Search params for a search returning search_limit(top_k) hits: tuned
+        ones from tune_index.py if stored, else defaults for the index. The
+        HNSW ef is raised to the limit, as Milvus rejects ef below it.
+        """
+        limit = self.search_limit(top_k)
+        if self.search_index is None:
+            index = self.index_params() or choose_index(0, self.index_dim(), self.vector_dtype)
+            self.search_index = (index, load_search_params(self.collection_name, index["index_type"]))
+        index, tuned = self.search_index
+        params = tuned or default_search_params(index, limit)
+        if "ef" in params["params"]:
+            params = {**params, "params": {**params["params"], "ef": max(int(params["params"]["ef"]), limit)}}
+        return params
+
+    def _partition(self, group):
+        """Name of the partition for a source group, created on first use"""
+        name = partition_name(group)
+        if not self.collection.has_partition(name):
+            self.collection.create_partition(name)
+        return name
+
+    def columns(self, embeddings, texts, metadata=None):
+        """
+        {source group: (row positions, {field: column})} for a batch of rows.
+        Vectors are converted as arrays, appended to the side stores, and
+        integer columns are int64 arrays, so inserts and the columnar export
+        in bulk_import.py share one layout.
+        """
+        metadata = metadata or empty_metadata(len(texts))
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        groups = {}
+        for i, source in enumerate(metadata["source"]):
+            groups.setdefault(source_group(source), []).append(i)
+
+        batches = {}
+        for group, rows in groups.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            vectors = embeddings[rows]
+            group_texts = [texts[i] for i in rows]
+            columns = {"embedding": self.vector_column(vectors)}
+            if self.rerank_vectors is not None:
+                columns["vector_row"] = np.asarray(self.rerank_vectors.append(vectors), dtype=np.int64)
+            if self.text_store is not None:
+                offsets, lengths = self.text_store.append(group_texts)
+                columns["text_offset"] = np.asarray(offsets, dtype=np.int64)
+                columns["text_length"] = np.asarray(lengths, dtype=np.int64)
+            else:
+                columns["text"] = group_texts
+            for field in METADATA_FIELDS:
+                values = metadata[field]
+                columns[field] = ([values[i] for i in rows] if field == "source"
+                                  else np.asarray(values, dtype=np.int64)[rows])
+            batches[group] = (rows, columns)
+        return batches
+
+    def insert(self, embeddings, texts, metadata=None):
+        """Insert rows into the partition of their source group, one call per partition"""
+        ids = [None] * len(texts)
+        with span("store_seconds", backend=self.name, op="insert"):
+            for group, (rows, columns) in self.columns(embeddings, texts, metadata).items():
+                # pymilvus takes ndarray columns as they are, so nothing is copied into lists here
+                data = list(columns.values())
+                result = self.collection.insert(data, partition_name=self._partition(group))
+                for i, pk in zip(rows, result.primary_keys):
+                    ids[i] = pk
+        return ids
+
+    def vector_column(self, vectors):
+        """Vectors as the 2-D array the vector field takes, truncated to coarse_dim"""
+        if self.coarse_dim:
+            vectors = truncate(vectors, self.coarse_dim)
+        if self.vector_dtype == "float32":
+            return vectors
+        return quantize(vectors, self.vector_dtype)
+
+    def delete(self, ids):
+        for i in range(0, len(ids), 1000):
+            self.collection.delete(f"id in {list(ids[i:i+1000])}")
+
+    def flush(self):
+        with span("store_seconds", backend=self.name, op="flush"):
+            if self.text_store is not None:
+                self.text_store.flush()
+            if self.rerank_vectors is not None:
+                self.rerank_vectors.flush()
+            self.collection.flush()
+
+    def count(self):
+        return self.collection.num_entities
+
+    def iter_embeddings(self, batch_size=1000):
+        """Yield (ids, full-dimension vectors) for every row, used for exact ground truth"""
+        self.load()
+        field = "vector_row" if self.rerank_vectors is not None else "embedding"
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size, expr="id >= 0", output_fields=[field]
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                if self.rerank_vectors is not None:
+                    vectors = list(self.rerank_vectors.get([row["vector_row"] for row in rows]))
+                else:
+                    vectors = [self.decode_vector(row["embedding"]) for row in rows]
+                yield [row["id"] for row in rows], vectors
+        finally:
+            iterator.close()
+
+    def iter_chunks(self, batch_size=1000):
+        """Yield lists of {"id", "source", "chunk_index", "text"} for every row"""
+        self.load()
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size, expr="id >= 0", output_fields=["source", "chunk_index"] + self.text_fields()
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                if self.text_store is not None:
+                    texts = self.text_store.get_many([(row["text_offset"], row["text_length"]) for row in rows])
+                else:
+                    texts = [row["text"] for row in rows]
+                yield [{"id": row["id"], "source": row["source"], "chunk_index": row["chunk_index"], "text": text}
+                       for row, text in zip(rows, texts)]
+        finally:
+            iterator.close()
+
+    def decode_vector(self, vector):
+        """float32 array for a vector returned by a query (float16 and int8 come back as bytes)"""
+        if isinstance(vector, bytes):
+            vector = np.frombuffer(vector, dtype=self.vector_dtype)
+        elif isinstance(vector, list) and vector and isinstance(vector[0], bytes):
+            vector = np.frombuffer(vector[0], dtype=self.vector_dtype)
+        return np.asarray(vector, dtype=np.float32)
+
+    def partition_names(self, partitions):
+        """Existing partitions for the given source groups, None for all"""
+        if not partitions:
+            return None
+        names = [partition_name(group) for group in partitions]
+        return [name for name in names if self.collection.has_partition(name)]
+
+    def text_fields(self):
+        return ["text_offset", "text_length"] if self.text_store is not None else ["text"]
+
+    def search(self, vectors, top_k, partitions=None, filters=None, param=None, with_text=True):
+        """
+        Without `with_text`, inline text is not transferred at all and
+        out-of-line text is not read; attach_text() fetches it later.
+        Two-stage collections fetch top_k * COARSE_CANDIDATES coarse hits
+        and keep the top_k after the exact rerank.
+        """
+        self.load()
+        partition_names = self.partition_names(partitions)
+        if partition_names == []:
+            return [[] for _ in vectors]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        output_fields = ["source", "chunk_index", "char_start", "char_end"]
+        if self.text_store is not None or (with_text and not self.coarse_dim):
+            output_fields += self.text_fields()
+        if self.rerank_vectors is not None:
+            output_fields.append("vector_row")
+        with span("store_seconds", backend=self.name, op="search"):
+            results = self.collection.search(
+                data=list(self.vector_column(vectors)),
+                anns_field="embedding",
+                param=param or self.get_search_params(top_k),
+                limit=self.search_limit(top_k),
+                expr=filter_expression(filters) or None,
+                partition_names=partition_names,
+                output_fields=output_fields
+            )
+
+        # Format results
+        formatted = []
+        for hits in results:
+            formatted.append([
+                {
+                    "text": hit.entity.get("text"), "score": hit.score, "id": hit.id,
+                    "source": hit.entity.get("source"), "chunk_index": hit.entity.get("chunk_index"),
+                    "char_start": hit.entity.get("char_start"), "char_end": hit.entity.get("char_end"),
+                }
+                for hit in hits
+            ])
+            if self.text_store is not None:
+                # Keep the text reference on the hit until its text is needed
+                for hit, raw in zip(formatted[-1], hits):
+                    hit["_text_ref"] = (raw.entity.get("text_offset"), raw.entity.get("text_length"))
+            if self.rerank_vectors is not None:
+                rows = [raw.entity.get("vector_row") for raw in hits]
+                formatted[-1] = self.rerank(vectors[len(formatted) - 1], formatted[-1], rows, top_k)
+        if with_text:
+            self.attach_text([hit for hits in formatted for hit in hits])
+        return formatted
+
+    def rerank(self, query, hits, rows, top_k):
+        """Exact full-dimension cosine scores for coarse hits, best `top_k` first"""
+        if not hits:
+            return hits
+        query = query / (np.linalg.norm(query) or 1.0)
+        exact = self.rerank_vectors.get(rows) @ query
+        order = np.argsort(-exact, kind="stable")[:top_k]
+        return [{**hits[i], "score": float(exact[i])} for i in order]
+
+    def attach_text(self, hits):
+        super().attach_text(hits)
+        for hit in hits:
+            hit.pop("_text_ref", None)
+        return hits
+
+    def fetch_text(self, hits):
+        """Out-of-line text from the chunk store, inline text with one query by id"""
+        if self.text_store is not None and all("_text_ref" in hit for hit in hits):
+            return self.text_store.get_many([hit["_text_ref"] for hit in hits])
+        rows = self.collection.query(expr=f"id in {[hit['id'] for hit in hits]}",
+                                     output_fields=self.text_fields())
+        if self.text_store is not None:
+            refs = {row["id"]: (row["text_offset"], row["text_length"]) for row in rows}
+            return [self.text_store.get(*refs[hit["id"]]) for hit in hits]
+        texts = {row["id"]: row["text"] for row in rows}
+        return [texts.get(hit["id"]) for hit in hits]
+
+    def fetch_vectors(self, hits):
+        """Full vectors with one query by id, from the rerank file for two-stage collections"""
+        if not hits:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        self.load()
+        field = "vector_row" if self.rerank_vectors is not None else "embedding"
+        rows = self.collection.query(expr=f"id in {[hit['id'] for hit in hits]}", output_fields=[field])
+        values = {row["id"]: row[field] for row in rows}
+        if self.rerank_vectors is not None:
+            return self.rerank_vectors.get([values[hit["id"]] for hit in hits])
+        return quantize(np.stack([self.decode_vector(values[hit["id"]]) for hit in hits]), "float32")
+
+    def select(self, ids, partitions=None, filters=None):
+        ids = list(ids)
+        partition_names = self.partition_names(partitions)
+        if not ids or partition_names == []:
+            return []
+        self.load()
+        expr = f"id in {ids}"
+        if filters:
+            expr += f" and ({filter_expression(filters)})"
+        rows = self.collection.query(expr=expr, partition_names=partition_names, output_fields=["id"])
+        found = {row["id"] for row in rows}
+        return [pk for pk in ids if pk in found]
@@ -0,0 +1,227 @@
+import os
+import queue
+import threading
+import time
+from config import (
+    EMBED_BATCH_SIZE, EMBED_WORKERS, PIPELINE_QUEUE_DEPTH, INSERT_TARGET_BYTES,
+    CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNK_CHARS, LOADER_WORKERS, LOADER_MAX_IN_FLIGHT,
+)
+from utils.loaders import chunk_document, iter_documents, LoaderStats
+from batching import BatchSizer, InsertBuffer, adaptive_batches
+from embeddings import CircuitOpenError
+from vector_store import take_metadata
+from metrics import inc, timed_iter, log
+
+_DONE = object()  # End-of-stream marker passed between stages
+
+
+def iter_stored_chunks(path):
+    """Stream a file's chunks as they are stored, truncated for the VARCHAR limit"""
+    for chunk in chunk_document(path, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+        yield chunk[:MAX_CHUNK_CHARS]
+
+
+def iter_stored_documents(paths, stats=None, workers=LOADER_WORKERS):
+    """(path, stored chunks) per file in order, PDF and DOCX parsed in a process pool"""
+    return iter_documents(paths, CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNK_CHARS,
+                          workers=workers, max_in_flight=LOADER_MAX_IN_FLIGHT, stats=stats)
+
+
+def chunk_metadata(source, ordinals, texts, ingested_at):
+    """
+    Metadata columns for chunks of `source` at positions `ordinals`.
+    Chunks start every CHUNK_SIZE - CHUNK_OVERLAP characters, so offsets
+    are exact positions in the whitespace-normalized document text.
+    """
+    step = CHUNK_SIZE - CHUNK_OVERLAP
+    starts = [i * step for i in ordinals]
+    return {
+        "source": [source] * len(texts),
+        "chunk_index": list(ordinals),
+        "char_start": starts,
+        "char_end": [start + len(text) for start, text in zip(starts, texts)],
+        "ingested_at": [ingested_at] * len(texts),
+    }
+
+
+def source_name(path, root=None):
+    """Source path stored with each chunk: relative to `root` when given"""
+    return os.path.relpath(path, root).replace(os.sep, "/") if root else os.path.basename(path)
+
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """Blocking get that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _chunk_stage(paths, sizer, out_q, stop, workers, stats, dedup, root, loader_stats,
+                 checkpoint, ingested_at):
+    """
+    Read and chunk files, emitting (texts, metadata) batches without
+    duplicates. Chunks the checkpoint has committed are skipped, but still
+    seen by the deduplicator so a resumed run drops the same duplicates.
+    """
+    try:
+        for path, document in iter_stored_documents(paths, loader_stats):
+            if stop.is_set():
+                return
+            try:
+                count = 0
+                source = source_name(path, root)
+                committed = checkpoint.rows(source) if checkpoint is not None else {}
+                chunks = adaptive_batches(enumerate(document), sizer)
+                for batch in timed_iter("chunk_batch_seconds", chunks):
+                    count += len(batch)
+                    if dedup is not None:
+                        batch = [(i, text) for i, text in batch if dedup.check(text) is None and i not in committed]
+                    elif committed:
+                        batch = [(i, text) for i, text in batch if i not in committed]
+                    if not batch:
+                        continue
+                    ordinals = [i for i, _ in batch]
+                    texts = [text for _, text in batch]
+                    if not _put(out_q, (texts, chunk_metadata(source, ordinals, texts, ingested_at)), stop):
+                        return
+                if count == 0:
+                    print(f"⚠️ Skipping empty file: {os.path.basename(path)}")
+                    continue
+                stats["files"] += 1
+                stats["chunks"] += count
+                stats["resumed"] += len(committed)
+                log(f"📄 {os.path.basename(path)}: {count} chunks")
+            except Exception as e:
+                print(f"❌ Error processing file {path}: {e}")
+    finally:
+        for _ in range(workers):
+            _put(out_q, _DONE, stop)
+
+
+def _embed_stage(embedder, sizer, in_q, out_q, stop, dead_letters, fatal):
+    """
+    Embed chunk batches pulled from the chunk queue, feeding their latency
+    to the sizer. Chunks that fail to embed go to the dead-letter queue;
+    if the embedding server stays down the whole pipeline stops.
+    """
+    try:
+        while True:
+            item = _get(in_q, stop)
+            if item is _DONE:
+                return
+            batch, metadata = item
+            try:
+                started = time.perf_counter()
+                embeddings, failed = embedder.encode(batch)
+                sizer.observe(len(batch), time.perf_counter() - started)
+            except CircuitOpenError as e:
+                fatal.append(e)
+                stop.set()
+                return
+            except Exception as e:
+                embeddings, failed = None, dict.fromkeys(range(len(batch)), e)
+            if failed:
+                inc("ingest_dropped_batches_total")
+                rows = sorted(failed)
+                if dead_letters is not None:
+                    dead_letters.add([batch[i] for i in rows], take_metadata(metadata, rows),
+                                     [failed[i] for i in rows])
+                else:
+                    print(f"  ❌ Error embedding {len(rows)} of {len(batch)} chunks: {failed[rows[0]]}")
+                keep = [i for i in range(len(batch)) if i not in failed]
+                if not keep:
+                    continue
+                batch, metadata = [batch[i] for i in keep], take_metadata(metadata, keep)
+            if not _put(out_q, (batch, metadata, embeddings), stop):
+                return
+    finally:
+        _put(out_q, _DONE, stop)
+
+
+def run_pipeline(paths, embedder, store, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS,
+                 queue_depth=PIPELINE_QUEUE_DEPTH, insert_target_bytes=INSERT_TARGET_BYTES,
+                 dedup=None, lexical=None, root=None, checkpoint=None, dead_letters=None,
+                 ingested_at=None):
+    """
+    Ingest files with chunking, embedding and inserts running concurrently.
+    One thread chunks files (parsing PDF and DOCX files in a process pool),
+    `workers` threads embed batches in parallel and the calling thread
+    inserts into the store through an InsertBuffer. Embedding batches of
+    up to `batch_size` texts are sized from measured latency and inserts
+    from buffered bytes. Bounded queues between the stages keep memory
+    flat. An optional ChunkDeduplicator drops duplicate chunks before they are embedded, and
+    inserted rows are added to the BM25 index when one is given. Chunks
+    are stored with their source path relative to `root` and their offsets.
+    With an IngestCheckpoint, committed chunks are skipped and new rows
+    logged after each insert; failed chunks go to `dead_letters`. If the
+    embedding server stays unreachable, rows already embedded are still
+    inserted and the CircuitOpenError is raised, so the run can be resumed.
+    """
+    stop = threading.Event()
+    chunk_q = queue.Queue(maxsize=queue_depth)
+    embed_q = queue.Queue(maxsize=queue_depth)
+    stats = {"files": 0, "chunks": 0, "resumed": 0}
+    loader_stats = LoaderStats()
+    sizer = BatchSizer(maximum=batch_size)
+    buffer = InsertBuffer(store, lexical, target_bytes=insert_target_bytes,
+                          checkpoint=checkpoint, dead_letters=dead_letters)
+    ingested_at = ingested_at or int(time.time())
+    fatal = []
+
+    threads = [threading.Thread(
+        target=_chunk_stage,
+        args=(paths, sizer, chunk_q, stop, workers, stats, dedup, root, loader_stats,
+              checkpoint, ingested_at),
+        name="ingest-chunker", daemon=True,
+    )]
+    for n in range(workers):
+        threads.append(threading.Thread(
+            target=_embed_stage,
+            args=(embedder, sizer, chunk_q, embed_q, stop, dead_letters, fatal),
+            name=f"ingest-embed-{n}", daemon=True,
+        ))
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    try:
+        finished = 0
+        while finished < workers:
+            item = _get(embed_q, stop)
+            if item is _DONE:
+                if stop.is_set():
+                    break
+                finished += 1
+                continue
+            batch, metadata, embeddings = item
+            buffer.add(embeddings, batch, metadata)
+    finally:
+        # Rows already embedded are inserted (and checkpointed) even when stopping early
+        buffer.flush()
+        stop.set()
+        for t in threads:
+            t.join()
+    if fatal:
+        raise fatal[0]
+
+    stats.update(buffer.stats)
+    stats["dead_lettered"] = dead_letters.added if dead_letters is not None else 0
+    stats["embed_batch_size"] = sizer.size
+    stats["seconds"] = time.perf_counter() - started
+    stats["chunks_per_sec"] = stats["inserted"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["formats"] = loader_stats.summary()
+    return stats
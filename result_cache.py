@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import (
+    EMBED_DIM, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD,
+    COLLECTION_VERSION_PATH,
+)
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def mark_collection_changed(path=COLLECTION_VERSION_PATH):
+    """Record that ingestion changed the collection, invalidating result caches"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+
+
+def collection_version(path=COLLECTION_VERSION_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class QueryResultCache:
+    """
+    Two-tier cache of search results.
+    The exact tier is an LRU keyed by (normalized query, top_k, mode). The semantic
+    tier keeps the embeddings of cached queries in a matrix and reuses the
+    results of any query whose cosine similarity to the new one is above
+    `threshold`. Entries expire after `ttl` seconds, and both tiers are
+    cleared when ingestion marks the collection as changed.
+    """
+
+    def __init__(self, size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL,
+                 threshold=SEMANTIC_CACHE_THRESHOLD, dim=EMBED_DIM,
+                 version_path=COLLECTION_VERSION_PATH):
+        self.size = size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version_path = version_path
+        self.lock = threading.Lock()
+
+        self.exact = OrderedDict()
+        self.vectors = np.zeros((size, dim), dtype=np.float32)
+        self.entries = [None] * size  # (mode, top_k, results, expires) per semantic slot
+        self.next_slot = 0
+
+        self.version = collection_version(version_path)
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.exact.clear()
+        self.vectors[:] = 0.0
+        self.entries = [None] * self.size
+        self.next_slot = 0
+
+    def _check_version(self):
+        version = collection_version(self.version_path)
+        if version != self.version:
+            self.version = version
+            self.invalidations += 1
+            self._clear()
+
+    def get(self, query, top_k, mode="vector", semantic_next=False):
+        """
+        Exact tier lookup, returns cached results or None. With
+        `semantic_next` a miss is left for the get_semantic() call that
+        follows to count, so each lookup counts at most one miss.
+        """
+        key = (normalize_query(query), top_k, mode)
+        with self.lock:
+            self._check_version()
+            entry = self.exact.get(key)
+            if entry is not None:
+                results, expires = entry
+                if expires > time.monotonic():
+                    self.exact.move_to_end(key)
+                    self.exact_hits += 1
+                    return results
+                del self.exact[key]
+            if not semantic_next:
+                self.misses += 1
+        return None
+
+    def get_semantic(self, embedding, top_k, mode="vector"):
+        """
+        Semantic tier lookup for a query embedding.
+        Only entries cached for the same mode with at least `top_k` results qualify.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        with self.lock:
+            if norm > 0:
+                sims = self.vectors @ (query / norm)
+                now = time.monotonic()
+                for slot in np.argsort(-sims):
+                    if sims[slot] < self.threshold:
+                        break
+                    entry = self.entries[slot]
+                    if entry is None:
+                        continue
+                    cached_mode, cached_k, results, expires = entry
+                    if expires > now and cached_mode == mode and cached_k >= top_k:
+                        self.semantic_hits += 1
+                        return results[:top_k]
+            self.misses += 1
+        return None
+
+    def put(self, query, top_k, embedding, results, mode="vector"):
+        """Cache results; `embedding` may be None for queries that were never embedded"""
+        expires = time.monotonic() + self.ttl
+        key = (normalize_query(query), top_k, mode)
+        with self.lock:
+            self.exact[key] = (results, expires)
+            self.exact.move_to_end(key)
+            while len(self.exact) > self.size:
+                self.exact.popitem(last=False)
+
+            if embedding is None:
+                return
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                slot = self.next_slot
+                self.vectors[slot] = vector / norm
+                self.entries[slot] = (mode, top_k, results, expires)
+                self.next_slot = (slot + 1) % self.size
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "exact_hit_rate": self.exact_hits / lookups if lookups else 0.0,
+            "semantic_hit_rate": self.semantic_hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self.exact),
+        }
@@ -1,58 +1,340 @@
+import time
+import threading
+from collections import defaultdict, deque
 import numpy as np
-import requests
-import json
-from pymilvus import Collection
-from config import COLLECTION_NAME
+from config import (
+    EMBED_MODEL, OLLAMA_BASE_URL, EMBED_CACHE_ENABLED, SEARCH_BATCH_SIZE, RESULT_CACHE_ENABLED,
+    RETRIEVAL_MODE, RRF_K, HYBRID_CANDIDATES, DIVERSIFY_RESULTS, MMR_CANDIDATES,
+)
+from embeddings import get_embedding_client
+from embedding_cache import EmbeddingCache
+from vector_store import get_vector_store, check_filters
+from result_cache import QueryResultCache, collection_version
+from lexical_index import BM25Index
+from diversify import mmr_order, group_adjacent, join_passage
+from metrics import METRICS, log
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Fuse ranked result lists by summing 1 / (k + rank) per id"""
+    fused = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, 1):
+            entry = fused.get(hit["id"])
+            if entry is None:
+                entry = fused[hit["id"]] = {**hit, "score": 0.0}
+            elif entry.get("text") is None:
+                entry["text"] = hit.get("text")
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)[:top_k]
+
+def scoped_mode(mode, partitions=None, filters=None, diversify=False):
+    """Result cache mode key, so scoped, unscoped and diversified results are cached apart"""
+    if diversify:
+        mode = f"{mode}|diverse"
+    if not partitions and not filters:
+        return mode
+    return f"{mode}|{sorted(partitions or ())}|{sorted((filters or {}).items())}"
 
 class OllamaRetriever:
-    def __init__(self, model_name="nomic-embed-text"):
+    def __init__(self, model_name=EMBED_MODEL, use_cache=EMBED_CACHE_ENABLED,
+                 use_result_cache=RESULT_CACHE_ENABLED, mode=RETRIEVAL_MODE,
+                 base_url=OLLAMA_BASE_URL, store=None, diversify=DIVERSIFY_RESULTS, backend=None):
         self.model_name = model_name
-        self.base_url = "http://localhost:11434"
-        self.collection = Collection(COLLECTION_NAME)
-        self.collection.load()
+        self.client = get_embedding_client(backend, model_name, base_url=base_url)
+        self.cache = EmbeddingCache() if use_cache else None
+        self.result_cache = QueryResultCache() if use_result_cache else None
+        self._store = store
+        self.store_lock = threading.Lock()
+        self.warming = None
+        self.mode = mode
+        self.diversify = diversify
+        self.lexical = None
+        self.lexical_version = None
+        self.latencies = defaultdict(lambda: deque(maxlen=1000))
         print(f"🔍 Retriever initialized with model: {model_name}")
 
+    @property
+    def store(self):
+        """The vector store, opened on first use so lexical-only queries never connect"""
+        if self._store is None:
+            with self.store_lock:
+                if self._store is None:
+                    self._store = get_vector_store().open()
+        return self._store
+
+    def warm_up(self, background=False):
+        """
+        Load the collection, prime the embedding model and the lexical index
+        before the first query. With background=True this runs on a thread
+        and the first search waits for it; returns the seconds taken otherwise.
+        """
+        if background:
+            self.warming = threading.Thread(target=self.warm_up, name="retriever-warm-up", daemon=True)
+            self.warming.start()
+            return None
+
+        started = time.perf_counter()
+        try:
+            if self.mode != "lexical":
+                self.store.warm_up()
+                self.client.warm_up()
+            if self.mode != "vector":
+                self.lexical_index()
+        except Exception as e:
+            print(f"⚠️ Warm-up failed: {e}")
+        return time.perf_counter() - started
+
+    def _wait_for_warm_up(self):
+        warming = self.warming
+        if warming is not None:
+            warming.join()
+            self.warming = None
+
     def encode_query(self, query):
-        """Encode query using Ollama API"""
+        """Encode query using the embedding cache first, then the embedding backend"""
+        if self.cache is not None:
+            cached = self.cache.get(self.model_name, query)
+            if cached is not None:
+                return cached
         try:
-            response = requests.post(
-                f"{self.base_url}/api/embeddings",
-                json={
-                    "model": self.model_name,
-                    "prompt": query
-                }
-            )
-            response.raise_for_status()
-            embedding = response.json()["embedding"]
-            return embedding
+            embedding = self.client.embed_one(query)
         except Exception as e:
             print(f"❌ Error encoding query: {e}")
             raise
+        if self.cache is not None:
+            self.cache.put(self.model_name, query, embedding)
+        return embedding
+
+    def encode_queries(self, queries):
+        """Encode many queries, one embedding call for all cache misses"""
+        if self.cache is None:
+            return self.client.embed(queries)
+        embeddings, missing = self.cache.get_many(self.model_name, queries)
+        if missing:
+            missing_queries = [queries[i] for i in missing]
+            fresh = self.client.embed(missing_queries)
+            embeddings[missing] = fresh
+            self.cache.put_many(self.model_name, missing_queries, fresh)
+        return embeddings
+
+    def lexical_index(self):
+        """The BM25 index, reloaded when ingestion has changed the collection"""
+        version = collection_version()
+        if self.lexical is None or version != self.lexical_version:
+            if not BM25Index.exists():
+                return None
+            self.lexical = BM25Index.load()
+            self.lexical_version = version
+        return self.lexical
+
+    def search(self, query, top_k=5, mode=None, partitions=None, filters=None, diversify=None):
+        """
+        Search in `mode`: "vector", "lexical" or "hybrid" (RETRIEVAL_MODE by default).
+        `partitions` limits the search to source groups (subdirectories of
+        data/), `filters` to chunks matching e.g. {"source": "notes/a.md"}.
+        With `diversify` (DIVERSIFY_RESULTS by default), vector and hybrid
+        results are picked by MMR and overlapping chunks merged into passages.
+        """
+        mode = mode or self.mode
+        diversify = self.diversify if diversify is None else diversify
+        filters = check_filters(filters)
+        log(f"🔍 Searching for: '{query}'")
+        self._wait_for_warm_up()
+        
+        started = time.perf_counter()
+        results = self._search(query, top_k, mode, partitions, filters, diversify)
+        elapsed = time.perf_counter() - started
+        self.latencies[mode].append(elapsed)
+        METRICS.observe("search_seconds", elapsed, mode=mode)
+        return results
 
-    def search(self, query, top_k=5):
-        print(f"🔍 Searching for: '{query}'")
+    def lexical_search(self, lexical, query, top_k, partitions=None, filters=None):
+        """BM25 search; scoped searches over-fetch and keep the hits inside the scope"""
+        if not partitions and not filters:
+            return lexical.search(query, top_k)
+        hits = lexical.search(query, top_k * HYBRID_CANDIDATES)
+        inside = set(self.store.select([hit["id"] for hit in hits], partitions, filters))
+        return [hit for hit in hits if hit["id"] in inside][:top_k]
+
+    def _search(self, query, top_k, mode, partitions=None, filters=None, diversify=False):
+        if mode not in ("vector", "lexical", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode!r}")
+        lexical = self.lexical_index() if mode != "vector" else None
+        if mode == "lexical" and lexical is None:
+            raise RuntimeError("No lexical index found, run ingest.py first")
+        if mode == "hybrid" and lexical is None:
+            print("⚠️ No lexical index found, falling back to vector search")
+            mode = "vector"
+        # Lexical hits carry neither vectors nor offsets, so they are never diversified
+        diversify = diversify and mode != "lexical"
+        cache_mode = scoped_mode(mode, partitions, filters, diversify)
+
+        if self.result_cache is not None:
+            cached = self.result_cache.get(query, top_k, cache_mode, semantic_next=mode != "lexical")
+            if cached is not None:
+                METRICS.inc("result_cache_hits_total", tier="exact")
+                return cached
+        
+        # Keyword lookups are answered by the inverted index without embedding
+        if mode == "lexical":
+            results = self.lexical_search(lexical, query, top_k, partitions, filters)
+            if self.result_cache is not None:
+                self.result_cache.put(query, top_k, None, results, cache_mode)
+            return results
         
         # Encode the query
         query_embedding = self.encode_query(query)
         
-        # Search in Milvus
-        results = self.collection.search(
-            data=[query_embedding],
-            anns_field="embedding",
-            param={"metric_type": "COSINE", "params": {"nprobe": 16}},
-            limit=top_k,
-            output_fields=["text"]
-        )
+        if self.result_cache is not None:
+            cached = self.result_cache.get_semantic(query_embedding, top_k, cache_mode)
+            if cached is not None:
+                METRICS.inc("result_cache_hits_total", tier="semantic")
+                return cached
         
-        # Format results
-        formatted_results = []
-        for hits in results:
-            for hit in hits:
-                formatted_results.append({
-                    "text": hit.entity.get("text"),
-                    "score": hit.score,
-                    "id": hit.id
-                })
-        
-        return formatted_results
-        return [hit.entity.get("text") for hit in results[0]]
+        # Search the vector store; over-fetched candidates get their text only if they are kept
+        keep = top_k * MMR_CANDIDATES if diversify else top_k
+        if mode == "hybrid":
+            candidates = max(keep, top_k * HYBRID_CANDIDATES)
+            results = reciprocal_rank_fusion([
+                self.store.search([query_embedding], candidates, partitions, filters, with_text=False)[0],
+                self.lexical_search(lexical, query, candidates, partitions, filters),
+            ], keep)
+        else:
+            results = self.store.search([query_embedding], keep, partitions, filters, with_text=not diversify)[0]
+        if diversify:
+            results = self.diversify_results([query_embedding], [results], top_k)[0]
+        else:
+            results = self.store.attach_text(results)
+        if self.result_cache is not None:
+            self.result_cache.put(query, top_k, query_embedding, results, cache_mode)
+        return results
+
+    def diversify_results(self, query_embeddings, hit_lists, top_k):
+        """
+        Up to top_k passages per query from over-fetched candidates: the
+        candidates in MMR order, with overlapping or adjacent chunks of a
+        source merged into one passage. One vector fetch and one text fetch
+        cover all queries.
+        """
+        hits = [hit for candidates in hit_lists for hit in candidates]
+        if not hits:
+            return hit_lists
+        vectors = self.store.fetch_vectors(hits)
+        grouped, start = [], 0
+        for query_embedding, candidates in zip(query_embeddings, hit_lists):
+            order = mmr_order(query_embedding, vectors[start:start + len(candidates)], len(candidates))
+            start += len(candidates)
+            grouped.append(group_adjacent([candidates[i] for i in order], top_k))
+        self.store.attach_text([hit for passages in grouped for group in passages for hit in group])
+        merged = sum(len(candidates) for passages in grouped for candidates in passages) - \
+            sum(len(passages) for passages in grouped)
+        METRICS.inc("merged_chunks_total", merged)
+        return [[join_passage(group) for group in passages] for passages in grouped]
+
+    def latency_stats(self):
+        """Per-mode search latency over the most recent queries"""
+        stats = {}
+        for mode, samples in self.latencies.items():
+            if not samples:
+                continue
+            ms = np.array(samples) * 1000
+            stats[mode] = {
+                "count": len(ms),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+            }
+        return stats
+
+    def search_many(self, queries, top_k=5, batch_size=SEARCH_BATCH_SIZE, mode=None, partitions=None,
+                    filters=None, diversify=None):
+        """
+        Search many queries at once, with the same mode, result cache and
+        diversification as search(). Queries go through search_batch()
+        `batch_size` at a time; results come back in input order.
+        """
+        queries = list(queries)
+        log(f"🔍 Searching {len(queries)} queries in batches of {batch_size}")
+        results = []
+        for start in range(0, len(queries), batch_size):
+            results.extend(self.search_batch(queries[start:start + batch_size], top_k, mode,
+                                             partitions, filters, diversify))
+        return results
+
+    def search_batch(self, queries, top_k=5, mode=None, partitions=None, filters=None, diversify=None):
+        """
+        Search a batch of queries in one mode, going through the result cache.
+        Cache misses share one embedding request and one multi-vector store
+        search; used by server.py to serve concurrent requests together.
+        """
+        mode = mode or self.mode
+        diversify = self.diversify if diversify is None else diversify
+        filters = check_filters(filters)
+        self._wait_for_warm_up()
+        started = time.perf_counter()
+        if mode == "lexical":
+            results = [self._search(query, top_k, mode, partitions, filters) for query in queries]
+        else:
+            results = self._search_batch(list(queries), top_k, mode, partitions, filters, diversify)
+        elapsed = time.perf_counter() - started
+        for _ in queries:
+            self.latencies[mode].append(elapsed)
+            METRICS.observe("search_seconds", elapsed, mode=mode)
+        return results
+
+    def _search_batch(self, queries, top_k, mode, partitions=None, filters=None, diversify=False):
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode!r}")
+        lexical = self.lexical_index() if mode == "hybrid" else None
+        if mode == "hybrid" and lexical is None:
+            print("⚠️ No lexical index found, falling back to vector search")
+            mode = "vector"
+        cache_mode = scoped_mode(mode, partitions, filters, diversify)
+
+        results = [None] * len(queries)
+        pending = list(range(len(queries)))
+        if self.result_cache is not None:
+            pending = []
+            for i, query in enumerate(queries):
+                results[i] = self.result_cache.get(query, top_k, cache_mode, semantic_next=True)
+                if results[i] is None:
+                    pending.append(i)
+                else:
+                    METRICS.inc("result_cache_hits_total", tier="exact")
+        if not pending:
+            return results
+
+        embeddings = self.encode_queries([queries[i] for i in pending])
+        if self.result_cache is not None:
+            misses, miss_embeddings = [], []
+            for i, embedding in zip(pending, embeddings):
+                results[i] = self.result_cache.get_semantic(embedding, top_k, cache_mode)
+                if results[i] is None:
+                    misses.append(i)
+                    miss_embeddings.append(embedding)
+                else:
+                    METRICS.inc("result_cache_hits_total", tier="semantic")
+            pending, embeddings = misses, np.asarray(miss_embeddings, dtype=np.float32)
+        if not pending:
+            return results
+
+        keep = top_k * MMR_CANDIDATES if diversify else top_k
+        candidates = max(keep, top_k * HYBRID_CANDIDATES) if mode == "hybrid" else keep
+        hits = self.store.search(embeddings, candidates, partitions, filters,
+                                 with_text=mode != "hybrid" and not diversify)
+        for i, embedding, vector_hits in zip(pending, embeddings, hits):
+            if mode == "hybrid":
+                lexical_hits = self.lexical_search(lexical, queries[i], candidates, partitions, filters)
+                results[i] = reciprocal_rank_fusion([vector_hits, lexical_hits], keep)
+            else:
+                results[i] = vector_hits
+        if diversify:
+            for i, passages in zip(pending, self.diversify_results(embeddings, [results[i] for i in pending], top_k)):
+                results[i] = passages
+        else:
+            # One text fetch for the final hits of the whole batch
+            self.store.attach_text([hit for i in pending for hit in results[i]])
+        if self.result_cache is not None:
+            for i, embedding in zip(pending, embeddings):
+                self.result_cache.put(queries[i], top_k, embedding, results[i], cache_mode)
+        return results
@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
 """
 Single query test
+Usage:
+    python3 search.py "your query"
+    python3 search.py --file queries.txt   # one query per line, searched as a batch
+    python3 search.py --warm-up            # load the collection and the model, then exit
 """
 
+import time
+STARTED = time.perf_counter()
+
 import sys
 from retriever import OllamaRetriever
 
-def query(search_text):
-    retriever = OllamaRetriever()
-    results = retriever.search(search_text, top_k=5)
-    
+def print_results(search_text, results):
     print(f"🔍 Query: '{search_text}'")
     print("=" * 60)
     
@@ -18,10 +22,40 @@ def query(search_text):
         print(f"📝 Text: {result['text']}")
         print("-" * 40)
 
+def report_first_result():
+    print(f"⏱️ Time to first result: {(time.perf_counter() - STARTED) * 1000:.0f} ms")
+
+def query(search_text):
+    retriever = OllamaRetriever()
+    results = retriever.search(search_text, top_k=5)
+    print_results(search_text, results)
+    report_first_result()
+
+def query_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    
+    retriever = OllamaRetriever()
+    for i, (search_text, results) in enumerate(zip(queries, retriever.search_many(queries, top_k=5))):
+        if i == 0:
+            report_first_result()
+        print_results(search_text, results)
+        print()
+
+def warm_up():
+    retriever = OllamaRetriever()
+    seconds = retriever.warm_up()
+    print(f"🔥 Warmed up in {seconds * 1000:.0f} ms")
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        query_text = " ".join(sys.argv[1:])
+    if len(sys.argv) > 1 and sys.argv[1] == "--warm-up":
+        warm_up()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--file":
+        query_file(sys.argv[2])
     else:
-        query_text = input("Enter your search query: ")
-    
-    query(query_text)
\ No newline at end of file
+        if len(sys.argv) > 1:
+            query_text = " ".join(sys.argv[1:])
+        else:
+            query_text = input("Enter your search query: ")
+        
+        query(query_text)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Long-running HTTP/JSON query server
+Keeps one retriever (loaded collection, pooled embedding client) and answers
+concurrent queries in micro-batches: queries arriving within
+SERVER_BATCH_WINDOW_MS share one embedding request and one multi-vector
+search, and identical queries already in flight share a single result.
+Usage:
+    python3 server.py [--host 127.0.0.1] [--port 8000]
+
+    curl -s localhost:8000/search -d '{"query": "main concepts", "top_k": 5}'
+    curl -s localhost:8000/research -d '{"query": "main concepts"}'
+    curl -s localhost:8000/stats
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_BATCH_WINDOW_MS, SERVER_MAX_BATCH, SERVER_MAX_QUEUE,
+)
+from metrics import METRICS, log
+from result_cache import normalize_query
+from retriever import scoped_mode
+from vector_store import check_filters
+
+MAX_BODY_BYTES = 1024 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent searches into batches.
+    Requests go into a queue; a single loop takes the first one, waits up to
+    `window` seconds (or until `max_batch` arrived) for more, and runs them
+    as one OllamaRetriever.search_batch call per (top_k, mode, scope) on a worker
+    thread. While a batch runs the next one builds up, so under load batches
+    grow toward max_batch. Identical in-flight queries share one future.
+    """
+
+    def __init__(self, retriever, window=SERVER_BATCH_WINDOW_MS / 1000,
+                 max_batch=SERVER_MAX_BATCH, max_queue=SERVER_MAX_QUEUE):
+        self.retriever = retriever
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.queue = asyncio.Queue()
+        self.inflight = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-batch")
+        self.running = 0  # Queries in the batch being searched
+        self.batches = 0
+        self.batched_queries = 0
+        self.deduplicated = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+    def depth(self):
+        """Queries waiting for or inside a batch"""
+        return self.queue.qsize() + self.running
+
+    def submit(self, query, top_k, mode, partitions=None, filters=None):
+        """Future with the results for `query`, shared with identical queries in flight"""
+        key = (normalize_query(query), top_k, scoped_mode(mode, partitions, filters))
+        future = self.inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return future
+        if self.queue.qsize() >= self.max_queue:
+            raise HTTPError(503, "Too many queued queries")
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        self.queue.put_nowait((key, query, (top_k, mode, partitions, filters), future))
+        return future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            self.running = len(batch)
+            groups = {}
+            for key, query, args, future in batch:
+                groups.setdefault(key[1:], (args, []))[1].append((query, future))
+
+            for args, items in groups.values():
+                queries = [query for query, _ in items]
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, self.retriever.search_batch, queries, *args
+                    )
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+            self.batches += 1
+            self.batched_queries += len(batch)
+            METRICS.inc("server_batches_total")
+            METRICS.inc("server_batched_queries_total", len(batch))
+            self.running = 0
+
+
+class QueryServer:
+    """Minimal HTTP/1.1 JSON server on asyncio streams, one retriever for all requests"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.batcher = QueryBatcher(agent.retriever)
+        self.latencies = deque(maxlen=10000)
+        self.requests = 0
+        self.errors = 0
+        self.started = time.time()
+
+    async def search(self, body):
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "'query' must be a non-empty string")
+        top_k = body.get("top_k", 5)
+        if not isinstance(top_k, int) or not 1 <= top_k <= 100:
+            raise HTTPError(400, "'top_k' must be an integer between 1 and 100")
+        mode = body.get("mode") or self.agent.retriever.mode
+        if mode not in ("vector", "lexical", "hybrid"):
+            raise HTTPError(400, "'mode' must be vector, lexical or hybrid")
+        partitions = body.get("partitions")
+        if partitions is not None and (not isinstance(partitions, list)
+                                       or not all(isinstance(p, str) for p in partitions)):
+            raise HTTPError(400, "'partitions' must be a list of source group names")
+        try:
+            filters = check_filters(body.get("filters"))
+        except (ValueError, TypeError) as e:
+            raise HTTPError(400, str(e))
+        # Shielded so a client disconnecting does not cancel a shared result
+        future = self.batcher.submit(query, top_k, mode, partitions, filters)
+        return query, await asyncio.shield(future)
+
+    async def handle(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return self.stats()
+        if method == "POST" and path == "/search":
+            _, results = await self.search(body)
+            return {"results": results}
+        if method == "POST" and path == "/research":
+            query, results = await self.search({**body, "top_k": 5})
+            # Off the event loop, so loading the BM25 index and summarizing do not stall other requests
+            answer = await asyncio.get_running_loop().run_in_executor(None, self.agent.compose, query, results)
+            return {"answer": answer}
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    def stats(self):
+        ms = np.asarray(self.latencies, dtype=np.float64) * 1000
+        batcher = self.batcher
+        stats = {
+            "uptime_seconds": time.time() - self.started,
+            "requests": self.requests,
+            "errors": self.errors,
+            "queue_depth": batcher.depth(),
+            "in_flight": len(batcher.inflight),
+            "batches": batcher.batches,
+            "mean_batch_size": batcher.batched_queries / batcher.batches if batcher.batches else 0.0,
+            "deduplicated": batcher.deduplicated,
+            "retriever": self.agent.retriever.latency_stats(),
+        }
+        if len(ms):
+            stats["latency_ms"] = {
+                "p50": float(np.percentile(ms, 50)),
+                "p95": float(np.percentile(ms, 95)),
+                "p99": float(np.percentile(ms, 99)),
+            }
+        if self.agent.retriever.result_cache is not None:
+            stats["result_cache"] = self.agent.retriever.result_cache.stats()
+        return stats
+
+    async def read_request(self, reader):
+        """Parse one request, returns (method, path, keep_alive, body) or None at EOF"""
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = {}
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except ValueError:
+                raise HTTPError(400, "Body must be JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        return method, target.split("?", 1)[0], keep_alive, body
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                started = time.perf_counter()
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, keep_alive, body = request
+                    status, payload = 200, await self.handle(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+
+                elapsed = time.perf_counter() - started
+                self.requests += 1
+                if status == 200:
+                    self.latencies.append(elapsed)
+                else:
+                    self.errors += 1
+                METRICS.observe("server_request_seconds", elapsed)
+                if isinstance(payload, dict) and status == 200 and "results" in payload:
+                    payload["latency_ms"] = elapsed * 1000
+                    payload["queue_depth"] = self.batcher.depth()
+
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def report(self, interval):
+        """Periodic queue depth and latency line"""
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats()
+            if "latency_ms" in stats:
+                latency = stats["latency_ms"]
+                print(f"📊 {stats['requests']} requests, queue depth {stats['queue_depth']}, "
+                      f"mean batch {stats['mean_batch_size']:.1f}, "
+                      f"p50 {latency['p50']:.1f}ms p99 {latency['p99']:.1f}ms")
+
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, report_interval=30):
+    from agent import ResearchAgent
+
+    agent = ResearchAgent()
+    warm_up_seconds = await asyncio.get_running_loop().run_in_executor(None, agent.retriever.warm_up)
+    log(f"🔥 Warmed up in {warm_up_seconds * 1000:.0f} ms")
+
+    app = QueryServer(agent)
+    app.batcher.start()
+    server = await asyncio.start_server(app.serve_client, host, port)
+    reporter = asyncio.get_running_loop().create_task(app.report(report_interval))
+    print(f"🌐 Serving on http://{host}:{port} (batch window {app.batcher.window * 1000:.0f} ms, "
+          f"max batch {app.batcher.max_batch})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reporter.cancel()
+        await app.batcher.stop()
+        if METRICS.enabled:
+            print(f"📈 Metrics written to {METRICS.export()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON query server with micro-batching")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--report-interval", type=float, default=30, help="Seconds between stats lines")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.report_interval))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Diversification tests: MMR ordering and merging adjacent chunks of a
+source into passages.
+"""
+
+import numpy as np
+from diversify import mmr_order, group_adjacent, join_passage
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_mmr_order_moves_near_duplicates_down():
+    query = unit(1, 0.3, 0.3)
+    vectors = np.stack([unit(1, 0.3, 0), unit(1, 0.31, 0), unit(1, 0, 0.4)])
+
+    assert mmr_order(query, vectors, 3, weight=1.0) == [0, 1, 2]
+    assert mmr_order(query, vectors, 3, weight=0.5) == [0, 2, 1]
+    assert mmr_order(query, vectors, 2, weight=0.5) == [0, 2]
+
+
+def hit(pk, source, start, end, score, text=None):
+    return {"id": pk, "source": source, "chunk_index": start // 350, "char_start": start, "char_end": end,
+            "score": score, "text": text}
+
+
+def test_group_adjacent_merges_overlapping_chunks_of_a_source():
+    hits = [
+        hit(1, "a.txt", 350, 750, 0.9),
+        hit(2, "b.txt", 0, 400, 0.8),
+        hit(3, "a.txt", 0, 400, 0.7),     # Overlaps hit 1
+        hit(4, "a.txt", 1050, 1450, 0.6),  # Separate passage of a.txt
+        hit(5, "a.txt", 700, 1100, 0.5),   # Touches hits 1 and 4
+        hit(6, "c.txt", 0, 400, 0.4),
+    ]
+
+    def ids(groups):
+        return [[h["id"] for h in group] for group in groups]
+
+    assert ids(group_adjacent(hits, 3, max_chars=2000)) == [[1, 3, 5, 4], [2], [6]]
+    # Too long to bridge, so hit 5 joins the first passage and hit 6 finds no room
+    assert ids(group_adjacent(hits, 3, max_chars=1200)) == [[1, 3, 5], [2], [4]]
+    assert ids(group_adjacent(hits, 3, max_chars=800)) == [[1, 3], [2], [4, 5]]
+
+
+def test_join_passage_drops_the_overlap():
+    text = "".join(chr(ord("a") + i % 26) for i in range(1100))
+    hits = [hit(1, "a.txt", 350, 750, 0.9, text[350:750]),
+            hit(3, "a.txt", 0, 400, 0.7, text[0:400]),
+            hit(5, "a.txt", 700, 1100, 0.5, text[700:1100])]
+
+    passage = join_passage(hits)
+    assert passage["text"] == text
+    assert passage["ids"] == [3, 1, 5]
+    assert (passage["id"], passage["score"]) == (1, 0.9)
+    assert (passage["char_start"], passage["char_end"], passage["chunk_index"]) == (0, 1100, 0)
+    assert join_passage(hits[:1]) == {**hits[0], "ids": [1]}
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Ingest state tests: resume after an interrupt, circuit-open exit,
+dead-letter replay and incremental runs driven by the manifest.
+Runs ingest.py against the fake Ollama server and a LocalStore in a
+temporary directory, so the relative .cache paths land there.
+"""
+
+import os
+import numpy as np
+import pytest
+import ingest
+from config import EMBED_DIM, EMBED_OUTAGE_TIMEOUT, COLLECTION_NAME
+from embeddings import CircuitBreaker, CircuitOpenError
+from fake_ollama import start_server
+from local_store import LocalStore
+from lexical_index import BM25Index
+from manifest import IngestManifest
+from checkpoint import IngestCheckpoint, DeadLetterQueue
+from pipeline import iter_stored_chunks
+
+
+def write_document(name, sentences, marker=None, marked=None):
+    """A document of numbered sentences; sentence `marked` carries `marker`"""
+    lines = []
+    for i in range(sentences):
+        text = f"Sentence {i} of {name} is about topic {i % 7} and item {i * 13 % 31}."
+        if i == marked:
+            text = f"{text} {marker}"
+        lines.append(text)
+    with open(os.path.join("data", name), "w", encoding="utf-8") as f:
+        f.write(" ".join(lines))
+
+
+def expected_chunks():
+    return sorted((name, i, text) for name in ingest.list_documents("data")
+                  for i, text in enumerate(iter_stored_chunks(os.path.join("data", name))))
+
+
+def stored_chunks():
+    store = LocalStore().open()
+    rows = np.flatnonzero(~store.deleted)
+    return sorted((store.sources[int(store.meta[row][0])], int(store.meta[row][1]), store.get_text(row))
+                  for row in rows)
+
+
+@pytest.fixture
+def ollama():
+    server, url = start_server(dim=EMBED_DIM)
+    yield server, url
+    server.shutdown()
+
+
+@pytest.fixture
+def embedder(tmp_path, monkeypatch, ollama):
+    """An embedder without retries whose breaker opens on the first failure, recording what it embeds"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    embedder = ingest.OllamaEmbedder(use_cache=False, base_url=ollama[1], backend="ollama")
+    embedder.client.retries = 0
+    embedder.client.breaker = CircuitBreaker(threshold=1, cooldown=2 * EMBED_OUTAGE_TIMEOUT)
+    embedder.embedded = []
+    encode = embedder.encode
+
+    def recording(texts):
+        embedder.embedded.extend(texts)
+        return encode(texts)
+
+    monkeypatch.setattr(embedder, "encode", recording)
+    monkeypatch.setattr(ingest, "OllamaEmbedder", lambda: embedder)
+    monkeypatch.setattr(ingest, "get_vector_store", lambda: LocalStore())
+    return embedder
+
+
+def test_circuit_open_stops_ingest_and_resume_skips_committed_chunks(embedder, ollama):
+    server, _ = ollama
+    write_document("a.txt", 60)
+    write_document("b.txt", 60, "OUTAGE", marked=30)
+    write_document("c.txt", 60)
+    server.RequestHandlerClass.fail_marker = "OUTAGE"
+    server.RequestHandlerClass.fail_status = 503
+
+    with pytest.raises(CircuitOpenError):
+        ingest.ingest_docs(use_dedup=False)
+    checkpoint = IngestCheckpoint.load(ingest.checkpoint_header(LocalStore(), "data", ingest.list_documents("data"),
+                                                                None, use_dedup=False))
+    assert checkpoint is not None
+    committed = sorted(checkpoint.committed)
+    assert committed == ["a.txt"]
+    assert len(checkpoint) == len(list(iter_stored_chunks("data/a.txt")))
+
+    server.RequestHandlerClass.fail_marker = None
+    embedder.client.breaker = CircuitBreaker()
+    embedder.embedded.clear()
+    ingest.ingest_docs(use_dedup=False)
+
+    a_chunks = set(iter_stored_chunks("data/a.txt"))
+    assert not a_chunks & set(embedder.embedded)
+    assert stored_chunks() == expected_chunks()
+    assert not os.path.exists(checkpoint.path)
+    assert len(BM25Index.load()) == len(expected_chunks())
+
+    # The completed run wrote the manifest, so an incremental run has nothing to embed
+    embedder.embedded.clear()
+    ingest.ingest_docs(incremental=True)
+    assert embedder.embedded == []
+    assert stored_chunks() == expected_chunks()
+
+
+def test_incremental_run_interrupted_by_an_outage_is_completed_by_the_next(embedder, ollama):
+    server, _ = ollama
+    write_document("a.txt", 60)
+    write_document("b.txt", 60)
+    write_document("c.txt", 60)
+    ingest.ingest_docs(incremental=True)
+
+    write_document("a.txt", 60, "Edited.", marked=10)
+    write_document("c.txt", 60, "OUTAGE", marked=40)
+    server.RequestHandlerClass.fail_marker = "OUTAGE"
+    server.RequestHandlerClass.fail_status = 503
+    with pytest.raises(CircuitOpenError):
+        ingest.ingest_docs(incremental=True)
+
+    server.RequestHandlerClass.fail_marker = None
+    embedder.client.breaker = CircuitBreaker()
+    ingest.ingest_docs(incremental=True)
+    assert stored_chunks() == expected_chunks()
+    store = LocalStore().open()
+    live = np.flatnonzero(~store.deleted).tolist()
+    assert sorted(BM25Index.load().doc_ids.tolist()) == live
+    manifest = IngestManifest.load(COLLECTION_NAME)
+    assert sorted(chunk[1] for entry in manifest.files.values() for chunk in entry["chunks"]) == live
+
+
+def test_journaled_rows_a_crash_never_flushed_are_ingested_again(embedder, monkeypatch):
+    write_document("a.txt", 60)
+    write_document("b.txt", 60)
+    ingest.ingest_docs(incremental=True)
+
+    # A crash before the store is flushed: its deletes are lost and the
+    # journals list rows that reopening the store drops
+    write_document("b.txt", 60, "Edited.", marked=5)
+    write_document("c.txt", 60, "CRASH", marked=40)
+    encode = embedder.encode
+
+    def crashing(texts):
+        if any("CRASH" in text for text in texts):
+            raise KeyboardInterrupt
+        return encode(texts)
+
+    with monkeypatch.context() as m:
+        m.setattr(LocalStore, "flush", lambda self: None)
+        m.setattr(embedder, "encode", crashing)
+        with pytest.raises(KeyboardInterrupt):
+            ingest.ingest_docs(incremental=True)
+
+    write_document("c.txt", 60)
+    ingest.ingest_docs(incremental=True)
+    assert stored_chunks() == expected_chunks()
+    live = np.flatnonzero(~LocalStore().open().deleted).tolist()
+    assert sorted(BM25Index.load().doc_ids.tolist()) == live
+    hits = BM25Index.load().search("Edited", top_k=10)
+    assert [hit["text"] for hit in hits] == [text for _, _, text in expected_chunks() if "Edited." in text]
+
+
+def test_interrupted_run_is_resumed_only_for_the_same_inputs(embedder, ollama):
+    server, _ = ollama
+    write_document("a.txt", 60)
+    write_document("b.txt", 60, "OUTAGE", marked=0)
+    server.RequestHandlerClass.fail_marker = "OUTAGE"
+    server.RequestHandlerClass.fail_status = 503
+    with pytest.raises(CircuitOpenError):
+        ingest.ingest_docs(use_dedup=False)
+
+    # An edited input invalidates the checkpoint, so everything is embedded again
+    server.RequestHandlerClass.fail_marker = None
+    embedder.client.breaker = CircuitBreaker()
+    write_document("a.txt", 61)
+    embedder.embedded.clear()
+    ingest.ingest_docs(use_dedup=False)
+    assert sorted(embedder.embedded) == sorted(text for _, _, text in expected_chunks())
+    assert stored_chunks() == expected_chunks()
+
+
+def test_failed_chunks_are_dead_lettered_and_replayed(embedder, ollama):
+    server, _ = ollama
+    write_document("a.txt", 60, "POISON", marked=20)
+    write_document("b.txt", 60)
+    server.RequestHandlerClass.fail_marker = "POISON"
+    server.RequestHandlerClass.fail_status = 400
+    ingest.ingest_docs(use_dedup=False)
+
+    poisoned = [chunk for chunk in expected_chunks() if "POISON" in chunk[2]]
+    assert poisoned
+    assert stored_chunks() == [chunk for chunk in expected_chunks() if "POISON" not in chunk[2]]
+    entries = DeadLetterQueue().read()
+    assert sorted((entry["source"], entry["chunk_index"], entry["text"]) for entry in entries) == poisoned
+
+    # Still failing: the entries stay, with nothing inserted
+    ingest.replay_dead_letters(embedder)
+    assert len(DeadLetterQueue().read()) == len(poisoned)
+
+    server.RequestHandlerClass.fail_marker = None
+    ingest.replay_dead_letters(embedder)
+    assert not DeadLetterQueue().exists()
+    assert stored_chunks() == expected_chunks()
+    hits = BM25Index.load().search("POISON", top_k=10)
+    assert sorted(hit["text"] for hit in hits) == sorted(text for _, _, text in poisoned)
+
+    # Replayed rows are added to the manifest, so an incremental run keeps them
+    embedder.embedded.clear()
+    ingest.ingest_docs(incremental=True)
+    assert embedder.embedded == []
+    assert stored_chunks() == expected_chunks()
+
+
+def test_full_ingest_discards_only_dead_letters_of_its_collection(embedder, ollama):
+    server, _ = ollama
+    write_document("a.txt", 60, "POISON", marked=20)
+    server.RequestHandlerClass.fail_marker = "POISON"
+    server.RequestHandlerClass.fail_status = 400
+    ingest.ingest_docs(use_dedup=False)
+    other = DeadLetterQueue(collection="other")
+    other.add(["Text for another collection."], {field: [0] for field in ingest.METADATA_FIELDS}, "failed")
+    assert len(DeadLetterQueue().read()) == len([chunk for chunk in expected_chunks() if "POISON" in chunk[2]]) + 1
+
+    # The rerun embeds the chunk again, so its old entry is dropped; the other collection's stays
+    server.RequestHandlerClass.fail_marker = None
+    ingest.ingest_docs(use_dedup=False)
+    assert stored_chunks() == expected_chunks()
+    assert [entry["collection"] for entry in DeadLetterQueue().read()] == ["other"]
+    ingest.replay_dead_letters(embedder)
+    assert [entry["collection"] for entry in DeadLetterQueue().read()] == ["other"]
+
+
+def test_incremental_run_embeds_only_changed_chunks(embedder):
+    write_document("a.txt", 60)
+    write_document("b.txt", 60)
+    write_document("c.txt", 60)
+    ingest.ingest_docs(incremental=True)
+    assert stored_chunks() == expected_chunks()
+
+    before = {(name, i): text for name, i, text in expected_chunks()}
+    write_document("b.txt", 60, "Edited.", marked=59)
+    os.remove("data/c.txt")
+    embedder.embedded.clear()
+    ingest.ingest_docs(incremental=True)
+
+    changed = sorted(text for name, i, text in expected_chunks() if before.get((name, i)) != text)
+    assert changed
+    assert sorted(embedder.embedded) == changed
+    assert stored_chunks() == expected_chunks()
+    manifest = IngestManifest.load(COLLECTION_NAME)
+    assert not os.path.exists(manifest.journal_path)
+    assert sorted(manifest.files) == ["a.txt", "b.txt"]
+    assert len(BM25Index.load()) == len(expected_chunks())
+
+    embedder.embedded.clear()
+    ingest.ingest_docs(incremental=True)
+    assert embedder.embedded == []
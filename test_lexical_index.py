@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+BM25 index tests: adds and deletes merged into the compiled arrays, or
+journaled in the delta and merged on load, must give the same index as a
+build from scratch.
+"""
+
+import os
+import numpy as np
+from lexical_index import BM25Index, _ARRAYS
+from utils.summarizer import summarize_chunks
+
+WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa", "lambda", "sigma"]
+QUERIES = ["alpha beta", "gamma", "kappa sigma theta", "epsilon zeta", "missing"]
+
+
+def document(pk):
+    rng = np.random.default_rng(pk)
+    sentences = [" ".join(rng.choice(WORDS, size=6)) + "." for _ in range(3)]
+    return f"Chunk {pk}. " + " ".join(sentences)
+
+
+def build(path, ids):
+    index = BM25Index(str(path))
+    index.add(ids, [document(pk) for pk in ids])
+    index.save()
+    return BM25Index.load(str(path))
+
+
+def assert_same_index(index, expected):
+    assert index.terms == expected.terms
+    # Text offsets differ, since merges append to the text store; the texts themselves must match
+    for name in _ARRAYS:
+        if name != "text_offset":
+            assert np.array_equal(np.asarray(getattr(index, name)), np.asarray(getattr(expected, name))), name
+    assert [index.text(i) for i in range(len(index))] == [expected.text(i) for i in range(len(expected))]
+    for query in QUERIES:
+        assert index.search(query, top_k=10) == expected.search(query, top_k=10)
+    ids = [int(pk) for pk in expected.doc_ids[:5]]
+    assert summarize_chunks(index, ids) == summarize_chunks(expected, ids)
+
+
+def test_merge_matches_a_fresh_build(tmp_path):
+    index = build(tmp_path / "merged", list(range(40)))
+    index.delete([3, 17, 39])
+    index.add(range(40, 50), [document(pk) for pk in range(40, 50)])
+    index.delete([45])
+    index.save()
+
+    survivors = [pk for pk in range(50) if pk not in (3, 17, 39, 45)]
+    assert_same_index(BM25Index.load(str(tmp_path / "merged")), build(tmp_path / "fresh", survivors))
+
+
+def test_delta_journal_is_merged_on_load(tmp_path):
+    path = str(tmp_path / "journaled")
+    index = build(path, list(range(30)))
+    index.add(range(30, 35), [document(pk) for pk in range(30, 35)])
+    index.delete([2, 31])
+    index.save(merge=False)
+    index.add(range(35, 40), [document(pk) for pk in range(35, 40)])
+    index.delete([10])
+    index.save(merge=False)
+    assert os.path.exists(os.path.join(path, "delta.jsonl"))
+    with open(os.path.join(path, "delta.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"add": [[99, "torn')  # Cut short by a crash
+
+    survivors = [pk for pk in range(40) if pk not in (2, 10, 31)]
+    loaded = BM25Index.load(path)
+    assert not os.path.exists(os.path.join(path, "delta.jsonl"))
+    assert_same_index(loaded, build(tmp_path / "fresh", survivors))
+    assert loaded.missing([0, 2, 39, 99]) == [2, 99]
+
+
+def test_replayed_adds_already_merged_are_skipped(tmp_path):
+    path = str(tmp_path / "index")
+    index = build(path, list(range(10)))
+    index.add([10, 11], [document(10), document(11)])
+    index.save(merge=False)
+    delta = os.path.join(path, "delta.jsonl")
+    with open(delta, "r", encoding="utf-8") as f:
+        journal = f.read()
+    # A crash after the merge wrote the arrays but before it dropped the journal
+    index.merge()
+    with open(delta, "w", encoding="utf-8") as f:
+        f.write(journal)
+
+    assert_same_index(BM25Index.load(path), build(tmp_path / "fresh", list(range(12))))
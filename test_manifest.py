@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Ingest manifest tests: the per-chunk diff of a changed file and the
+journal that records progress between saves.
+"""
+
+import os
+from config import COLLECTION_NAME
+from manifest import IngestManifest, chunk_hash
+
+
+def test_diff_chunks_keeps_rows_only_at_the_same_position(tmp_path):
+    manifest = IngestManifest(COLLECTION_NAME, str(tmp_path / "manifest.json"))
+    a, b, c = chunk_hash("a"), chunk_hash("b"), chunk_hash("c")
+    manifest.files["doc"] = {"size": 0, "mtime": 0, "hash": None, "chunks": [[a, 10, 0], [b, 11, 1], [a, 12, 2]]}
+
+    keep, new, stale = manifest.diff_chunks("doc", [a, c, a, b])
+    assert keep == [[a, 10, 0], [a, 12, 2]]
+    assert new == [1, 3]
+    assert stale == [11]
+
+
+def test_manifest_journal_is_replayed_and_compacted(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestManifest(COLLECTION_NAME, path)
+    manifest.files["gone"] = {"size": 1, "mtime": 1, "hash": "x", "chunks": [["h", 1, 0]]}
+    manifest.save()
+
+    manifest.files["doc"] = {"size": 2, "mtime": 2, "hash": None, "chunks": [["h", 2, 0]]}
+    manifest.record("doc")
+    manifest.record("doc", [["i", 3, 1]])
+    del manifest.files["gone"]
+    manifest.record("gone")
+    with open(manifest.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"name": "doc", "chu')  # Torn by a crash
+
+    loaded = IngestManifest.load(COLLECTION_NAME, path)
+    assert loaded.files == {"doc": {"size": 2, "mtime": 2, "hash": None, "chunks": [["h", 2, 0], ["i", 3, 1]]}}
+    loaded.save()
+    assert not os.path.exists(loaded.journal_path)
+    assert IngestManifest.load(COLLECTION_NAME, path).files == loaded.files
@@ -25,22 +25,23 @@ def test_retrieval():
         "Summarize the content"
     ]
     
-    for query in test_queries:
+    # Run all queries as one batch search
+    try:
+        all_results = retriever.search_many(test_queries, top_k=3)
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+        return
+    
+    for query, results in zip(test_queries, all_results):
         print(f"\n🔍 Query: '{query}'")
         print("-" * 40)
         
-        try:
-            results = retriever.search(query, top_k=3)
-            
-            if results:
-                for i, result in enumerate(results, 1):
-                    print(f"\n📄 Result {i} (Score: {result['score']:.4f}):")
-                    print(f"   {result['text'][:200]}...")
-            else:
-                print("   No results found")
-                
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
+        if results:
+            for i, result in enumerate(results, 1):
+                print(f"\n📄 Result {i} (Score: {result['score']:.4f}):")
+                print(f"   {result['text'][:200]}...")
+        else:
+            print("   No results found")
         
         print()
 
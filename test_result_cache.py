@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Result cache tests: exact and semantic hits, and invalidation when
+ingestion changes the collection.
+"""
+
+import numpy as np
+from result_cache import QueryResultCache, mark_collection_changed
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_result_cache_is_cleared_when_the_collection_changes(tmp_path):
+    version = str(tmp_path / "collection_version")
+    mark_collection_changed(version)
+    cache = QueryResultCache(size=4, ttl=60, threshold=0.95, dim=3, version_path=version)
+    results = [{"id": 1, "score": 0.9}]
+    cache.put("What is BM25?", 5, unit(1, 0, 0), results)
+
+    assert cache.get("  what is   bm25? ", 5) == results
+    assert cache.get_semantic(unit(1, 0.1, 0), 3) == results[:3]
+    assert cache.get_semantic(unit(1, 0.1, 0), 10) is None  # Cached with fewer results than asked for
+    assert cache.get_semantic(unit(1, 0.1, 0), 3, mode="hybrid") is None
+    assert cache.get_semantic(unit(0, 1, 0), 3) is None
+
+    mark_collection_changed(version)
+    assert cache.get("What is BM25?", 5) is None
+    assert cache.get_semantic(unit(1, 0.1, 0), 3) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_result_cache_counts_one_miss_per_lookup(tmp_path):
+    cache = QueryResultCache(size=4, ttl=60, threshold=0.95, dim=3, version_path=str(tmp_path / "collection_version"))
+    cache.put("query", 5, unit(1, 0, 0), [{"id": 1}])
+
+    assert cache.get("other", 5) is None  # Exact tier only, e.g. a lexical search
+    assert cache.get("other", 5, semantic_next=True) is None
+    assert cache.get_semantic(unit(0, 1, 0), 5) is None
+    assert cache.get("similar", 5, semantic_next=True) is None
+    assert cache.get_semantic(unit(1, 0.1, 0), 5) is not None
+    assert cache.get("query", 5) is not None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+    assert stats["exact_hit_rate"] == 0.25
+
+
+def test_result_cache_entries_expire(tmp_path):
+    cache = QueryResultCache(size=4, ttl=0, dim=3, version_path=str(tmp_path / "collection_version"))
+    cache.put("query", 5, unit(1, 0, 0), [{"id": 1}])
+    assert cache.get("query", 5) is None
+    assert cache.get_semantic(unit(1, 0, 0), 5) is None
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Recall vs latency tuning for the Milvus index
+Samples stored vectors as queries, computes their exact top-k with NumPy and
+sweeps nprobe (IVF) or ef (HNSW). The cheapest setting reaching the target
+recall is saved to SEARCH_PARAMS_PATH, where MilvusStore.search picks it up.
+Usage:
+    python3 tune_index.py [--queries 200] [--top-k 10] [--target 0.95]
+"""
+
+import time
+import json
+import argparse
+import numpy as np
+from config import COLLECTION_NAME, TUNE_TARGET_RECALL, SEARCH_PARAMS_PATH
+from vector_store import get_vector_store
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def exact_top_k(store, queries, top_k):
+    """Brute-force cosine top-k ids for each query, scanning the collection in blocks"""
+    best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+    for ids, vectors in store.iter_embeddings():
+        scores = queries @ normalize(vectors).T
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_ids = np.concatenate([best_ids, np.broadcast_to(np.asarray(ids, dtype=np.int64), scores.shape)], axis=1)
+        keep = np.argpartition(-all_scores, top_k - 1, axis=1)[:, :top_k]
+        best_scores = np.take_along_axis(all_scores, keep, axis=1)
+        best_ids = np.take_along_axis(all_ids, keep, axis=1)
+    return [set(row[row >= 0].tolist()) for row in best_ids]
+
+
+def sample_queries(store, num_queries, seed=0):
+    """Random stored vectors, used as queries (reservoir sampling over the iterator)"""
+    rng = np.random.default_rng(seed)
+    sample, seen = [], 0
+    for _, vectors in store.iter_embeddings():
+        for vector in vectors:
+            seen += 1
+            if len(sample) < num_queries:
+                sample.append(vector)
+            else:
+                j = rng.integers(seen)
+                if j < num_queries:
+                    sample[j] = vector
+    return normalize(sample)
+
+
+def candidate_params(index, top_k):
+    params = index.get("params", {})
+    if isinstance(params, str):
+        params = json.loads(params)
+    if index["index_type"] == "HNSW":
+        # Milvus requires ef >= top_k
+        return "ef", [ef for ef in (16, 32, 64, 128, 256, 512) if ef >= top_k] or [top_k]
+    nlist = int(params.get("nlist", 64))
+    return "nprobe", sorted({n for n in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024) if n <= nlist} | {nlist})
+
+
+def measure(store, queries, truth, top_k, param):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = store.search([query.tolist()], top_k, param=param)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {r["id"] for r in results})
+    recall = hits / max(1, sum(len(t) for t in truth))
+    return recall, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def tune(num_queries, top_k, target):
+    store = get_vector_store()
+    if store.name != "milvus":
+        print(f"ℹ️ The '{store.name}' store searches exhaustively, there is nothing to tune")
+        return
+    from milvus_store import save_search_params
+
+    store.open()
+    index = store.index_params()
+    print(f"🔧 Tuning {index['index_type']} {index.get('params')} on {store.count()} rows")
+
+    queries = sample_queries(store, num_queries)
+    truth = exact_top_k(store, queries, top_k)
+    # HNSW needs ef >= the hits requested, which two-stage search multiplies
+    name, values = candidate_params(index, store.search_limit(top_k))
+
+    report, chosen = [], None
+    for value in values:
+        param = {"metric_type": "COSINE", "params": {name: value}}
+        recall, p50, p99 = measure(store, queries, truth, top_k, param)
+        report.append({name: value, "recall": recall, "p50_ms": p50, "p99_ms": p99})
+        print(f"  {name}={value:<5} recall@{top_k}={recall:.3f}  p50={p50:.2f}ms  p99={p99:.2f}ms")
+        if recall >= target:
+            chosen = value
+            break
+
+    if chosen is None:
+        chosen = values[-1]
+        print(f"⚠️ Target recall {target} not reached, using {name}={chosen}")
+    save_search_params(COLLECTION_NAME, index["index_type"], {name: chosen}, report)
+    print(f"✅ Saved {name}={chosen} to {SEARCH_PARAMS_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune Milvus search params for a target recall")
+    parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--target", type=float, default=TUNE_TARGET_RECALL, help="Target recall@k")
+    args = parser.parse_args()
+    tune(args.queries, args.top_k, args.target)
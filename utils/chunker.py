@@ -1,5 +1,7 @@
 import re
 
+_WHITESPACE = re.compile(r"\s+")
+
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50):
     """
     Splits text into overlapping chunks.
@@ -11,7 +13,7 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50):
     if overlap >= chunk_size:
         raise ValueError("overlap must be less than chunk_size")
     
-    text = re.sub(r"\s+", " ", text).strip()
+    text = _WHITESPACE.sub(" ", text).strip()
     if not text:
         return []
     
@@ -25,6 +27,10 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50):
         end = min(len(text), start + chunk_size)
         chunks.append(text[start:end])
         
+        # The chunk reaching the end of the text is the last one
+        if end == len(text):
+            break
+        
         # Calculate next start position
         next_start = end - overlap
         
@@ -36,6 +42,72 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50):
     
     return chunks
 
+def iter_chunks(stream, chunk_size: int = 500, overlap: int = 50, read_size: int = 1 << 16):
+    """
+    Streaming version of chunk_text for file-like objects.
+    Reads `read_size` characters at a time, normalizes whitespace on the fly
+    and yields the same chunks as chunk_text(stream.read()), while holding
+    at most about chunk_size + read_size characters in memory.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be less than chunk_size")
+    
+    step = chunk_size - overlap
+    buf = ""               # Normalized text not yet dropped, starting at the next chunk
+    seen_text = False      # Whether any non-whitespace has been read yet
+    pending_space = False  # Whitespace seen after the end of buf
+    emitted_to = 0         # End of the last yielded chunk, relative to buf
+    
+    while True:
+        block = stream.read(read_size)
+        if not block:
+            break
+        
+        block = _WHITESPACE.sub(" ", block)
+        if block.startswith(" "):
+            pending_space = True
+            block = block[1:]
+        if not block:
+            continue
+        if pending_space and seen_text:
+            buf += " "
+        seen_text = True
+        pending_space = block.endswith(" ")
+        buf += block.rstrip(" ") if pending_space else block
+        
+        # Yield every full chunk; keeping a chunk that ends exactly at the end
+        # of buf is fine because the next window starts before that point
+        start = 0
+        while start + chunk_size <= len(buf):
+            yield buf[start:start + chunk_size]
+            emitted_to = start + chunk_size
+            start += step
+        if start:
+            buf = buf[start:]
+            emitted_to -= start
+    
+    # Leading and trailing whitespace are dropped like chunk_text's strip()
+    if buf and emitted_to < len(buf):
+        yield buf
+
+def chunk_file(path: str, chunk_size: int = 500, overlap: int = 50, encoding: str = "utf-8"):
+    """Yield overlapping chunks of a file without reading it into memory at once"""
+    with open(path, "r", encoding=encoding) as f:
+        yield from iter_chunks(f, chunk_size, overlap)
+
+def batched(iterable, size: int):
+    """Group an iterable into lists of at most `size` items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 if __name__ == "__main__":
     sample = "This is a long text that should be split into smaller overlapping chunks for embeddings."
     print(chunk_text(sample, chunk_size=20, overlap=5))
@@ -0,0 +1,122 @@
+import re
+import zlib
+import hashlib
+import numpy as np
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _lsh_bands(num_perm: int, threshold: float):
+    """Pick (bands, rows) so the LSH candidate threshold (1/b)^(1/r) is close to `threshold`"""
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class ChunkDeduplicator:
+    """
+    Detects duplicate chunks before they are embedded.
+    Exact duplicates are caught by a hash of the normalized text, near
+    duplicates by MinHash signatures over character shingles with LSH
+    banding; a candidate counts as a duplicate when its estimated Jaccard
+    similarity is at least `threshold`.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_bands(num_perm, threshold)
+
+        # Coefficients below 2^32 keep a*x + b inside uint64 for 32-bit shingle hashes
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+        self.exact_hashes = set()
+        self.buckets = [dict() for _ in range(self.bands)]
+        self.signatures = []
+
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.bytes_saved = 0
+
+    def _normalize(self, text: str):
+        return re.sub(r"\s+", " ", text.lower()).strip()
+
+    def signature(self, text: str):
+        """MinHash signature of the text's character shingles"""
+        k = self.shingle_size
+        shingles = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        # Universal hashing (a*x + b) mod p, one row per permutation
+        permuted = np.outer(self._a, hashes) + self._b[:, None]
+        permuted = (permuted % np.uint64(_MERSENNE_PRIME)) & np.uint64(_MAX_HASH)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def check(self, text: str):
+        """
+        Classify a chunk as "exact", "near" or None (new).
+        New chunks are remembered so later copies of them are caught.
+        """
+        self.seen += 1
+        normalized = self._normalize(text)
+        digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+        if digest in self.exact_hashes:
+            self.exact_duplicates += 1
+            self.bytes_saved += len(text)
+            return "exact"
+
+        signature = self.signature(normalized)
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        candidates = set()
+        for bucket, key in zip(self.buckets, band_keys):
+            candidates.update(bucket.get(key, ()))
+        for candidate in candidates:
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                self.near_duplicates += 1
+                self.bytes_saved += len(text)
+                return "near"
+
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        self.exact_hashes.add(digest)
+        for bucket, key in zip(self.buckets, band_keys):
+            bucket.setdefault(key, []).append(index)
+        return None
+
+    def filter(self, texts):
+        """Return only the texts that are not duplicates of anything seen so far"""
+        return [text for text in texts if self.check(text) is None]
+
+    def stats(self):
+        skipped = self.exact_duplicates + self.near_duplicates
+        return {
+            "seen": self.seen,
+            "kept": self.seen - skipped,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "embedding_calls_saved": skipped,
+            "rows_saved": skipped,
+            "text_bytes_saved": self.bytes_saved,
+        }
+
+if __name__ == "__main__":
+    dedup = ChunkDeduplicator(threshold=0.8)
+    docs = [
+        "Milvus is an open-source vector database designed for AI applications.",
+        "Milvus is an open-source vector database designed for AI applications!",
+        "Milvus is an open source vector database designed for AI applications.",
+        "Researchers use it for similarity search, recommendation systems, and RAG pipelines.",
+    ]
+    print([dedup.check(doc) for doc in docs])
+    print(dedup.stats())
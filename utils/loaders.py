@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.chunker import chunk_file, iter_chunks
+
+TEXT_EXTENSIONS = (".txt", ".md")
+DOCUMENT_EXTENSIONS = (".pdf", ".docx")
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + DOCUMENT_EXTENSIONS
+
+
+def document_format(path: str):
+    """Lower-case extension without the dot, e.g. "pdf" """
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+
+def iter_pdf_pages(path: str):
+    """Text of each PDF page, extracted one page at a time"""
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        raise ImportError("Reading PDF files needs PyPDF2: pip install pypdf2")
+    for page in PdfReader(path).pages:
+        yield page.extract_text() or ""
+
+
+def iter_docx_paragraphs(path: str):
+    """Text of each DOCX paragraph, then of each table row"""
+    try:
+        from docx import Document
+    except ImportError:
+        raise ImportError("Reading DOCX files needs python-docx: pip install python-docx")
+    document = Document(path)
+    for paragraph in document.paragraphs:
+        yield paragraph.text
+    for table in document.tables:
+        for row in table.rows:
+            yield " ".join(cell.text for cell in row.cells)
+
+
+def iter_segments(path: str):
+    """Text segments (pages or paragraphs) of a PDF or DOCX file"""
+    fmt = document_format(path)
+    if fmt == "pdf":
+        return iter_pdf_pages(path)
+    if fmt == "docx":
+        return iter_docx_paragraphs(path)
+    raise ValueError(f"Unsupported document format: {path}")
+
+
+class SegmentStream:
+    """
+    File-like read() over a stream of text segments, so iter_chunks can
+    chunk pages or paragraphs as they are extracted. Segments are joined
+    with a newline, which the chunker normalizes to a single space.
+    """
+
+    def __init__(self, segments, separator: str = "\n"):
+        self.segments = iter(segments)
+        self.separator = separator
+        self.buffer = ""
+
+    def read(self, size: int):
+        while not self.buffer:
+            segment = next(self.segments, None)
+            if segment is None:
+                return ""
+            if segment:
+                self.buffer = segment + self.separator
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def chunk_document(path: str, chunk_size: int = 500, overlap: int = 50):
+    """Yield overlapping chunks of a text, Markdown, PDF or DOCX file as it is read"""
+    if path.lower().endswith(TEXT_EXTENSIONS):
+        yield from chunk_file(path, chunk_size, overlap)
+    else:
+        yield from iter_chunks(SegmentStream(iter_segments(path)), chunk_size, overlap)
+
+
+def load_chunks(path: str, chunk_size: int, overlap: int, max_chars: int = None):
+    """
+    Extract and chunk a whole document, returns (chunks, seconds).
+    Runs in a worker process of iter_documents.
+    """
+    started = time.perf_counter()
+    chunks = [chunk[:max_chars] if max_chars else chunk
+              for chunk in chunk_document(path, chunk_size, overlap)]
+    return chunks, time.perf_counter() - started
+
+
+class LoaderStats:
+    """Per-format files, input bytes, chunks and extraction seconds"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.formats = {}
+
+    def record(self, path: str, chunks: int, seconds: float):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self.lock:
+            entry = self.formats.setdefault(document_format(path),
+                                            {"files": 0, "bytes": 0, "chunks": 0, "seconds": 0.0})
+            entry["files"] += 1
+            entry["bytes"] += size
+            entry["chunks"] += chunks
+            entry["seconds"] += seconds
+
+    def summary(self):
+        """Totals per format with MB/s and files/s of extraction time"""
+        with self.lock:
+            return {
+                fmt: {**entry,
+                      "mb_per_sec": entry["bytes"] / 1e6 / entry["seconds"] if entry["seconds"] else 0.0,
+                      "files_per_sec": entry["files"] / entry["seconds"] if entry["seconds"] else 0.0}
+                for fmt, entry in sorted(self.formats.items())
+            }
+
+
+def _timed_chunks(path, chunks, stats, max_chars):
+    """Stream a text file's chunks, recording the time spent producing them"""
+    count, seconds = 0, 0.0
+    iterator = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        chunk = next(iterator, None)
+        seconds += time.perf_counter() - started
+        if chunk is None:
+            break
+        count += 1
+        yield chunk[:max_chars] if max_chars else chunk
+    if stats is not None:
+        stats.record(path, count, seconds)
+
+
+def _pooled_chunks(path, future, stats):
+    """Chunks of a document parsed in the pool; errors surface when iterated"""
+    chunks, seconds = future.result()
+    if stats is not None:
+        stats.record(path, len(chunks), seconds)
+    yield from chunks
+
+
+def iter_documents(paths, chunk_size: int = 500, overlap: int = 50, max_chars: int = None,
+                   workers: int = 4, max_in_flight: int = 8, stats: LoaderStats = None):
+    """
+    Yield (path, chunks) for each path in order.
+    PDF and DOCX parsing is CPU-bound, so those files are extracted and
+    chunked in a process pool, while text files are streamed in this
+    process when their turn comes. Besides the document being consumed,
+    at most `max_in_flight` are parsed or waiting, which bounds memory.
+    A document that failed to load raises when its chunks are iterated.
+    """
+    pool = None
+    window = deque()
+    paths = iter(paths)
+    try:
+        while True:
+            while len(window) < max_in_flight:
+                path = next(paths, None)
+                if path is None:
+                    break
+                if path.lower().endswith(DOCUMENT_EXTENSIONS) and workers > 0:
+                    if pool is None:
+                        # Spawned workers do not inherit the ingest threads' locks
+                        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+                    window.append((path, pool.submit(load_chunks, path, chunk_size, overlap, max_chars)))
+                else:
+                    window.append((path, None))
+            if not window:
+                return
+            path, future = window.popleft()
+            if future is None:
+                yield path, _timed_chunks(path, chunk_document(path, chunk_size, overlap), stats, max_chars)
+            else:
+                yield path, _pooled_chunks(path, future, stats)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
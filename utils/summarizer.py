@@ -1,6 +1,10 @@
 import re
 import heapq
-from collections import defaultdict
+from collections import Counter, defaultdict
+import numpy as np
+
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?]) +')
+_WORD = re.compile(r'\w+')
 
 def summarize(texts, max_sentences=3):
     """
@@ -27,6 +31,51 @@ def summarize(texts, max_sentences=3):
     best = heapq.nlargest(max_sentences, sent_scores, key=sent_scores.get)
     return " ".join(best)
 
+def sentence_stats(text):
+    """
+    Sentence boundaries and term counts of one chunk, computed at ingest time.
+    Returns a list of (start, end, Counter) per sentence, split like summarize().
+    """
+    stats = []
+    start = 0
+    for match in _SENTENCE_BREAK.finditer(text):
+        stats.append((start, match.start(), Counter(_WORD.findall(text[start:match.start()].lower()))))
+        start = match.end()
+    stats.append((start, len(text), Counter(_WORD.findall(text[start:].lower()))))
+    return stats
+
+def summarize_chunks(index, ids, max_sentences=3):
+    """
+    Summarize retrieved chunks from the term statistics stored at ingest time.
+    Same word frequency scoring as summarize(), but word frequencies and
+    sentence scores are NumPy reductions over the precomputed per-sentence
+    counts, so nothing is re-tokenized at query time.
+    """
+    sentence_doc, bounds, entry_sentence, terms, counts = index.sentences_for(ids)
+    if len(bounds) == 0:
+        return ""
+
+    # Word frequency over all retrieved chunks, then each sentence's score
+    _, inverse = np.unique(terms, return_inverse=True)
+    word_freq = np.bincount(inverse, weights=counts)
+    scores = np.bincount(entry_sentence, weights=counts * word_freq[inverse], minlength=len(bounds))
+
+    # Pick top N, skipping repeats from overlapping chunks
+    best, seen, texts = [], set(), {}
+    for i in np.argsort(-scores, kind="stable"):
+        start, end = bounds[i]
+        doc = int(sentence_doc[i])
+        if doc not in texts:
+            texts[doc] = index.text(doc)
+        sentence = texts[doc][start:end]
+        if sentence in seen:
+            continue
+        seen.add(sentence)
+        best.append(sentence)
+        if len(best) == max_sentences:
+            break
+    return " ".join(best)
+
 if __name__ == "__main__":
     docs = [
         "Milvus is an open-source vector database designed for AI applications.",
@@ -0,0 +1,189 @@
+import re
+import numpy as np
+from config import VECTOR_STORE, DEFAULT_SOURCE_GROUP, CHUNK_SIZE
+
+# Per-chunk metadata columns stored next to the embedding and text
+METADATA_FIELDS = ("source", "chunk_index", "char_start", "char_end", "ingested_at")
+FILTER_KEYS = ("source", "ingested_after", "ingested_before")
+VECTOR_DTYPES = ("float32", "float16", "int8")
+INT8_SCALE = 127.0  # int8 vectors are unit vectors times this
+
+
+def quantize(vectors, dtype):
+    """Unit-normalize the rows of a 2-D array and convert them to a VECTOR_DTYPES type"""
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unsupported vector dtype {dtype!r}, expected one of {VECTOR_DTYPES}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+    if dtype == "int8":
+        return np.round(vectors * INT8_SCALE).astype(np.int8)
+    return vectors.astype(dtype, copy=False)
+
+
+def truncate(vectors, dim):
+    """Matryoshka truncation: the first `dim` dimensions of each row, renormalized"""
+    return quantize(np.asarray(vectors, dtype=np.float32)[:, :dim], "float32")
+
+
+def memory_per_million(dim, dtype="float32", text_out_of_line=False, coarse_dim=0,
+                       text_bytes=CHUNK_SIZE, source_bytes=48):
+    """
+    Approximate bytes held per million chunks: vectors, the id and metadata
+    columns, and the chunk text. Out-of-line text only costs its 16 byte
+    (offset, length) reference; the text itself is paged in on demand. With
+    two-stage search only the coarse vectors are indexed, and full vectors
+    are paged in for reranked candidates.
+    """
+    row = (coarse_dim or dim) * np.dtype(dtype).itemsize + 8 + 4 * 8 + source_bytes
+    row += 8 if coarse_dim else 0
+    row += 16 if text_out_of_line else text_bytes
+    return row * 1_000_000
+
+
+def source_group(source):
+    """Group (and partition) of a source path: its top-level directory under data/"""
+    head, sep, _ = source.replace("\\", "/").partition("/")
+    return head if sep else DEFAULT_SOURCE_GROUP
+
+
+def partition_name(group):
+    """Milvus-safe partition name for a source group"""
+    if group == DEFAULT_SOURCE_GROUP:
+        return "_default"
+    return "g_" + re.sub(r"[^0-9A-Za-z_]", "_", group)
+
+
+def empty_metadata(count):
+    """Metadata for rows inserted without any"""
+    return {"source": [""] * count, "chunk_index": [-1] * count, "char_start": [-1] * count,
+            "char_end": [-1] * count, "ingested_at": [0] * count}
+
+
+def merge_metadata(parts):
+    """Concatenate metadata column dicts in order"""
+    return {field: [value for part in parts for value in part[field]] for field in METADATA_FIELDS}
+
+
+def take_metadata(metadata, rows):
+    """Metadata columns of the given row positions"""
+    return {field: [metadata[field][i] for i in rows] for field in METADATA_FIELDS}
+
+
+def check_filters(filters):
+    """
+    Validate a search filter dict. Supported keys: "source" (a path or list
+    of paths), "ingested_after" and "ingested_before" (Unix seconds).
+    Returns the filters with "source" normalized to a list.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be a dict")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unsupported filter keys: {sorted(unknown)}, expected {FILTER_KEYS}")
+    filters = dict(filters)
+    if isinstance(filters.get("source"), str):
+        filters["source"] = [filters["source"]]
+    return filters
+
+
+class VectorStore:
+    """
+    Interface shared by the vector store backends.
+    Vectors are compared with cosine similarity; search results are lists of
+    {"text", "score", "id", "source", "chunk_index", "char_start", "char_end"}
+    dicts, one list per query vector. Rows are placed in partitions by
+    source_group(), and searches can be limited to some partitions and
+    filtered on metadata (see check_filters). search(..., with_text=False)
+    leaves "text" as None until attach_text() fills it, so callers that
+    over-fetch candidates only read the text of the hits they return.
+    Stores with a coarse_dim search the first coarse_dim dimensions and
+    rerank the candidates exactly in full dimension. Stores with
+    flush_to_commit only keep inserted rows across a restart once
+    flush() has run.
+    """
+
+    name = "base"
+    vector_dtype = "float32"
+    text_out_of_line = False
+    coarse_dim = 0
+    flush_to_commit = False
+
+    def exists(self):
+        """True if the store already holds a collection"""
+        raise NotImplementedError
+
+    def create(self):
+        """Drop any existing data and create an empty, searchable store"""
+        raise NotImplementedError
+
+    def open(self):
+        """Open an existing store for reading and writing"""
+        raise NotImplementedError
+
+    def insert(self, embeddings, texts, metadata=None):
+        """Insert rows with optional METADATA_FIELDS columns, returns their primary keys"""
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Load whatever the first search would otherwise have to load"""
+
+    def optimize_index(self):
+        """Resize the search index for the current row count, True if rebuilt"""
+        return False
+
+    def search(self, vectors, top_k, partitions=None, filters=None, with_text=True):
+        """Top-k rows per vector, only from `partitions` (source groups) matching `filters`"""
+        raise NotImplementedError
+
+    def attach_text(self, hits):
+        """Fill in the text of hits returned without it, returns `hits`"""
+        missing = [hit for hit in hits if hit.get("text") is None]
+        if missing:
+            for hit, text in zip(missing, self.fetch_text(missing)):
+                hit["text"] = text
+        return hits
+
+    def fetch_text(self, hits):
+        """Chunk text for each hit"""
+        raise NotImplementedError
+
+    def fetch_vectors(self, hits):
+        """Full-dimension float32 unit vectors of the hits' rows, shape (len(hits), dim)"""
+        raise NotImplementedError
+
+    def iter_embeddings(self, batch_size=1000):
+        """Yield (ids, full-dimension vectors) for every row, used for exact ground truth"""
+        raise NotImplementedError
+
+    def memory_per_million(self):
+        """Estimated bytes per million chunks in this store's layout"""
+        return memory_per_million(self.dim, self.vector_dtype, self.text_out_of_line, self.coarse_dim)
+
+    def select(self, ids, partitions=None, filters=None):
+        """The subset of `ids` inside `partitions` and matching `filters`"""
+        raise NotImplementedError
+
+
+def get_vector_store(backend=None):
+    """Build the vector store backend, VECTOR_STORE from config.py by default"""
+    backend = backend or VECTOR_STORE
+    if backend == "milvus":
+        from milvus_store import MilvusStore
+        return MilvusStore()
+    if backend == "local":
+        from local_store import LocalStore
+        return LocalStore()
+    raise ValueError(f"Unknown vector store backend: {backend!r}")